@@ -0,0 +1,60 @@
+"""
+Reports the memory retained per parsed record for a synthetic get_data
+response. Requires Python 3 (tracemalloc).
+
+    python benchmarks/memory_per_record.py [record_count]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from venue.vif_message import VIFMessage  # noqa: E402
+
+
+def get_data_content(record_count):
+    lines = ['{vrp}{1}BARKER{2}6000!']
+    for i in range(record_count):
+        kind = i % 3
+        if kind == 0:
+            lines.append('{ssn}{1}%d{3}0{4}Cinema 0%d{5}MOVIE%d{6}STD{8}20170110100000{15}1{18}12{32}120'
+                         % (100000 + i, i % 8, i % 40))
+        elif kind == 1:
+            lines.append('{mov}{2}M{3}Movie %d{4}MOV%d{5}MOVIE%d{7}107{8}20170101{9}20170301{26}1' % (i, i, i))
+        else:
+            lines.append('{prl}{1}STD{2}ADULT{4}%d.50{5}1{6}0' % (10 + i % 5))
+    return '\n'.join(lines) + chr(3)
+
+
+def retained_bytes_per_record(content, record_count, lazy, accessed):
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    message = VIFMessage(content=content, lazy=lazy)
+    if accessed:
+        for record in message.body:
+            record.data()
+    gc.collect()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(message.body) == record_count
+    return (after - before) / float(record_count)
+
+
+def main():
+    record_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    content = get_data_content(record_count)
+    modes = [
+        ('eager', False, True),
+        ('lazy, untouched', True, False),
+        ('lazy, accessed', True, True),
+    ]
+    for label, lazy, accessed in modes:
+        print('{0} records, {1:<16}: {2:8.0f} bytes/record'.format(
+            record_count, label, retained_bytes_per_record(content, record_count, lazy, accessed)))
+
+
+if __name__ == '__main__':
+    main()
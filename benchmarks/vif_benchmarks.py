@@ -0,0 +1,167 @@
+"""
+Micro-benchmarks for VIF parsing and serialization. Reports ops/sec and the
+peak memory allocated by one operation for:
+
+* parse: VIFMessage(content=...) for synthetic get_data payloads, eagerly
+  and lazily;
+* friendly_data, data: conversion of a parsed message;
+* content: serialization of a parsed message back to text;
+* q30, q31: building and serializing booking requests with N tickets
+  (q31 has no ticket array, it carries up to MAX_PAYMENTS payment lines).
+
+Payloads come from venue.vif_corpus with a fixed seed, so runs compare
+like for like.
+
+Results can be saved as a baseline and later runs compared against it,
+exiting with status 1 when a case gets slower (or allocates more) by more
+than the threshold. Requires Python 3.4+ (tracemalloc).
+
+    python benchmarks/vif_benchmarks.py [--sizes 1KB,100KB,1MB,20MB] [--tickets 1,10,100,500]
+        [--filter parse] [--min-time 0.5] [--save baseline.json] [--compare baseline.json]
+        [--threshold 0.25]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from venue.vif_corpus import MAX_PAYMENTS, CorpusGenerator, parse_size  # noqa: E402
+from venue.vif_message import VIFMessage  # noqa: E402
+from venue.vif_record import VIFRecord  # noqa: E402
+
+DEFAULT_SIZES = '1KB,100KB,1MB,20MB'
+DEFAULT_TICKETS = '1,10,100,500'
+DEFAULT_THRESHOLD = 0.25
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2}
+SEED = 0
+
+
+def q30_data(generator, ticket_count):
+    return {
+        'workstation_id': 123,
+        'user_code': 'TKTBTY',
+        'session_number': 999,
+        'transaction_type': 1,
+        'customer_reference': 'CUSTNO123',
+        'tickets': generator.ticket_data(ticket_count)
+    }
+
+
+def q31_data(generator, payment_count):
+    return {
+        'workstation_id': 123,
+        'booking_key': 'ABC123',
+        'customer_phone_number': '0400000000',
+        'origin_label': 'WWW',
+        'payments': generator.payment_data(payment_count)
+    }
+
+
+def benchmark_cases(sizes, ticket_counts):
+    """Yields (name, operation) pairs, building each case's input as it's reached."""
+    for size in sizes:
+        label = '{}KB'.format(size // 1024) if size < UNITS['MB'] else '{}MB'.format(size // UNITS['MB'])
+        content = CorpusGenerator(SEED).get_data(size=size)
+        yield 'parse/{}'.format(label), lambda: VIFMessage(content=content)
+        yield 'parse_lazy/{}'.format(label), lambda: VIFMessage(content=content, lazy=True)
+        message = VIFMessage(content=content)
+        yield 'friendly_data/{}'.format(label), message.friendly_data
+        yield 'data/{}'.format(label), message.data
+        yield 'content/{}'.format(label), message.content
+    generator = CorpusGenerator(SEED)
+    for count in ticket_counts:
+        tickets = q30_data(generator, count)
+        yield 'q30/{}'.format(count), lambda: VIFRecord(record_code='q30', data=dict(tickets)).content()
+    for count in sorted(set(min(count, MAX_PAYMENTS) for count in ticket_counts)):
+        payments = q31_data(generator, count)
+        yield 'q31/{}'.format(count), lambda: VIFRecord(record_code='q31', data=dict(payments)).content()
+
+
+def measure(operation, min_time):
+    """Returns (ops/sec, peak bytes allocated by one call) for an operation."""
+    operation()  # warm up
+    runs = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time or runs < 3:
+        operation()
+        runs += 1
+        elapsed = time.perf_counter() - started
+
+    gc.collect()
+    # Tracing starts with a fresh peak; reset_peak() only exists on Python 3.9+
+    tracemalloc.start()
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    start, _ = tracemalloc.get_traced_memory()
+    operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return runs / elapsed, peak - start
+
+
+def compare(results, baseline, threshold):
+    """Returns a description of each case that regressed against the baseline."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        if result['ops_per_sec'] < previous['ops_per_sec'] * (1 - threshold):
+            regressions.append('{}: {:.1f} ops/sec, baseline {:.1f}'.format(
+                name, result['ops_per_sec'], previous['ops_per_sec']))
+        if result['peak_bytes'] > previous['peak_bytes'] * (1 + threshold):
+            regressions.append('{}: {} peak bytes, baseline {}'.format(
+                name, result['peak_bytes'], previous['peak_bytes']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='VIF parsing and serialization benchmarks')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='get_data payload sizes (default: %(default)s)')
+    parser.add_argument('--tickets', default=DEFAULT_TICKETS, help='q30/q31 ticket counts (default: %(default)s)')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--min-time', type=float, default=0.5, help='seconds to run each case for')
+    parser.add_argument('--save', metavar='PATH', help='save the results as a baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare the results against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='fraction a case may regress by before failing (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size]
+    ticket_counts = [int(count) for count in args.tickets.split(',') if count]
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print('{:<24} {:>14} {:>14}'.format('case', 'ops/sec', 'peak KB/op'))
+    for name, operation in benchmark_cases(sizes, ticket_counts):
+        if args.filter not in name:
+            continue
+        ops_per_sec, peak_bytes = measure(operation, args.min_time)
+        results[name] = {'ops_per_sec': ops_per_sec, 'peak_bytes': peak_bytes}
+        print('{:<24} {:>14.1f} {:>14.1f}'.format(name, ops_per_sec, peak_bytes / 1024.0))
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
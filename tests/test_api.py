@@ -0,0 +1,226 @@
+import json
+
+import pytest
+
+from venue import app
+from venue.vif_cache import CachedVIFGateway, MessageViewCache, TTLCache
+from venue.vif_gateway import VIFGateway, VIFResponseError
+from venue.vif_message import VIFMessage
+
+VENUE_HEADERS = {
+    'X-VIF-SITENAME': 'BARKER',
+    'X-VIF-AUTHINFO': '108193016648',
+    'X-VIF-HOST': '127.0.0.1'
+}
+
+GET_DATA_RESPONSE = ('{vrp}{1}BARKER{2}6000!;'
+                     '\n{hdr}{1}E:\\Ven\\bin\\VIFGateway.exe{2}20170311215335{4}2'
+                     '\n{ins}{2}Mt Barker Cinemas{3}Wallis{4}BARKER'
+                     '\n{dis}{1}1{2}Filmways{3}0{17}11'
+                     '\n{dis}{1}2{2}Fourth Wall{3}4WALL{17}11'
+                     '\n{mov}{3}Moana{5}MOANA{7}107'
+                     '\n{ssn}{1}132417{4}Cinema 02{5}MOANA{8}20170110100000'
+                     '\n{ssn}{1}132418{4}Cinema 02{5}MOANA{8}20170110130000')
+
+
+@pytest.fixture
+def client():
+    app.config['TESTING'] = True
+    CachedVIFGateway.get_data_cache.clear()
+    return app.test_client()
+
+
+def test_get_data_streams_friendly_data(client, monkeypatch):
+    monkeypatch.setattr(VIFGateway, 'get_data',
+                        lambda self, detail_required=2: VIFMessage(content=GET_DATA_RESPONSE, lazy=True))
+    response = client.get('/api/get_data', headers=VENUE_HEADERS)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data(as_text=True)) == {
+        'data': VIFMessage(content=GET_DATA_RESPONSE).friendly_data()
+    }
+
+
+def test_batch_get_data_returns_partial_results(client, monkeypatch):
+    def get_data(self, detail_required=2):
+        if self.host == '10.0.0.2':
+            raise IOError('Connection refused')
+        return VIFMessage(content=GET_DATA_RESPONSE, lazy=True)
+
+    monkeypatch.setattr(VIFGateway, 'get_data', get_data)
+    sites = [{'host': '10.0.0.1', 'site_name': 'BARKER', 'auth_info': '1'},
+             {'host': '10.0.0.2', 'site_name': 'NRLNGA', 'auth_info': '2'}]
+    response = client.post('/api/batch/get_data', data=json.dumps({'sites': sites}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    results = json.loads(response.get_data(as_text=True))['data']
+    assert results[0] == {'site_name': 'BARKER', 'host': '10.0.0.1',
+                          'data': VIFMessage(content=GET_DATA_RESPONSE).friendly_data()}
+    assert results[1]['error']['code'] == 502
+
+
+def test_batch_get_data_requires_sites(client):
+    response = client.post('/api/batch/get_data', data=json.dumps({'sites': []}), content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('body', [
+    ['not', 'an', 'object'],
+    {'sites': {'host': '10.0.0.1'}},
+    {'sites': [{'host': '10.0.0.1'}], 'timeout': 'soon'},
+    {'sites': [{'host': '10.0.0.1'}], 'timeout': None},
+    {'sites': [{'host': '10.0.0.1'}], 'timeout': -1},
+])
+def test_batch_get_data_rejects_malformed_body(client, body):
+    response = client.post('/api/batch/get_data', data=json.dumps(body), content_type='application/json')
+    assert response.status_code == 400
+    assert json.loads(response.get_data(as_text=True))['code'] == 400
+
+
+def test_batch_get_data_reports_malformed_site_entries(client, monkeypatch):
+    monkeypatch.setattr(VIFGateway, 'get_data',
+                        lambda self, detail_required=2: VIFMessage(content=GET_DATA_RESPONSE, lazy=True))
+    sites = ['10.0.0.1', {'host': '10.0.0.2', 'site_name': 'NRLNGA', 'auth_info': '2'}]
+    response = client.post('/api/batch/get_data', data=json.dumps({'sites': sites}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    results = json.loads(response.get_data(as_text=True))['data']
+    assert results[0]['error']['code'] == 400
+    assert results[1]['host'] == '10.0.0.2'
+    assert 'data' in results[1]
+
+
+def test_changes_returns_full_snapshot_then_deltas(client, monkeypatch):
+    monkeypatch.setattr(VIFGateway, 'get_data',
+                        lambda self, detail_required=2: VIFMessage(content=GET_DATA_RESPONSE, lazy=True))
+    response = client.get('/api/changes', headers=VENUE_HEADERS)
+    assert response.status_code == 200
+    changes = json.loads(response.get_data(as_text=True))['data']
+    assert changes['full']
+    assert len(changes['inserted']['ssn']) == 2
+
+    response = client.get('/api/changes?since={}'.format(changes['version']), headers=VENUE_HEADERS)
+    delta = json.loads(response.get_data(as_text=True))['data']
+    assert delta == {'version': changes['version'], 'full': False, 'inserted': {}, 'updated': {}, 'deleted': {}}
+
+
+def test_changes_are_kept_per_credentials(client, monkeypatch):
+    def get_data(self, detail_required=2):
+        if self.auth_info == 'wrong':
+            return VIFMessage(content='{vrp}{1}BARKER{2}6000{3}1{4}12{5}Invalid auth!', lazy=True)
+        return VIFMessage(content=GET_DATA_RESPONSE, lazy=True)
+
+    monkeypatch.setattr(VIFGateway, 'get_data', get_data)
+    response = client.get('/api/changes', headers=VENUE_HEADERS)
+    version = json.loads(response.get_data(as_text=True))['data']['version']
+
+    # Exceptions propagate in testing mode, otherwise they're a 500
+    with pytest.raises(VIFResponseError):
+        client.get('/api/changes', headers=dict(VENUE_HEADERS, **{'X-VIF-AUTHINFO': 'wrong'}))
+    response = client.get('/api/changes?since={}'.format(version), headers=VENUE_HEADERS)
+    delta = json.loads(response.get_data(as_text=True))['data']
+    assert delta['version'] == version
+    assert not delta['deleted']
+    # Other credentials get a snapshot of their own
+    response = client.get('/api/changes?since={}'.format(version),
+                          headers=dict(VENUE_HEADERS, **{'X-VIF-AUTHINFO': 'other'}))
+    assert json.loads(response.get_data(as_text=True))['data']['full']
+
+
+def test_changes_rejects_invalid_version(client):
+    response = client.get('/api/changes?since=yesterday', headers=VENUE_HEADERS)
+    assert response.status_code == 400
+
+
+def test_sessions_are_filtered_from_index(client, monkeypatch):
+    calls = []
+
+    def get_data(self, detail_required=2):
+        calls.append(detail_required)
+        return VIFMessage(content=GET_DATA_RESPONSE, lazy=True)
+
+    monkeypatch.setattr(VIFGateway, 'get_data', get_data)
+    response = client.get('/api/sessions?movie_code=MOANA&from=201701101200', headers=VENUE_HEADERS)
+    assert response.status_code == 200
+    sessions = json.loads(response.get_data(as_text=True))['data']
+    assert [session['session_number'] for session in sessions] == [132418]
+    response = client.get('/api/sessions?to=20170110', headers=VENUE_HEADERS)
+    assert len(json.loads(response.get_data(as_text=True))['data']) == 2
+    assert calls == [2]
+
+
+def test_showtimes(client, monkeypatch):
+    monkeypatch.setattr(VIFGateway, 'get_data',
+                        lambda self, detail_required=2: VIFMessage(content=GET_DATA_RESPONSE, lazy=True))
+    response = client.get('/api/showtimes', headers=VENUE_HEADERS)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    showtimes = json.loads(response.get_data(as_text=True))['data']
+    assert [showtime['session_number'] for showtime in showtimes] == [132417, 132418]
+    assert showtimes[0]['movie']['length'] == 107
+
+
+def test_best_seats_can_start_transaction(client, monkeypatch):
+    seats = ''.join('{%d}%s' % (i + 1, name) for i, name in enumerate(['A 1', 'A 2', 'A 3', 'A 4']))
+    bookings = []
+
+    def init_transaction(self, data):
+        bookings.append(data)
+        return VIFMessage(content='{vrp}{1}BARKER{2}6000!')
+
+    monkeypatch.setattr(VIFGateway, 'get_session_seats', lambda self, session_number, availability=0:
+                        VIFMessage(content='{vrp}{1}BARKER{2}6000!\n{pl4}' + seats))
+    monkeypatch.setattr(VIFGateway, 'init_transaction', init_transaction)
+    monkeypatch.setattr(CachedVIFGateway, 'session_seats_cache', TTLCache(ttl=5))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_layouts', TTLCache(ttl=60))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_maps', MessageViewCache(None))
+
+    response = client.get('/api/best_seats?session_number=132417&count=2', headers=VENUE_HEADERS)
+    assert json.loads(response.get_data(as_text=True))['data']['seats'] == ['A 2', 'A 3']
+    assert client.get('/api/best_seats?session_number=132417&count=5', headers=VENUE_HEADERS).status_code == 409
+    assert client.get('/api/best_seats?count=2', headers=VENUE_HEADERS).status_code == 400
+
+    data = {'workstation_id': 1, 'session_number': 132417, 'tickets': [{'ticket_code': 'ADULT'}] * 2}
+    response = client.post('/api/best_seats', data=json.dumps({'data': data}),
+                           content_type='application/json', headers=VENUE_HEADERS)
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True))['data']['seats'] == ['A 2', 'A 3']
+    assert bookings[0]['tickets'] == [{'ticket_code': 'ADULT', 'seat_name': 'A 2'},
+                                      {'ticket_code': 'ADULT', 'seat_name': 'A 3'}]
+
+
+def test_session_seats_compact_format(client, monkeypatch):
+    def get_session_seats(self, session_number, availability=0):
+        seats = ['A 1', 'A 2', 'A 3', 'A 4'] if availability == 0 else ['A 2', 'A 3']
+        fields = ''.join('{%d}%s' % (i + 1, name) for i, name in enumerate(seats))
+        return VIFMessage(content='{vrp}{1}BARKER{2}6000!\n{pl4}' + fields)
+
+    monkeypatch.setattr(VIFGateway, 'get_session_seats', get_session_seats)
+    monkeypatch.setattr(CachedVIFGateway, 'session_seats_cache', TTLCache(ttl=5))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_layouts', TTLCache(ttl=60))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_maps', MessageViewCache(None))
+
+    response = client.get('/api/get_session_seats?session_number=132417&availability=1',
+                          headers=dict(VENUE_HEADERS, Accept='application/vnd.vif.seatmap+json'))
+    assert response.status_code == 200
+    data = json.loads(response.get_data(as_text=True))['data']
+    assert data['bitmap'] == 'Bg=='
+    etag = response.headers['ETag']
+    response = client.get('/api/get_session_seats?session_number=132417&availability=1&format=bitmap',
+                          headers=dict(VENUE_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    response = client.get('/api/get_session_seats?session_number=132417&availability=1&format=rle',
+                          headers=dict(VENUE_HEADERS, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+
+    response = client.get('/api/get_session_seats?session_number=132417&availability=2&format=rle',
+                          headers=VENUE_HEADERS)
+    assert json.loads(response.get_data(as_text=True))['data']['runs'] == [0, 1, 2, 1]
+
+    response = client.get('/api/session_layout?session_number=132417', headers=VENUE_HEADERS)
+    layout = json.loads(response.get_data(as_text=True))['data']
+    assert layout['seats'] == ['A 1', 'A 2', 'A 3', 'A 4']
+    assert layout['etag'] == data['layout']
+    response = client.get('/api/session_layout?session_number=132417',
+                          headers=dict(VENUE_HEADERS, **{'If-None-Match': response.headers['ETag']}))
+    assert response.status_code == 304
@@ -0,0 +1,80 @@
+from array import array
+
+import pytest
+
+from venue.vif_array_storage import ColumnarStorage, RowStorage
+from venue.vif_detail_array import VIFPaymentArray, VIFSeatArray, VIFTicketArray
+from venue.vif_record import VIFRecord
+from venue.vif_schema import TICKET_ARRAY_SCHEMAS
+
+P30_TICKET_DATA = {
+    100101: 'BOUNT00', 100103: '10', 100105: 'A 12', 100106: 'Tkt Bounty Web', 100107: '2526568', 100108: '1.2',
+    100201: 'BOUNT00', 100203: '10', 100205: 'A 11', 100206: 'Tkt Bounty Web', 100208: '1.2',
+    100301: 'CHILD', 100303: '7.5', 100305: 'A 10', 100307: '2526570',
+}
+
+
+def test_columnar_storage_uses_typed_columns():
+    storage = ColumnarStorage(TICKET_ARRAY_SCHEMAS['q30'])
+    storage.append({1: 'BOUNT00', 2: 5, 3: '1.5'})
+    storage.append({1: 'CHILD', 2: 2.5})
+    assert len(storage) == 2
+    assert storage._columns[2] == array('d', [5.0, 2.5])
+    assert storage._columns[3] == array('d', [1.5, 0.0])
+    assert storage._columns[1] == ['BOUNT00', 'CHILD']
+    assert list(storage) == [{1: 'BOUNT00', 2: 5.0, 3: 1.5}, {1: 'CHILD', 2: 2.5}]
+    assert storage.column(3) == [1.5, None]
+    assert storage.column_sum(2) == 7.5
+
+
+def test_columnar_storage_falls_back_to_list_for_unconvertible_values():
+    storage = ColumnarStorage(TICKET_ARRAY_SCHEMAS['p30'])
+    storage.append({7: '2526568'})
+    storage.append({})
+    storage.append({7: 'not a number'})
+    assert storage.column(7) == [2526568, None, 'not a number']
+
+
+@pytest.mark.parametrize('storage_class', [RowStorage, ColumnarStorage])
+def test_storage_sums_missing_values_as_zero(storage_class):
+    storage = storage_class(TICKET_ARRAY_SCHEMAS['q30'])
+    storage.append({2: '5'})
+    storage.append({1: 'BOUNT00'})
+    assert storage.column_sum(2) == 5.0
+    assert storage.column_sum(3) == 0.0
+
+
+def test_columnar_ticket_array_matches_row_array():
+    rows = VIFTicketArray(record_code='p30', data=dict(P30_TICKET_DATA))
+    columns = VIFTicketArray(record_code='p30', data=dict(P30_TICKET_DATA), columnar=True)
+    assert columns.count() == rows.count() == 3
+    assert columns.data() == rows.data()
+    assert columns.friendly_data() == rows.friendly_data()
+    assert columns.keys() == rows.keys()
+    assert columns.total() == rows.total() == pytest.approx(29.9)
+    assert columns.sum_field('ticket_number') == rows.sum_field('ticket_number')
+
+
+def test_columnar_payment_and_seat_arrays():
+    payments = VIFPaymentArray(record_code='q31', columnar=True)
+    payments.add_stripe_payment(10.0, 'ch_1')
+    payments.add_payment(payment_category=4, amount_paid='2.5')
+    assert payments.total_amount_paid() == 12.5
+    assert payments.data() == {1101: 14, 1102: 'Stripe', 1103: 10.0, 1109: 'ch_1', 1201: 4, 1203: 2.5}
+
+    seats = VIFSeatArray(record_code='p30', data={1001: 'A 12', 1002: 'A 11'}, columnar=True)
+    assert seats.friendly_data() == ['A 12', 'A 11']
+
+
+def test_record_with_columnar_arrays(monkeypatch):
+    raw_content = ('{p30}{3}Cinema 02{4}Cinema Two{5}MOANA{6}Moana{7}20170110100000{8}15{9}2{10}37'
+                   '{1001}A 12{1002}A 11{100001}2'
+                   '{100101}BOUNT00{100103}10{100105}A 12{100106}Tkt Bounty Web{100108}1'
+                   '{100201}BOUNT00{100203}10{100205}A 11{100206}Tkt Bounty Web{100208}1')
+    expected = VIFRecord(raw_content=raw_content)
+    monkeypatch.setattr(VIFRecord, 'COLUMNAR_ARRAYS', True)
+    record = VIFRecord(raw_content=raw_content)
+    assert isinstance(record._tickets._data, ColumnarStorage)
+    assert record.data() == expected.data()
+    assert record.friendly_data() == expected.friendly_data()
+    assert record.content() == expected.content()
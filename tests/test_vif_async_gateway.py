@@ -0,0 +1,72 @@
+import pytest
+
+asyncio = pytest.importorskip('asyncio')
+
+from test_vif_gateway import GET_DATA_RESPONSE, FakeVenueHost  # noqa: E402
+from venue.vif_async_gateway import AsyncVIFGateway  # noqa: E402
+from venue.vif_gateway import VIFGatewayError  # noqa: E402
+
+
+def make_gateway(venue_host, **kwargs):
+    gateway = AsyncVIFGateway(host='127.0.0.1', auth_info='108193016648', site_name='BARKER', **kwargs)
+    gateway.DEFAULT_PORT = venue_host.port
+    return gateway
+
+
+def run(*coroutines):
+    loop = asyncio.new_event_loop()
+    try:
+        tasks = [loop.create_task(coroutine) for coroutine in coroutines]
+        loop.run_until_complete(asyncio.wait(tasks))
+        results = [task.result() for task in tasks]
+    finally:
+        loop.close()
+    return results[0] if len(results) == 1 else results
+
+
+@pytest.fixture
+def venue_host():
+    host = FakeVenueHost(GET_DATA_RESPONSE)
+    yield host
+    host.close()
+
+
+def test_get_data(venue_host):
+    response = run(make_gateway(venue_host).get_data())
+    assert [record.record_code for record in response.body] == ['dis', 'dis', 'mov']
+    assert venue_host.requests[0].startswith('{vrq}{1}BARKER')
+    assert '{q02}{1}2' in venue_host.requests[0]
+
+
+def test_request_matches_sync_gateway(venue_host):
+    run(make_gateway(venue_host).commit_transaction({'workstation_id': 123, 'booking_key': 'ABC123'}))
+    header, body = venue_host.requests[0].split('!')
+    assert header.startswith('{vrq}{1}BARKER{2}')
+    assert header.endswith('{3}31{4}Ticket Bounty VIF Gateway{8}108193016648{9}0')
+    assert body == '{q31}{2}123{5}ABC123' + chr(3)
+
+
+def test_single_record_response_gets_record_code():
+    host = FakeVenueHost('{vrp}{1}BARKER{2}6000!\n{1}OK' + chr(3))
+    try:
+        response = run(make_gateway(host).verify_booking('ABC123'))
+    finally:
+        host.close()
+    assert response.body[0].record_code == 'p42'
+    assert '{q42}{1}ABC123' in host.requests[0]
+
+
+def test_concurrent_requests(venue_host):
+    gateway = make_gateway(venue_host)
+    responses = run(*[gateway.get_session_seats(i) for i in range(20)])
+    assert len(responses) == 20
+    assert len(venue_host.requests) == 20
+
+
+def test_connection_closed_before_terminator_raises():
+    host = FakeVenueHost('{vrp}{1}BARKER{2}6000!\n{dis}{1}1')
+    try:
+        with pytest.raises(VIFGatewayError):
+            run(make_gateway(host).handshake())
+    finally:
+        host.close()
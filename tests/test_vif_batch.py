@@ -0,0 +1,107 @@
+import threading
+import time
+
+from venue.vif_batch import fan_out
+from venue.vif_gateway import VIFGatewayError
+
+SITES = [
+    {'host': '10.0.0.1', 'site_name': 'BARKER', 'auth_info': '1'},
+    {'host': '10.0.0.2', 'site_name': 'NRLNGA', 'auth_info': '2'},
+    {'host': '10.0.0.3', 'site_name': 'WALLIS', 'auth_info': '3'},
+]
+
+
+def test_fan_out_returns_results_in_site_order():
+    results = fan_out(SITES, lambda gateway: gateway.site_name.lower())
+    assert [result['data'] for result in results] == ['barker', 'nrlnga', 'wallis']
+    assert [result['host'] for result in results] == ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+
+
+def test_fan_out_reports_errors_per_site():
+    def request(gateway):
+        if gateway.host == '10.0.0.2':
+            raise VIFGatewayError('Connection refused')
+        return gateway.host
+
+    results = fan_out(SITES, request)
+    assert results[0]['data'] == '10.0.0.1'
+    assert results[1]['error'] == {'code': 502, 'message': 'Exception: Connection refused'}
+    assert 'data' not in results[1]
+    assert results[2]['data'] == '10.0.0.3'
+
+
+def test_fan_out_reports_malformed_sites_per_site():
+    results = fan_out([SITES[0], None, ['10.0.0.2']], lambda gateway: gateway.host)
+    assert results[0]['data'] == '10.0.0.1'
+    assert results[1]['error']['code'] == 400
+    assert results[2]['error']['code'] == 400
+    assert fan_out([None], lambda gateway: gateway.host)[0]['error']['code'] == 400
+
+
+def test_fan_out_times_out_slow_sites():
+    release = threading.Event()
+
+    def request(gateway):
+        if gateway.host == '10.0.0.3':
+            release.wait(5)
+        return gateway.host
+
+    start = time.time()
+    results = fan_out(SITES, request, timeout=0.1)
+    release.set()
+    assert time.time() - start < 2
+    assert [result.get('data') for result in results] == ['10.0.0.1', '10.0.0.2', None]
+    assert results[2]['error']['code'] == 504
+
+
+def test_fan_out_bounds_total_time_when_sites_hang():
+    release = threading.Event()
+    calls = []
+
+    def request(gateway):
+        calls.append(gateway.host)
+        release.wait(5)
+        return gateway.host
+
+    sites = [dict(SITES[0], host='10.0.2.%d' % i) for i in range(6)]
+    start = time.time()
+    results = fan_out(sites, request, max_workers=2, timeout=0.2)
+    elapsed = time.time() - start
+    release.set()
+    # Three waves of two workers, rather than waiting on the hung workers' slots
+    assert elapsed < 1.0
+    assert [result['error']['code'] for result in results] == [504] * 6
+    time.sleep(0.1)
+    # Sites abandoned before they started are never sent
+    assert len(calls) == 2
+
+
+def test_fan_out_stops_at_deadline():
+    release = threading.Event()
+    sites = [dict(SITES[0], host='10.0.2.%d' % i) for i in range(6)]
+    start = time.time()
+    results = fan_out(sites, lambda gateway: release.wait(5), max_workers=2, timeout=0.2, deadline=0.3)
+    elapsed = time.time() - start
+    release.set()
+    assert elapsed < 0.6
+    assert results[-1]['error'] == {'code': 504, 'message': 'Batch timed out after 0.3 seconds'}
+
+
+def test_fan_out_bounds_parallelism():
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def request(gateway):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return gateway.host
+
+    sites = [dict(SITES[0], host='10.0.1.%d' % i) for i in range(12)]
+    results = fan_out(sites, request, max_workers=3)
+    assert all('data' in result for result in results)
+    assert peak[0] <= 3
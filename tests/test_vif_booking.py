@@ -118,6 +118,11 @@ def test_vif_init_transaction_request_3():
     )
 
 
+def test_vif_init_transaction_request_from_text_totals_service_fee():
+    q30_record = VIFRecord(raw_content='{q30}{1}123{3}999{12}1.50{100001}1{100101}BOUNT00{100102}5.0{100103}1.0')
+    assert q30_record.get('total_transaction_price') == 7.5
+
+
 def test_vif_init_transaction_response_1():
     response_content = ('{p30}{3}Cinema 02{4}Cinema Two{5}MOANA{6}Moana{7}20170110100000{8}15{9}2{10}37'
                         '{1001}A 12{1002}A 11{100001}2'
@@ -0,0 +1,253 @@
+import threading
+import time
+
+import pytest
+
+from venue.vif_cache import CachedVIFGateway, MessageViewCache, TTLCache
+from venue.vif_gateway import VIFGateway, VIFResponseError
+from venue.vif_message import VIFMessage
+
+GET_DATA_RESPONSE = ('{vrp}{1}BARKER{2}6000!'
+                     '\n{mov}{3}Moana{5}MOANA'
+                     '\n{ssn}{1}132417{4}Cinema 02{5}MOANA{8}20170110100000')
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.calls
+
+
+def test_values_are_cached_until_ttl_expires():
+    clock, load = Clock(), Loader()
+    cache = TTLCache(ttl=10, clock=clock)
+    assert cache.get('a', load) == 1
+    clock.now += 9
+    assert cache.get('a', load) == 1
+    clock.now += 2
+    assert cache.get('a', load) == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(ttl=10, max_size=2)
+    cache.get('a', lambda: 'A')
+    cache.get('b', lambda: 'B')
+    cache.get('a', lambda: 'A2')
+    cache.get('c', lambda: 'C')
+    assert len(cache) == 2
+    assert cache.peek('b') is None
+    assert cache.peek('a') == 'A'
+
+
+def test_stale_value_is_served_while_refreshing():
+    clock = Clock()
+    cache = TTLCache(ttl=10, stale_ttl=60, clock=clock)
+    cache.get('a', lambda: 'old')
+    clock.now += 30
+    refreshed = threading.Event()
+
+    def load():
+        refreshed.set()
+        return 'new'
+
+    assert cache.get('a', load) == 'old'
+    assert refreshed.wait(2)
+    for _ in range(100):
+        if cache.peek('a') == 'new':
+            break
+        time.sleep(0.01)
+    assert cache.get('a', load) == 'new'
+
+
+def test_concurrent_misses_share_one_load():
+    started, release = threading.Event(), threading.Event()
+    load = Loader()
+
+    def slow_load():
+        started.set()
+        release.wait(2)
+        return load()
+
+    cache = TTLCache(ttl=10)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('a', slow_load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    started.wait(2)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    assert results == [1] * 5
+    assert load.calls == 1
+
+
+def test_failed_load_is_not_cached():
+    cache = TTLCache(ttl=10)
+
+    def fail():
+        raise IOError('Connection refused')
+
+    with pytest.raises(IOError):
+        cache.get('a', fail)
+    assert cache.get('a', lambda: 'A') == 'A'
+
+
+def test_cached_gateway_keys_by_site(monkeypatch):
+    calls = []
+
+    def get_data(self, detail_required=2):
+        calls.append((self.host, self.site_name, detail_required))
+        return VIFMessage(content=GET_DATA_RESPONSE, lazy=True)
+
+    monkeypatch.setattr(VIFGateway, 'get_data', get_data)
+    monkeypatch.setattr(CachedVIFGateway, 'get_data_cache', TTLCache(ttl=60))
+    first = CachedVIFGateway(host='10.0.0.1', site_name='BARKER').get_data()
+    assert CachedVIFGateway(host='10.0.0.1', site_name='BARKER').get_data() is first
+    CachedVIFGateway(host='10.0.0.1', site_name='BARKER').get_data(detail_required=1)
+    CachedVIFGateway(host='10.0.0.2', site_name='BARKER').get_data()
+    assert calls == [('10.0.0.1', 'BARKER', 2), ('10.0.0.1', 'BARKER', 1), ('10.0.0.2', 'BARKER', 2)]
+    # Cached messages are fully parsed so they can be shared between threads
+    assert all(record._loaded for record in first.body)
+
+
+def test_cached_gateway_keys_by_credentials(monkeypatch):
+    calls = []
+
+    def get_data(self, detail_required=2):
+        calls.append(self.auth_info)
+        return VIFMessage(content=GET_DATA_RESPONSE, lazy=True)
+
+    monkeypatch.setattr(VIFGateway, 'get_data', get_data)
+    monkeypatch.setattr(CachedVIFGateway, 'get_data_cache', TTLCache(ttl=60))
+    first = CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='108193016648').get_data()
+    second = CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='wrong').get_data()
+    assert second is not first
+    assert CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='108193016648').get_data() is first
+    assert calls == ['108193016648', 'wrong']
+    assert not any('108193016648' in str(key) for key in CachedVIFGateway.get_data_cache._entries)
+
+
+def test_cached_gateway_does_not_cache_error_replies(monkeypatch):
+    responses = ['{vrp}{1}BARKER{2}6000{3}1{4}12{5}Invalid auth!', GET_DATA_RESPONSE]
+
+    def get_data(self, detail_required=2):
+        return VIFMessage(content=responses.pop(0), lazy=True)
+
+    monkeypatch.setattr(VIFGateway, 'get_data', get_data)
+    monkeypatch.setattr(CachedVIFGateway, 'get_data_cache', TTLCache(ttl=60))
+    gateway = CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='1')
+    with pytest.raises(VIFResponseError) as excinfo:
+        gateway.get_data()
+    assert (excinfo.value.response_code, excinfo.value.error_number) == (1, 12)
+    assert gateway.get_data().body[0].record_code == 'mov'
+
+
+SEATS_RESPONSE = '{vrp}{1}BARKER{2}6000!\n{pl4}{1}N 22{2}N 21'
+
+
+@pytest.fixture
+def seat_gateway(monkeypatch):
+    calls = []
+
+    def get_session_seats(self, session_number, availability=0):
+        calls.append(session_number)
+        return VIFMessage(content=SEATS_RESPONSE, lazy=True)
+
+    def booking_operation(self, data):
+        return VIFMessage(content='{vrp}{1}BARKER{2}6000!')
+
+    monkeypatch.setattr(VIFGateway, 'get_session_seats', get_session_seats)
+    for name in ('init_transaction', 'free_seats', 'commit_transaction'):
+        monkeypatch.setattr(VIFGateway, name, booking_operation)
+    monkeypatch.setattr(CachedVIFGateway, 'session_seats_cache', TTLCache(ttl=5))
+    monkeypatch.setattr(CachedVIFGateway, 'transaction_sessions', TTLCache(ttl=60))
+    gateway = CachedVIFGateway(host='10.0.0.1', site_name='BARKER')
+    gateway.calls = calls
+    return gateway
+
+
+def test_session_seats_are_cached_per_session(seat_gateway):
+    seat_gateway.get_session_seats('132417')
+    seat_gateway.get_session_seats(132417)
+    seat_gateway.get_session_seats(132418)
+    assert seat_gateway.calls == ['132417', 132418]
+
+
+@pytest.mark.parametrize('operation, data', [
+    ('init_transaction', {'workstation_id': 1, 'session_number': 132417}),
+    ('free_seats', {1: 132417, 2: 1}),
+])
+def test_booking_operations_invalidate_session_seats(seat_gateway, operation, data):
+    seat_gateway.get_session_seats(132417)
+    seat_gateway.get_session_seats(132418)
+    getattr(seat_gateway, operation)(data)
+    seat_gateway.get_session_seats(132417)
+    seat_gateway.get_session_seats(132418)
+    assert seat_gateway.calls == [132417, 132418, 132417]
+
+
+def test_commit_invalidates_session_of_workstation_transaction(seat_gateway):
+    seat_gateway.init_transaction({'workstation_id': 7, 'session_number': 132417})
+    seat_gateway.get_session_seats(132417)
+    seat_gateway.get_session_seats(132418)
+    seat_gateway.commit_transaction({'workstation_id': 7, 'booking_key': 'ABC'})
+    seat_gateway.get_session_seats(132417)
+    seat_gateway.get_session_seats(132418)
+    assert seat_gateway.calls == [132417, 132418, 132417]
+
+
+def test_session_seats_are_cached_per_credentials(seat_gateway):
+    seat_gateway.get_session_seats(132417)
+    CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='wrong').get_session_seats(132417)
+    assert seat_gateway.calls == [132417, 132417]
+
+
+def test_booking_invalidates_seats_cached_for_other_credentials(seat_gateway):
+    other = CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='other')
+    other.get_session_seats(132417)
+    seat_gateway.free_seats({1: 132417, 2: 1})
+    other.get_session_seats(132417)
+    assert seat_gateway.calls == [132417, 132417]
+
+
+def test_commit_without_known_session_invalidates_site_seats(seat_gateway):
+    seat_gateway.get_session_seats(132417)
+    seat_gateway.get_session_seats(132418)
+    CachedVIFGateway(host='10.0.0.2', site_name='BARKER').get_session_seats(132417)
+    seat_gateway.commit_transaction({'workstation_id': 8, 'booking_key': 'ABC'})
+    seat_gateway.get_session_seats(132417)
+    seat_gateway.get_session_seats(132418)
+    CachedVIFGateway(host='10.0.0.2', site_name='BARKER').get_session_seats(132417)
+    assert seat_gateway.calls == [132417, 132418, 132417, 132417, 132418]
+
+
+def test_invalidated_load_in_progress_is_not_cached():
+    cache = TTLCache(ttl=10)
+
+    def load():
+        cache.invalidate('a')
+        return 'before booking'
+
+    assert cache.get('a', load) == 'before booking'
+    assert cache.get('a', lambda: 'after booking') == 'after booking'
+
+
+def test_message_view_is_rebuilt_only_for_new_messages():
+    builds = []
+    views = MessageViewCache(lambda message: builds.append(message) or len(builds))
+    first, second = VIFMessage(content=GET_DATA_RESPONSE), VIFMessage(content=GET_DATA_RESPONSE)
+    assert views.get('BARKER', first) == 1
+    assert views.get('BARKER', first) == 1
+    assert views.get('BARKER', second) == 2
+    assert builds == [first, second]
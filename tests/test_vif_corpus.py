@@ -0,0 +1,71 @@
+import pytest
+
+from venue.vif_corpus import CorpusGenerator, main, parse_size
+from venue.vif_message import VIFMessage
+
+
+def test_generator_is_deterministic():
+    assert CorpusGenerator(7).get_data(sessions=20) == CorpusGenerator(7).get_data(sessions=20)
+    assert CorpusGenerator(7).get_data(sessions=20) != CorpusGenerator(8).get_data(sessions=20)
+
+
+def test_get_data_records_refer_to_each_other():
+    message = VIFMessage(content=CorpusGenerator(1).get_data(movies=5, venues=2, tickets=3, price_groups=2,
+                                                             sessions=50))
+    data = message.friendly_data()
+    assert data['vrp']['response_code'] == 2
+    assert len(data['mov']) == 5
+    assert len(data['prl']) == 6
+    assert len(data['ssn']) == 50
+    movie_codes = set(movie['movie_code'] for movie in data['mov'])
+    venue_codes = set(venue['code'] for venue in data['ven'])
+    price_group_codes = set(price['price_group_code'] for price in data['prl'])
+    for session in data['ssn']:
+        assert session['movie_code'] in movie_codes
+        assert session['venue_code'] in venue_codes
+        assert session['price_group_code'] in price_group_codes
+        assert len(session['start_time']) == 14
+
+
+def test_get_data_of_size():
+    content = CorpusGenerator().get_data(size=parse_size('64KB'))
+    assert 64 * 1024 <= len(content) < 66 * 1024
+    assert len(VIFMessage(content=content).body) > 100
+
+
+def test_booking_messages_parse():
+    q30 = VIFMessage(content=CorpusGenerator().init_transaction(tickets=120)).body[0]
+    assert q30._tickets.count() == 120
+    assert q30.get('ticket_count') == 120
+    assert len(q30.friendly_data()['tickets']) == 120
+    p30 = VIFMessage(content=CorpusGenerator().init_transaction_response(tickets=120)).body[0]
+    assert len(p30.friendly_data()['tickets']) == 120
+    assert p30._reserved_seats.count() == 99
+    q31 = VIFMessage(content=CorpusGenerator().commit_transaction(payments=3)).body[0]
+    assert q31.get('payment_count') == 3
+    with pytest.raises(ValueError):
+        CorpusGenerator().commit_transaction(payments=10)
+
+
+def test_session_seats():
+    message = VIFMessage(content=CorpusGenerator().session_seats(rows=2, seats_per_row=3))
+    assert sorted(message.body[0].data().values()) == ['A 1', 'A 2', 'A 3', 'B 1', 'B 2', 'B 3']
+
+
+def test_cli(capsys):
+    assert main(['session_seats', '--rows', '1', '--seats-per-row', '2']) == 0
+    assert capsys.readouterr().out.endswith('{pl4}{1}A 1{2}A 2\x03')
+
+
+@pytest.mark.parametrize('argv', [
+    ['q31', '--payments', '10'],
+    ['q31', '--payments', '0'],
+    ['q30', '--tickets', '0'],
+    ['get_data', '--size', 'huge'],
+    ['session_seats', '--available', '1.5'],
+])
+def test_cli_rejects_invalid_arguments(argv, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        main(argv)
+    assert excinfo.value.code == 2
+    assert 'error:' in capsys.readouterr().err
@@ -0,0 +1,358 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from venue.vif_connection import VIFConnection, VIFConnectionPool, VIFConnectionPoolTimeout, close_pools
+from venue.vif_gateway import VIFGateway, VIFGatewayError
+from venue.vif_message import VIFMessage
+from venue.vif_record import VIFRecord
+
+GET_DATA_RESPONSE = ('{vrp}{1}BARKER{2}6000!;'
+                     '\n; Distributors'
+                     '\n{dis}{1}1{2}Filmways{3}0{17}11'
+                     '\n{dis}{1}2{2}Fourth Wall{3}4WALL{17}11'
+                     '\n{mov}{3}Amelie{5}AMELIE' + chr(3))
+
+
+class FakeVenueHost(object):
+    """
+    Accepts connections on a local port and answers each request with a canned
+    reply. Unless `keep_alive` is set the connection is closed after replying.
+    """
+
+    def __init__(self, response, chunk_size=5, keep_alive=False):
+        self.response = response.encode('utf-8')
+        self.chunk_size = chunk_size
+        self.keep_alive = keep_alive
+        self.requests = []
+        self.connections = []
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except socket.error:
+                return
+            self.connections.append(conn)
+            thread = threading.Thread(target=self._handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _handle(self, conn):
+        try:
+            while True:
+                request = b''
+                while b'\x03' not in request:
+                    data = conn.recv(1024)
+                    if not data:
+                        return
+                    request += data
+                self.requests.append(request.decode('utf-8'))
+                for i in range(0, len(self.response), self.chunk_size):
+                    conn.sendall(self.response[i:i + self.chunk_size])
+                if not self.keep_alive:
+                    return
+        except socket.error:
+            return
+        finally:
+            conn.close()
+
+    def drop_connections(self):
+        for conn in self.connections:
+            conn.close()
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture(autouse=True)
+def connection_pools():
+    yield
+    close_pools()
+
+
+@pytest.fixture
+def venue_host():
+    host = FakeVenueHost(GET_DATA_RESPONSE)
+    yield host
+    host.close()
+
+
+@pytest.fixture
+def keep_alive_host():
+    host = FakeVenueHost(GET_DATA_RESPONSE, keep_alive=True)
+    yield host
+    host.close()
+
+
+def make_gateway(venue_host):
+    gateway = VIFGateway(host='127.0.0.1', auth_info='108193016648', site_name='BARKER')
+    gateway.DEFAULT_PORT = venue_host.port
+    return gateway
+
+
+def get_data_message():
+    message = VIFMessage()
+    message.set_request_header(request_code=2, site_name='BARKER', packet_id='6000')
+    message.add_body_record(VIFRecord(record_code='q02', data={'detail_required': 2}))
+    return message
+
+
+def test_send_message_parses_response(venue_host):
+    response = make_gateway(venue_host).send_message(get_data_message())
+    assert response.header.record_code == 'vrp'
+    assert [record.record_code for record in response.body] == ['dis', 'dis', 'mov']
+    assert venue_host.requests[0].startswith('{vrq}{1}BARKER{2}6000{3}2')
+
+
+def test_iter_records_yields_header_then_body_records(venue_host):
+    records = list(make_gateway(venue_host).iter_records(get_data_message()))
+    assert [record.record_code for record in records] == ['vrp', 'dis', 'dis', 'mov']
+    assert records[0].friendly_data() == {'site_name': 'BARKER', 'packet_id': '6000'}
+    assert records[3].get('movie_code') == 'AMELIE'
+    assert [record.content() for record in records[1:]] == [
+        record.content() for record in VIFMessage(content=GET_DATA_RESPONSE).body]
+
+
+def test_iter_records_raises_if_connection_closes_early():
+    host = FakeVenueHost('{vrp}{1}BARKER{2}6000!\n{dis}{1}1')
+    try:
+        with pytest.raises(VIFGatewayError):
+            list(make_gateway(host).iter_records(get_data_message()))
+    finally:
+        host.close()
+
+
+def test_iter_records_decodes_characters_split_across_chunks():
+    host = FakeVenueHost(u'{vrp}{1}BARKER{2}6000!\n{mov}{3}Am\xe9lie{5}AMELIE' + chr(3), chunk_size=1)
+    try:
+        records = list(make_gateway(host).iter_records(get_data_message()))
+    finally:
+        host.close()
+    assert records[1].get('name') == u'Am\xe9lie'
+
+
+def test_send_message_reuses_pooled_connection(keep_alive_host):
+    gateway = make_gateway(keep_alive_host)
+    for _ in range(3):
+        assert len(gateway.send_message(get_data_message()).body) == 3
+    # A gateway created later, e.g. for the next Flask request, shares the pool
+    assert len(make_gateway(keep_alive_host).send_message(get_data_message()).body) == 3
+    assert len(keep_alive_host.connections) == 1
+    assert len(keep_alive_host.requests) == 4
+
+
+def test_iter_records_returns_connection_to_pool(keep_alive_host):
+    gateway = make_gateway(keep_alive_host)
+    list(gateway.iter_records(get_data_message()))
+    list(gateway.iter_records(get_data_message()))
+    assert len(keep_alive_host.connections) == 1
+    assert gateway.connection_pool().idle_count() == 1
+
+
+def test_abandoned_iter_records_discards_connection(keep_alive_host):
+    gateway = make_gateway(keep_alive_host)
+    records = gateway.iter_records(get_data_message())
+    next(records)
+    records.close()
+    assert gateway.connection_pool().idle_count() == 0
+
+
+def test_send_message_reconnects_after_connection_dropped(keep_alive_host, monkeypatch):
+    gateway = make_gateway(keep_alive_host)
+    gateway.send_message(get_data_message())
+    keep_alive_host.drop_connections()
+    # Let the dropped connection pass the health check so the send itself fails
+    monkeypatch.setattr(VIFConnection, 'peer_closed', lambda self: self.closed)
+    assert len(gateway.send_message(get_data_message()).body) == 3
+    assert len(keep_alive_host.connections) == 2
+
+
+def test_send_message_never_resends_commit_after_connection_dropped(keep_alive_host, monkeypatch):
+    gateway = make_gateway(keep_alive_host)
+    gateway.send_message(get_data_message())
+    keep_alive_host.drop_connections()
+    monkeypatch.setattr(VIFConnection, 'peer_closed', lambda self: self.closed)
+    with pytest.raises((VIFGatewayError, socket.error)):
+        gateway.commit_transaction({'workstation_id': 123, 'booking_key': 'ABC123'})
+    time.sleep(0.05)
+    # The dropped connection may still have delivered it, but it's never sent again
+    assert len(keep_alive_host.connections) == 1
+    assert sum('{3}31' in request for request in keep_alive_host.requests) <= 1
+
+
+def test_pool_switches_to_one_shot_mode(venue_host):
+    gateway = make_gateway(venue_host)
+    for _ in range(4):
+        assert len(gateway.send_message(get_data_message()).body) == 3
+    pool = gateway.connection_pool()
+    assert pool.one_shot
+    assert pool.idle_count() == 0
+    assert len(venue_host.connections) == 4
+
+
+def test_pool_limits_connections_in_use(keep_alive_host):
+    pool = VIFConnectionPool('127.0.0.1', keep_alive_host.port, max_size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(VIFConnectionPoolTimeout):
+        pool.acquire()
+    conn.mark_used()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.release(conn)
+    pool.close()
+
+
+def test_pool_evicts_idle_connections(keep_alive_host):
+    pool = VIFConnectionPool('127.0.0.1', keep_alive_host.port, idle_timeout=0.01)
+    conn = pool.acquire()
+    conn.mark_used()
+    pool.release(conn)
+    assert pool.idle_count() == 1
+    time.sleep(0.02)
+    assert pool.acquire() is not conn
+    assert conn.closed
+
+
+def test_send_message_decodes_characters_split_across_chunks():
+    host = FakeVenueHost(u'{vrp}{1}BARKER{2}6000!\n{mov}{3}Am\xe9lie{5}AMELIE' + chr(3), chunk_size=1)
+    try:
+        response = make_gateway(host).send_message(get_data_message())
+    finally:
+        host.close()
+    assert response.body[0].get('name') == u'Am\xe9lie'
+
+
+def test_send_message_grows_receive_buffer_for_large_responses():
+    lines = ''.join('\n{dis}{1}%d{2}Distributor %d{3}0{17}11' % (i, i) for i in range(2000))
+    response = '{vrp}{1}BARKER{2}6000!' + lines + chr(3)
+    host = FakeVenueHost(response, chunk_size=4096, keep_alive=True)
+    try:
+        gateway = make_gateway(host)
+        assert len(gateway.send_message(get_data_message()).body) == 2000
+        assert gateway.connection_pool().response_size_hints[2] == len(response)
+        assert len(gateway.send_message(get_data_message()).body) == 2000
+    finally:
+        host.close()
+
+
+def test_small_request_after_large_response_uses_minimum_receive_buffer(monkeypatch):
+    lines = ''.join('\n{dis}{1}%d{2}Distributor %d{3}0{17}11' % (i, i) for i in range(2000))
+    host = FakeVenueHost('{vrp}{1}BARKER{2}6000!' + lines + chr(3), chunk_size=4096, keep_alive=True)
+    size_hints = []
+    read_sock_response = VIFGateway._read_sock_response
+
+    def recording_read_sock_response(self, sock, size_hint=0):
+        size_hints.append(size_hint)
+        return read_sock_response(self, sock, size_hint)
+
+    monkeypatch.setattr(VIFGateway, '_read_sock_response', recording_read_sock_response)
+    try:
+        gateway = make_gateway(host)
+        gateway.get_data()
+        gateway.get_data()
+        gateway.handshake()
+    finally:
+        host.close()
+    # The second get_data is sized from the first, the handshake isn't
+    assert size_hints[0] == 0
+    assert size_hints[1] > VIFGateway.RECV_BUFFER_MIN
+    assert size_hints[2] == 0
+
+
+def test_read_sock_response_stops_at_terminator():
+    client, server = socket.socketpair()
+    try:
+        server.sendall(b'{vrp}{1}A!{p01}{1}B\x03')
+        response = VIFGateway()._read_sock_response(client)
+    finally:
+        client.close()
+        server.close()
+    assert response == bytearray(b'{vrp}{1}A!{p01}{1}B\x03')
+
+
+class PipeliningVenueHost(object):
+    """
+    Answers every request on a connection as soon as `batch_size` requests
+    have arrived, in reverse order, echoing each request's packet_id.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.connections = 0
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except socket.error:
+                return
+            self.connections += 1
+            buf = b''
+            requests = []
+            while True:
+                data = conn.recv(1024)
+                if not data:
+                    break
+                buf += data
+                while b'\x03' in buf:
+                    request, buf = buf.split(b'\x03', 1)
+                    requests.append(VIFMessage(content=request.decode('utf-8')))
+                if len(requests) >= self.batch_size:
+                    for message in reversed(requests):
+                        response = '{vrp}{1}BARKER{2}%s!\n{pl4}{1}%s\x03' % (
+                            message.header.get('packet_id'), message.body[0].get('session_number'))
+                        conn.sendall(response.encode('utf-8'))
+                    requests = []
+            conn.close()
+
+    def close(self):
+        self.server.close()
+
+
+def test_pipelined_requests_share_one_connection():
+    host = PipeliningVenueHost(batch_size=8)
+    gateway = make_gateway(host)
+    gateway.pipelined = True
+    results = {}
+
+    def get_session_seats(session_number):
+        response = gateway.get_session_seats(session_number)
+        results[session_number] = response.body[0].get(1)
+
+    threads = [threading.Thread(target=get_session_seats, args=(i,)) for i in range(8)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+    finally:
+        host.close()
+    # Responses arrive in reverse order but are matched to the right caller
+    assert results == dict((i, str(i)) for i in range(8))
+    assert host.connections == 1
+    assert gateway.pipeline().in_flight() == 0
+
+
+def test_pipelined_request_fails_when_connection_closes(venue_host):
+    # This host closes the connection after one reply that doesn't echo the packet_id
+    gateway = make_gateway(venue_host)
+    gateway.pipelined = True
+    with pytest.raises(VIFGatewayError):
+        gateway.get_data()
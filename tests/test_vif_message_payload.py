@@ -172,3 +172,25 @@ def test_parsing_when_body_record_code_unavailable():
     assert content == message_payload.content()
     assert message_payload.header.record_code == 'vrp'
     assert len(message_payload.body) == 1
+
+
+def test_lazy_message_defers_body_record_parsing():
+    content = ('{vrp}{1}BARKER{2}6000!'
+               '\n{dis}{1}1{2}Filmways{3}0{17}11'
+               '\n{dis}{1}2{2}Fourth Wall{3}4WALL{17}11')
+    message_payload = VIFMessage(content=content, lazy=True)
+    assert [record.record_code for record in message_payload.body] == ['dis', 'dis']
+    assert not any(record._loaded for record in message_payload.body)
+    assert message_payload.friendly_data() == VIFMessage(content=content).friendly_data()
+    assert message_payload.content() == VIFMessage(content=content).content()
+
+
+def test_encode_returns_terminated_bytes():
+    content = ('{vrp}{1}BARKER{2}6000!'
+               '{dis}{1}1{2}Filmways{3}0{17}11'
+               '\n{mov}{3}Am\xe9lie{5}AMELIE')
+    message_payload = VIFMessage(content=content)
+    encoded = message_payload.encode()
+    assert isinstance(encoded, bytearray)
+    assert encoded == (message_payload.content() + chr(3)).encode('utf-8')
+    assert encoded.endswith(b'\x03')
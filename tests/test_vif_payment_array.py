@@ -84,3 +84,11 @@ def test_parse_named_payment_data_to_record():
     assert record.content() == (
         '{q31}{2}123{4}15.0{5}ST-BOOKING-KEY{7}0417070155{11}WWW{1001}1'
         '{1101}14{1102}Stripe{1103}15.0')
+
+
+def test_total_amount_paid_tracked_as_payments_are_added():
+    payment_array = VIFPaymentArray(record_code='q31')
+    payment_array.add_stripe_payment(10.0, 'ch_1')
+    payment_array.add_paypal_payment(5.5, 'PAY-1')
+    assert payment_array.total_amount_paid() == 15.5
+    assert payment_array.sum_field('payment_category') == 28
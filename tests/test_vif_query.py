@@ -0,0 +1,93 @@
+import json
+import random
+
+import pytest
+
+from venue.vif_message import VIFMessage
+from venue.vif_query import ShowtimesView, VIFRecordIndex
+
+GET_DATA_RESPONSE = ('{vrp}{1}BARKER{2}6000!'
+                     '\n{mov}{3}Moana{5}MOANA'
+                     '\n{ssn}{1}3{4}Cinema 01{5}MOANA{6}STD{8}20170111100000'
+                     '\n{ssn}{1}1{4}Cinema 02{5}MOANA{6}STD{8}20170110100000'
+                     '\n{ssn}{1}2{4}Cinema 01{5}AMELIE{6}STD{8}20170110130000'
+                     '\n{ssn}{1}4{4}Cinema 02{5}AMELIE{6}PRM'
+                     '\n{prl}{1}STD{2}ADULT{4}15.5'
+                     '\n{prl}{1}PRM{2}ADULT{4}21.0'
+                     '\n{prl}{1}STD{2}CHILD{4}11.0')
+
+
+@pytest.fixture
+def index():
+    return VIFRecordIndex(VIFMessage(content=GET_DATA_RESPONSE))
+
+
+def session_numbers(sessions):
+    return [session.get('session_number') for session in sessions]
+
+
+def test_sessions_are_in_start_time_order(index):
+    assert session_numbers(index.find_sessions()) == [4, 1, 2, 3]
+
+
+def test_find_sessions_by_code(index):
+    assert session_numbers(index.find_sessions(movie_code='MOANA')) == [1, 3]
+    assert session_numbers(index.find_sessions(venue_code='Cinema 02')) == [4, 1]
+    assert session_numbers(index.find_sessions(movie_code='AMELIE', venue_code='Cinema 01')) == [2]
+    assert index.find_sessions(movie_code='UNKNOWN') == []
+
+
+def test_find_sessions_by_start_time(index):
+    assert session_numbers(index.find_sessions(start='20170110')) == [1, 2, 3]
+    assert session_numbers(index.find_sessions(end='20170110')) == [1, 2]
+    assert session_numbers(index.find_sessions(start='201701101200', end='20170111')) == [2, 3]
+    assert session_numbers(index.find_sessions(movie_code='MOANA', start='20170111')) == [3]
+    assert index.find_sessions(start='20170112', end='20170111') == []
+
+
+def test_find_prices(index):
+    assert [price.get('ticket_code') for price in index.find_prices('STD')] == ['ADULT', 'CHILD']
+    assert index.find_prices('UNKNOWN') == []
+
+
+def test_index_matches_scan():
+    rng = random.Random(7)
+    lines = ['{vrp}{1}BARKER{2}6000!']
+    for number in range(500):
+        lines.append('{ssn}{1}%d{4}Cinema %02d{5}MOVIE%d{8}201701%02d%02d0000' % (
+            number, rng.randint(1, 6), rng.randint(1, 10), rng.randint(1, 28), rng.randint(9, 23)))
+    message = VIFMessage(content='\n'.join(lines))
+    index = VIFRecordIndex(message)
+    for _ in range(50):
+        movie_code = rng.choice([None, 'MOVIE%d' % rng.randint(1, 10)])
+        venue_code = rng.choice([None, 'Cinema %02d' % rng.randint(1, 6)])
+        start = rng.choice([None, '201701%02d' % rng.randint(1, 28)])
+        end = rng.choice([None, '201701%02d' % rng.randint(1, 28)])
+        expected = sorted(
+            (record for record in message.body
+             if movie_code in (None, record.get('movie_code'))
+             and venue_code in (None, record.get('venue_code'))
+             and (start is None or record.get('start_time')[:8] >= start)
+             and (end is None or record.get('start_time')[:8] <= end)),
+            key=lambda record: (record.get('start_time'), index.sessions.index(record)))
+        assert index.find_sessions(movie_code, venue_code, start, end) == expected
+
+
+def test_showtimes_join_movie_venue_and_prices():
+    message = VIFMessage(content=GET_DATA_RESPONSE + '\n{ven}{1}2{2}Cinema Two{3}Cinema 02')
+    showtimes = ShowtimesView(message).showtimes
+    assert [showtime['session_number'] for showtime in showtimes] == [4, 1, 2, 3]
+    moana = showtimes[1]
+    assert moana['movie'] == {'name': 'Moana', 'movie_code': 'MOANA'}
+    assert moana['venue'] == {'id': 2, 'venue_name': 'Cinema Two', 'code': 'Cinema 02'}
+    assert [price['ticket_code'] for price in moana['prices']] == ['ADULT', 'CHILD']
+    # Missing movies and venues are left empty rather than dropping the session
+    assert showtimes[2]['movie'] is None
+    assert showtimes[2]['venue'] is None
+    assert [price['price'] for price in showtimes[0]['prices']] == [21.0]
+
+
+def test_showtimes_json_is_serialized_once():
+    view = ShowtimesView(VIFMessage(content=GET_DATA_RESPONSE))
+    assert view.json() is view.json()
+    assert json.loads(view.json()) == {'data': view.showtimes}
@@ -1,4 +1,5 @@
 import re
+import timeit
 
 import pytest
 
@@ -286,3 +287,60 @@ def test_parsing_of_transaction_data():
                    '{100201}BOUNT00{100202}5.0{100203}1.0'
                    '{100301}BOUNT00{100302}5.0{100303}1.0')
     assert message.content() == raw_content
+
+
+def test_lazy_record_defers_parsing_until_accessed():
+    raw_content = '{vrq}{1}BARKER{2}ABCD{3}1{4}Test{8}108193016648'
+    message = VIFRecord(raw_content=raw_content, lazy=True)
+    assert message.record_code == 'vrq'
+    assert message._loaded is False
+    assert message.data() == VIFRecord(raw_content=raw_content).data()
+    assert message._loaded is True
+
+
+def test_lazy_record_parses_arrays_on_first_access():
+    raw_content = ('{p30}{3}Cinema 02{4}Cinema Two{5}MOANA{6}Moana{7}20170110100000{8}15{9}2{10}37'
+                   '{1001}A 12{1002}A 11{100001}2'
+                   '{100101}BOUNT00{100103}10{100105}A 12{100106}Tkt Bounty Web{100108}1'
+                   '{100201}BOUNT00{100203}10{100205}A 11{100206}Tkt Bounty Web{100208}1')
+    message = VIFRecord(raw_content=raw_content, lazy=True)
+    assert message.friendly_data() == VIFRecord(raw_content=raw_content).friendly_data()
+    assert message.content() == VIFRecord(raw_content=raw_content).content()
+
+
+def test_get_field_by_name_or_number():
+    raw_content = '{vrq}{1}BARKER{2}ABCD{3}1{4}Test{8}108193016648'
+    message = VIFRecord(raw_content=raw_content, lazy=True)
+    assert message.get('site_name') == 'BARKER'
+    assert message.get(3) == 1
+    assert message.get('request_code') == 1
+    assert message.get('gateway_type') is None
+    assert message.get(9, 0) == 0
+
+
+def booking_record_content(ticket_count):
+    tickets = ''.join(
+        '{{{0}01}}BOUNT00{{{0}03}}10{{{0}05}}A {1}{{{0}06}}Tkt Bounty Web{{{0}08}}1'.format(1000 + i, i)
+        for i in range(1, ticket_count + 1))
+    return '{p30}{3}Cinema 02{4}Cinema Two{5}MOANA{100001}' + str(ticket_count) + tickets
+
+
+def test_data_scales_linearly_with_ticket_count():
+    def best_time(record):
+        return min(timeit.repeat(record.data, number=3, repeat=5))
+
+    small = VIFRecord(raw_content=booking_record_content(50))
+    large = VIFRecord(raw_content=booking_record_content(500))
+    assert len(large.data()) == 10 * len(small.data()) - 9 * 4
+    # Linear scaling gives a ratio close to 10, quadratic scaling close to 100
+    assert best_time(large) / best_time(small) < 30
+
+
+def test_records_only_create_arrays_for_array_record_codes():
+    session = VIFRecord(raw_content='{ssn}{1}132417{4}Cinema 02{5}MOANA')
+    assert not hasattr(session, '__dict__')
+    assert session._arrays() == []
+    booking = VIFRecord(raw_content=booking_record_content(2))
+    assert booking._tickets is not None and booking._reserved_seats is not None
+    assert booking._payments is None
+    assert VIFRecord(record_code='q31', data={'booking_key': 'KEY'})._payments is not None
@@ -0,0 +1,45 @@
+import pytest
+
+from venue.vif_field_map import VIF_FIELD_MAP, TICKET_ARRAY_FIELD_MAP
+from venue.vif_schema import EMPTY_SCHEMA, RECORD_SCHEMAS, TICKET_ARRAY_SCHEMAS, RecordSchema
+
+
+def test_schemas_compiled_for_every_record_code():
+    assert set(RECORD_SCHEMAS) == set(VIF_FIELD_MAP)
+    assert set(TICKET_ARRAY_SCHEMAS) == set(TICKET_ARRAY_FIELD_MAP)
+
+
+@pytest.mark.parametrize('record_code', sorted(VIF_FIELD_MAP))
+def test_schema_matches_field_map(record_code):
+    field_map = VIF_FIELD_MAP[record_code]
+    schema = RECORD_SCHEMAS[record_code]
+    assert schema.field_numbers == tuple(sorted(field_map))
+    for field_number, (field_name, field_type) in field_map.items():
+        assert schema.field_name(field_number) == field_name
+        assert schema.field_number(field_name) == field_number
+        assert schema.converter(field_number) is field_type
+
+
+def test_unknown_fields_fall_back():
+    schema = RECORD_SCHEMAS['vrq']
+    assert schema.field_name(99) == '99'
+    assert schema.converter(99)('1') == '1'
+    with pytest.raises(KeyError):
+        schema.field_number('not_a_field')
+
+
+def test_convert_named_keys():
+    schema = RECORD_SCHEMAS['vrq']
+    assert schema.convert_named_keys({'site_name': 'BARKER', 'request_code': '1'}) == {1: 'BARKER', 3: 1}
+
+
+def test_typed_and_friendly_data():
+    schema = RECORD_SCHEMAS['vrq']
+    data = {1: 'BARKER', 3: '1', 99: 'x', 100: 'y'}
+    assert schema.typed_data(data, exclude={100}) == {1: 'BARKER', 3: 1, 99: 'x'}
+    assert schema.friendly_data(data, exclude={100}) == {'site_name': 'BARKER', 'request_code': 1, '99': 'x'}
+
+
+def test_empty_schema():
+    assert EMPTY_SCHEMA.typed_data({1: 'a'}) == {1: 'a'}
+    assert RecordSchema('xyz', {}).friendly_data({1: 2}) == {'1': '2'}
@@ -0,0 +1,179 @@
+import pytest
+
+from venue.vif_cache import CachedVIFGateway, MessageViewCache, TTLCache
+from venue.vif_gateway import VIFGateway, VIFGatewayError
+from venue.vif_message import VIFMessage
+from venue.vif_seat_map import SeatLayout, SeatMap, find_best_seats, split_seat_name
+
+
+def seats_response(seat_names):
+    fields = ''.join('{%d}%s' % (i + 1, name) for i, name in enumerate(seat_names))
+    return VIFMessage(content='{vrp}{1}BARKER{2}6000!\n{pl4}' + fields)
+
+
+ALL_SEATS = ['A 3', 'A 2', 'A 1', 'B 1', 'B 2', 'B 3', 'B 4', 'C 1', 'C 2']
+
+
+@pytest.fixture
+def layout():
+    return SeatLayout.from_message(seats_response(ALL_SEATS))
+
+
+@pytest.mark.parametrize('seat_name, expected', [
+    ('N 22', ('N', 22)),
+    ('AA12', ('AA', 12)),
+    (' B  7 ', ('B', 7)),
+    ('Box', ('Box', 0)),
+])
+def test_split_seat_name(seat_name, expected):
+    assert split_seat_name(seat_name) == expected
+
+
+def test_layout_indexes_rows_and_numbers(layout):
+    assert len(layout) == 9
+    assert layout.rows == ['A', 'B', 'C']
+    assert layout.position('B 2') == 4
+    assert layout.row('C 1') == 'C'
+    # Row positions are ordered by seat number
+    assert [layout.seat_names[p] for p in layout.row_seats['A']] == ['A 1', 'A 2', 'A 3']
+    with pytest.raises(KeyError):
+        layout.position('Z 1')
+
+
+def test_seat_map_membership_and_counts(layout):
+    available = SeatMap.from_message(layout, seats_response(['A 1', 'B 2', 'B 3', 'C 2']))
+    assert 'B 2' in available
+    assert 'B 1' not in available
+    assert 'Z 9' not in available
+    assert len(available) == 4
+    assert available.seat_names() == ['A 1', 'B 2', 'B 3', 'C 2']
+    assert list(available.row_counts().items()) == [('A', 1), ('B', 2), ('C', 1)]
+    assert len(available.bits) == 2
+
+
+def test_seat_map_set_operations(layout):
+    available = SeatMap.from_seats(layout, ['A 1', 'B 2', 'B 3', 'C 2'])
+    held = SeatMap.from_seats(layout, ['B 3', 'C 1'])
+    assert (available - held).seat_names() == ['A 1', 'B 2', 'C 2']
+    assert (available & held).seat_names() == ['B 3']
+    assert len(available | held) == 5
+    assert len(~available) == 5
+    assert ~~available == available
+
+
+def test_seat_map_add_and_discard(layout):
+    seat_map = SeatMap(layout)
+    seat_map.add('C 2')
+    seat_map.add(0)
+    seat_map.discard('A 3')
+    assert seat_map.seat_names() == ['C 2']
+
+
+def test_set_operations_need_same_layout(layout):
+    other = SeatLayout(['X 1'])
+    with pytest.raises(ValueError):
+        SeatMap(layout) & SeatMap(other)
+
+
+def test_cached_gateway_builds_seat_map(monkeypatch):
+    requests = []
+
+    def get_session_seats(self, session_number, availability=0):
+        requests.append(availability)
+        return seats_response(ALL_SEATS if availability == 0 else ['A 1', 'C 2'])
+
+    monkeypatch.setattr(VIFGateway, 'get_session_seats', get_session_seats)
+    monkeypatch.setattr(CachedVIFGateway, 'session_seats_cache', TTLCache(ttl=5))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_layouts', TTLCache(ttl=60))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_maps', MessageViewCache(None))
+    gateway = CachedVIFGateway(host='10.0.0.1', site_name='BARKER')
+    seat_map = gateway.session_seat_map(132417)
+    assert seat_map.seat_names() == ['A 1', 'C 2']
+    assert gateway.session_seat_map('132417') is seat_map
+    assert requests == [0, 1]
+
+
+@pytest.mark.parametrize('reply', [
+    VIFMessage(content='{vrp}{1}BARKER{2}6000{3}1{4}12{5}Invalid auth!'),
+    VIFMessage(content='{vrp}{1}BARKER{2}6000!'),
+])
+def test_cached_gateway_does_not_cache_unusable_layouts(monkeypatch, reply):
+    def get_session_seats(self, session_number, availability=0):
+        if self.auth_info == 'wrong':
+            return reply
+        return seats_response(ALL_SEATS if availability == 0 else ['A 1', 'C 2'])
+
+    monkeypatch.setattr(VIFGateway, 'get_session_seats', get_session_seats)
+    monkeypatch.setattr(CachedVIFGateway, 'session_seats_cache', TTLCache(ttl=5))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_layouts', TTLCache(ttl=60))
+    monkeypatch.setattr(CachedVIFGateway, 'seat_maps', MessageViewCache(None))
+    # Nothing is cached, so the bad reply is fetched (and rejected) again
+    for _ in range(2):
+        with pytest.raises(VIFGatewayError):
+            CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='wrong').session_layout(132417)
+    gateway = CachedVIFGateway(host='10.0.0.1', site_name='BARKER', auth_info='108193016648')
+    assert len(gateway.session_layout(132417)) == 9
+    assert gateway.best_seats(132417, 1) in (['A 1'], ['C 2'])
+
+
+def auditorium(rows='ABCDE', numbers=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10)):
+    return SeatLayout(['{} {}'.format(row, number) for row in rows for number in numbers])
+
+
+def test_layout_splits_rows_at_numbering_gaps():
+    layout = auditorium('A', (1, 2, 3, 5, 6))
+    assert [[layout.seat_names[p] for p in run] for _, _, run in layout.segments] == \
+        [['A 1', 'A 2', 'A 3'], ['A 5', 'A 6']]
+
+
+def test_best_seats_prefer_centre_of_ideal_row():
+    layout = auditorium('ABCDEF')
+    assert find_best_seats(SeatMap.full(layout), 2) == ['D 5', 'D 6']
+    assert find_best_seats(SeatMap.full(layout), 3) in (['D 4', 'D 5', 'D 6'], ['D 5', 'D 6', 'D 7'])
+
+
+def test_layout_orders_rows_front_to_back():
+    layout = SeatLayout(['AA 1', 'B 1', 'Z 1', 'A 1', '10 1', '2 1'])
+    assert layout.rows == ['2', '10', 'A', 'B', 'Z', 'AA']
+    assert layout.row('A 1') == 'A'
+    assert list(layout.row_seats) == layout.rows
+
+
+def test_best_seats_ideal_row_ignores_host_seat_order():
+    rows = 'ABCDEF'
+    front_first = auditorium(rows)
+    back_first = SeatLayout(reversed(front_first.seat_names))
+    for layout in (front_first, back_first):
+        assert find_best_seats(SeatMap.full(layout), 2, ideal_row=0) == ['A 5', 'A 6']
+        assert find_best_seats(SeatMap.full(layout), 2, ideal_row=1) == ['F 5', 'F 6']
+
+
+def test_best_seats_skip_taken_seats_and_gaps():
+    layout = auditorium('AB', (1, 2, 3, 5, 6, 7))
+    available = SeatMap.from_seats(layout, ['A 2', 'A 3', 'A 5', 'B 1', 'B 5', 'B 6', 'B 7'])
+    # A 3 and A 5 aren't adjacent
+    assert find_best_seats(available, 3) == ['B 5', 'B 6', 'B 7']
+    assert find_best_seats(available, 4) == []
+    assert find_best_seats(available, 0) == []
+
+
+def test_best_seats_avoid_leaving_a_single_seat():
+    layout = auditorium('A', range(1, 13))
+    available = SeatMap.from_seats(layout, ['A 5', 'A 6', 'A 7', 'A 8'])
+    # A 6 and A 7 are central but would strand A 5 and A 8
+    assert find_best_seats(available, 2) == ['A 5', 'A 6']
+
+
+def test_seat_map_compact_encodings(layout):
+    available = SeatMap.from_seats(layout, ['A 1', 'B 2', 'B 3', 'C 2'])
+    # Positions 2, 4, 5 and 8
+    assert available.runs() == [2, 1, 1, 2, 2, 1]
+    assert SeatMap.from_runs(layout, available.runs()) == available
+    assert SeatMap.from_base64(layout, available.to_base64()) == available
+    assert SeatMap(layout).runs() == [9]
+    assert SeatMap.full(layout).runs() == [0, 9]
+    assert available.etag() != SeatMap(layout).etag()
+    with pytest.raises(ValueError):
+        SeatMap.from_runs(layout, [2, 1])
+    with pytest.raises(ValueError):
+        SeatMap.from_base64(layout, 'AAAA')
@@ -0,0 +1,95 @@
+import pytest
+
+from venue.vif_gateway import VIFResponseError
+from venue.vif_message import VIFMessage
+from venue.vif_snapshot import SnapshotStore, index_records
+
+HEADER = '{vrp}{1}BARKER{2}6000!'
+HDR = '\n{hdr}{1}VIFGateway.exe{2}%s{4}2'
+MOVIES = ('\n{mov}{3}Moana{5}MOANA{7}107'
+          '\n{mov}{3}Amelie{5}AMELIE{7}122')
+SESSIONS = ('\n{ssn}{1}132417{4}Cinema 02{5}MOANA{8}20170110100000'
+            '\n{ssn}{1}132418{4}Cinema 02{5}MOANA{8}20170110130000')
+PRICES = ('\n{prl}{1}STD{2}ADULT{4}15.5'
+          '\n{prl}{1}STD{2}CHILD{4}11.0')
+
+
+def message(*parts):
+    return VIFMessage(content=HEADER + ''.join(parts), lazy=True)
+
+
+def test_records_are_keyed_by_natural_key():
+    records = index_records(message(HDR % '1', MOVIES, SESSIONS, PRICES))
+    assert list(records) == [('mov', ('MOANA',)), ('mov', ('AMELIE',)), ('ssn', (132417,)), ('ssn', (132418,)),
+                             ('prl', ('STD', 'ADULT', None)), ('prl', ('STD', 'CHILD', None))]
+    # Keys come from the raw text, so indexing leaves lazy records unparsed
+    assert not any(record._loaded for record in records.values())
+
+
+def test_first_request_returns_full_snapshot():
+    store = SnapshotStore()
+    version = store.update('BARKER', message(MOVIES, SESSIONS))
+    changes = store.changes('BARKER')
+    assert changes['version'] == version
+    assert changes['full']
+    assert [m['movie_code'] for m in changes['inserted']['mov']] == ['MOANA', 'AMELIE']
+    assert len(changes['inserted']['ssn']) == 2
+
+
+def test_changes_since_version():
+    store = SnapshotStore()
+    first = store.update('BARKER', message(HDR % '1', MOVIES, SESSIONS))
+    second = store.update('BARKER', message(
+        HDR % '2',
+        '\n{mov}{3}Moana{5}MOANA{7}110',
+        '\n{ssn}{1}132418{4}Cinema 02{5}MOANA{8}20170110130000',
+        '\n{ssn}{1}132419{4}Cinema 01{5}MOANA{8}20170110150000'))
+    assert second > first
+    changes = store.changes('BARKER', since=first)
+    assert not changes['full']
+    assert changes['inserted'] == {'ssn': [{'session_number': 132419, 'venue_code': 'Cinema 01',
+                                            'movie_code': 'MOANA', 'start_time': '20170110150000'}]}
+    assert changes['updated'] == {'mov': [{'name': 'Moana', 'movie_code': 'MOANA', 'length': 110}]}
+    assert changes['deleted'] == {'mov': [{'movie_code': 'AMELIE'}], 'ssn': [{'session_number': 132417}]}
+    assert store.changes('BARKER', since=second)['inserted'] == {}
+
+
+def test_unchanged_response_keeps_version():
+    store = SnapshotStore()
+    first = store.update('BARKER', message(HDR % '1', MOVIES))
+    # Only the export header differs
+    assert store.update('BARKER', message(HDR % '2', MOVIES)) == first
+
+
+def test_changes_are_collapsed_across_versions():
+    store = SnapshotStore()
+    first = store.update('BARKER', message(MOVIES))
+    store.update('BARKER', message(MOVIES, SESSIONS))
+    store.update('BARKER', message('\n{mov}{3}Moana{5}MOANA{7}107', SESSIONS))
+    store.update('BARKER', message('\n{mov}{3}Moana{5}MOANA{7}107',
+                                   '\n{ssn}{1}132418{4}Cinema 02{5}MOANA{8}20170110130000'))
+    changes = store.changes('BARKER', since=first)
+    # 132417 was inserted then deleted, so it isn't reported at all
+    assert [s['session_number'] for s in changes['inserted']['ssn']] == [132418]
+    assert changes['deleted'] == {'mov': [{'movie_code': 'AMELIE'}]}
+    assert changes['updated'] == {}
+
+
+def test_unknown_or_expired_version_returns_full_snapshot():
+    store = SnapshotStore(max_history=1)
+    first = store.update('BARKER', message(MOVIES))
+    second = store.update('BARKER', message(MOVIES, SESSIONS))
+    third = store.update('BARKER', message(SESSIONS))
+    assert store.changes('BARKER', since=first)['full']
+    assert not store.changes('BARKER', since=second)['full']
+    assert store.changes('BARKER', since=third + 1000)['full']
+
+
+def test_error_reply_leaves_snapshot_unchanged():
+    store = SnapshotStore()
+    first = store.update('BARKER', message(MOVIES, SESSIONS))
+    with pytest.raises(VIFResponseError):
+        store.update('BARKER', VIFMessage(content='{vrp}{1}BARKER{2}6000{3}1{4}12{5}Invalid auth!', lazy=True))
+    changes = store.changes('BARKER', since=first)
+    assert changes['version'] == first
+    assert not changes['deleted']
@@ -117,3 +117,25 @@ def test_parse_friendly_data_into_ticket_array():
         100203: 1.0,
         100204: 'A 11'
     }
+
+
+def test_totals_tracked_as_tickets_are_added():
+    ticket_array = VIFTicketArray(record_code='q30')
+    assert ticket_array.total() == 0
+    ticket_array.add_ticket(ticket_code='BOUNT00', ticket_price=5, ticket_service_fee=1)
+    assert ticket_array.total() == 6
+    ticket_array.add_ticket(ticket_code='BOUNT00', ticket_price=7.5, ticket_service_fee=0.5)
+    assert ticket_array.total_ticket_prices() == 12.5
+    assert ticket_array.total_ticket_fees() == 1.5
+    assert ticket_array.total() == 14
+
+
+def test_totals_do_not_rebuild_friendly_data(monkeypatch):
+    ticket_array = VIFTicketArray(record_code='p30', data={
+        100101: 'BOUNT00', 100103: '10', 100108: '1.2',
+        100201: 'BOUNT00', 100203: '10', 100208: '1.2',
+    })
+    monkeypatch.setattr(VIFTicketArray, 'friendly_data', None)
+    assert ticket_array.total_ticket_prices() == 20.0
+    assert ticket_array.total_ticket_fees() == 2.4
+    assert ticket_array.sum_field('ticket_number') == 0
@@ -0,0 +1,144 @@
+import re
+
+import pytest
+
+from venue.vif_tokenizer import (VIFTokenizerError, extract_record_code, iter_decoded_chunks, iter_record_lines,
+                                 iter_stream_lines, split_message, tokenize_fields, tokenize_message, tokenize_record)
+
+# Regular expressions previously used by VIFMessage/VIFRecord, kept here as the
+# reference implementation the tokenizer must agree with
+MESSAGE_PATTERN = r'^(?P<header>\{.+?\}.*?)!(?P<body>.*?)(?:$|' + chr(3) + ')'
+VIF_RECORD_PATTERN = r'^(?!;)(?P<vif_record>\{.+\}.*)$'
+HEADER_PATTERN = r'(?:\{(?P<record_code>.{3})\})(?=\{|$)'
+KEY_VALUE_PATTERN = r'(?:\{(?P<key>\d+)\}(?P<value>.*?))(?=\{|$|\r)'
+
+GET_DATA_CONTENT = (
+    '{vrp}{1}BARKER{2}6000!;'
+    '\n;' + r'Ticketing VIF file, generated at 9:53;35.552pm by E:\Ven\bin\VIFGateway.exe'
+    '\n;'
+    '\n; Header'
+    '\n;'
+    '\n' + r'{hdr}{1}E:\Ven\bin\VIFGateway.exe{2}20170311215335{4}2'
+    '\n;'
+    '\n; Installation details'
+    '\n;'
+    '\n{ins}{2}Mt Barker Cinemas!{3}Wallis{4}BARKER{5}6{6}606{7}Australia'
+    '{8}Mt Barker Cinemas{9}6{10}6{11}05{12}20150625095222{13}WALLIS'
+    '{14}84 764 357 070{15}SA{16}1{41}2{42}10{43}10{51} {52} {55}20160513000000'
+    '\n;'
+    '\n; Distributors'
+    '\n;'
+    '\n{dis}{1}1{2}Filmways{3}0{17}11'
+    '\n{dis}{1}2{2}Fourth Wall{3}4WALL{17}11\r'
+    '\n{dis}{1}3{2}A Tiny House Documentary{3}A TINY{17}11'
+    '\n'
+    '\n{mov}{2}M{3}Moana{5}MOANA{11}A {strange} synopsis{12}}{13}Moana'
+    '\n{ssn}{1}132417{4}Cinema 02{5}MOANA{8}20170110100000{}{x}{38}'
+    '\n{prl}{1}STD{2}ADULT{4}15.5' + chr(3)
+)
+
+BOOKING_CONTENT = (
+    '{vrp}{1}NRLNGA{2}8edi!'
+    '{p30}{3}Cinema 03{4}Cinema Three{5}ROGUEONE{6}Rogue One: A Star Wars St'
+    '{7}20170111104500{9}4.8{10}44.8'
+    '{1001}A 13{1002}A 12{1003}A 11{1004}A 10{100001}4'
+    '{100101}BOUNT00{100103}10.0{100105}A 13{100106}Tkt Bounty Web{100108}1.2'
+    '{100201}BOUNT00{100203}10.0{100205}A 12{100206}Tkt Bounty Web{100208}1.2'
+)
+
+CODELESS_CONTENT = (
+    '{vrp}{1}BARKER{2}5CCB!'
+    '{1}15545{2}1777013{3}4242424242424242{4}1554551020{5}1{6}1{9}10{10}132417'
+)
+
+
+def regex_split_message(content):
+    match = re.compile(MESSAGE_PATTERN, re.DOTALL).match(content)
+    return match.group('header'), match.group('body')
+
+
+def regex_record_lines(body):
+    return [m.group(1) for m in re.compile(VIF_RECORD_PATTERN, re.MULTILINE).finditer(body)]
+
+
+def regex_record_code(raw_content):
+    match = re.search(HEADER_PATTERN, raw_content)
+    return match.group('record_code') if match else ''
+
+
+def regex_fields(raw_content):
+    return dict((int(m.group('key')), m.group('value'))
+                for m in re.compile(KEY_VALUE_PATTERN).finditer(raw_content))
+
+
+@pytest.mark.parametrize('content', [GET_DATA_CONTENT, BOOKING_CONTENT, CODELESS_CONTENT])
+def test_split_message_matches_regex(content):
+    assert split_message(content) == regex_split_message(content)
+
+
+@pytest.mark.parametrize('content', [GET_DATA_CONTENT, BOOKING_CONTENT, CODELESS_CONTENT])
+def test_record_lines_match_regex(content):
+    _, body = split_message(content)
+    assert list(iter_record_lines(body)) == regex_record_lines(body)
+
+
+@pytest.mark.parametrize('content', [GET_DATA_CONTENT, BOOKING_CONTENT, CODELESS_CONTENT])
+def test_tokenized_records_match_regex(content):
+    header, body = regex_split_message(content)
+    expected = [(regex_record_code(raw), regex_fields(raw)) for raw in [header] + regex_record_lines(body)]
+    assert list(tokenize_message(content)) == expected
+
+
+@pytest.mark.parametrize('raw_content', [
+    '{vrq}{1}BARKER{2}ABCD{3}1{4}Test{8}108193016648',
+    '{1}BARKER{2}ABCD{3}1{4}Test{8}108193016648',
+    '{q30}',
+    '{q30}{1}',
+    '{q30}{1}{2}{3}x',
+    '{dis}{1}2{2}Fourth Wall\r{3}4WALL',
+    '{mov}{3}Brace {in} value{4}}{5}{{6}a}b',
+    '{ssn}{1}1{12a}junk{2}2',
+    '{ssn}{1}1{2',
+])
+def test_tokenize_record_matches_regex(raw_content):
+    assert tokenize_record(raw_content) == (regex_record_code(raw_content), regex_fields(raw_content))
+
+
+def test_numeric_leading_token_is_not_a_record_code():
+    # The regex would have reported '100' as the record code here
+    assert extract_record_code('{100}{101}A') == ''
+    assert tokenize_fields('{100}{101}A') == {100: '', 101: 'A'}
+
+
+def test_body_without_terminator_excludes_trailing_newline():
+    assert split_message('{vrp}{1}A!{p01}{1}B\n') == ('{vrp}{1}A', '{p01}{1}B')
+
+
+@pytest.mark.parametrize('content', ['', 'no header', '{vrp', '{vrp}{1}BARKER'])
+def test_malformed_message_raises(content):
+    with pytest.raises(VIFTokenizerError):
+        split_message(content)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 64, 100000])
+@pytest.mark.parametrize('content', [GET_DATA_CONTENT, BOOKING_CONTENT, CODELESS_CONTENT])
+def test_stream_lines_match_whole_message(content, chunk_size):
+    chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+    header, body = split_message(content)
+    assert list(iter_stream_lines(chunks)) == [header] + list(iter_record_lines(body))
+
+
+def test_stream_lines_stop_at_terminator():
+    chunks = ['{vrp}{1}A!{p01}{1}B\n{p01}', '{1}C' + chr(3) + '{p01}{1}D']
+    assert list(iter_stream_lines(chunks)) == ['{vrp}{1}A', '{p01}{1}B', '{p01}{1}C']
+
+
+def test_stream_without_header_raises():
+    with pytest.raises(VIFTokenizerError):
+        list(iter_stream_lines(['{vrp}{1}A', chr(3)]))
+
+
+def test_decoded_chunks_handle_split_multibyte_characters():
+    encoded = u'{mov}{3}Am\xe9lie'.encode('utf-8')
+    chunks = [encoded[i:i + 1] for i in range(len(encoded))]
+    assert ''.join(iter_decoded_chunks(chunks)) == u'{mov}{3}Am\xe9lie'
@@ -3,18 +3,33 @@ import logging
 import base64
 import json
 import os
+from typing import Iterator
 
-from flask import Flask, abort, jsonify, make_response, request  # type: ignore
+from flask import Flask, Response, abort, jsonify, make_response, request  # type: ignore
 from flask_cors import cross_origin  # type: ignore
 from werkzeug.exceptions import HTTPException  # type: ignore
 
 
+from .vif_batch import DEFAULT_SITE_TIMEOUT, batch_get_data
+from .vif_cache import CachedVIFGateway
+from .vif_snapshot import SnapshotStore
 from .vif_gateway import VIFGateway
 from .vif_message import VIFMessage
 from .vif_detail_array import VIFTicketArray
+from .vif_seat_map import SeatMap
 
 PROJECT_ID = 'ticket-bounty'
 APP_ENV = os.environ.get('APP_ENV', 'dev')
+BATCH_MAX_SITES = 50
+BATCH_MAX_WORKERS = 10
+# Longest a whole batch may take, well inside App Engine's request deadline
+BATCH_DEADLINE = 2 * DEFAULT_SITE_TIMEOUT
+# Compact get_session_seats responses, see compact_session_seats
+SEAT_MAP_MIMETYPE = 'application/vnd.vif.seatmap+json'
+SEAT_MAP_FORMATS = ('bitmap', 'rle')
+
+# Last get_data response of each site, for /api/changes
+snapshot_store = SnapshotStore()
 
 
 app = Flask(__name__)
@@ -32,6 +47,27 @@ def validate_gateway_parameters(f):
     return decorator
 
 
+def stream_friendly_data(message):
+    # type: (VIFMessage) -> Iterator[str]
+    """
+    Serializes a message as {"data": {record_code: [...]}} one record at a
+    time, producing the same document as jsonify({'data': message.friendly_data()})
+    without building it in memory first.
+    """
+    yield '{"data": {'
+    for group_index, (record_code, records) in enumerate(message.record_groups().items()):
+        yield '{0}{1}: '.format(', ' if group_index else '', json.dumps(record_code))
+        # Record codes with a single record are returned as an object
+        if len(records) == 1:
+            yield json.dumps(records[0].friendly_data())
+            continue
+        yield '['
+        for record_index, record in enumerate(records):
+            yield '{0}{1}'.format(', ' if record_index else '', json.dumps(record.friendly_data()))
+        yield ']'
+    yield '}}'
+
+
 @app.errorhandler(500)
 def unexpected_error(e):
     """Handle exceptions by returning swagger-compliant json."""
@@ -56,10 +92,67 @@ def gae_health_check():
 @app.route('/api/get_data', methods=['GET'])
 @validate_gateway_parameters
 def get_data(venue_parameters):
-    gateway = VIFGateway(**venue_parameters)
+    gateway = CachedVIFGateway(**venue_parameters)
     response = gateway.get_data()  # type: VIFMessage
+    return Response(stream_friendly_data(response), mimetype='application/json')
+
+
+@app.route('/api/changes', methods=['GET'])
+@validate_gateway_parameters
+def changes(venue_parameters):
+    gateway = CachedVIFGateway(**venue_parameters)
+
+    # GET parameters
+    since = request.args.get('since')
+    if since is not None and not since.isdigit():
+        response = jsonify({
+            'code': 400,
+            'message': 'since must be a version number'})
+        response.status_code = 400
+        return response
+
+    # Snapshots are kept per set of credentials, so one caller can't change what another sees
+    site = gateway.site_key()
+    snapshot_store.update(site, gateway.get_data())
     return jsonify({
-        'data': response.friendly_data()
+        'data': snapshot_store.changes(site, since=None if since is None else int(since))
+    })
+
+
+@app.route('/api/sessions', methods=['GET'])
+@validate_gateway_parameters
+def sessions(venue_parameters):
+    gateway = CachedVIFGateway(**venue_parameters)
+
+    # GET parameters
+    sessions = gateway.get_data_index().find_sessions(
+        movie_code=request.args.get('movie_code'),
+        venue_code=request.args.get('venue_code'),
+        start=request.args.get('from'),
+        end=request.args.get('to'))
+    return jsonify({
+        'data': [session.friendly_data() for session in sessions]
+    })
+
+
+@app.route('/api/showtimes', methods=['GET'])
+@validate_gateway_parameters
+def showtimes(venue_parameters):
+    gateway = CachedVIFGateway(**venue_parameters)
+    return Response(gateway.showtimes().json(), mimetype='application/json')
+
+
+@app.route('/api/prices', methods=['GET'])
+@validate_gateway_parameters
+def prices(venue_parameters):
+    gateway = CachedVIFGateway(**venue_parameters)
+
+    # GET parameters
+    price_group_code = request.args.get('price_group_code')
+
+    prices = gateway.get_data_index().find_prices(price_group_code)
+    return jsonify({
+        'data': [price.friendly_data() for price in prices]
     })
 
 
@@ -90,22 +183,142 @@ def verify_booking(venue_parameters):
 @app.route('/api/get_session_seats', methods=['GET'])
 @validate_gateway_parameters
 def get_session_seats(venue_parameters):
-    gateway = VIFGateway(**venue_parameters)
+    gateway = CachedVIFGateway(**venue_parameters)
 
     # GET parameters
     session_number = request.args.get('session_number')
     availability = request.args.get('availability', 0)
 
+    seat_map_format = request.args.get('format')
+    if seat_map_format is None and \
+            request.accept_mimetypes.best_match(['application/json', SEAT_MAP_MIMETYPE]) == SEAT_MAP_MIMETYPE:
+        seat_map_format = 'bitmap'
+    if seat_map_format not in (None, 'json'):
+        return compact_session_seats(gateway, session_number, availability, seat_map_format)
+
     response = gateway.get_session_seats(session_number, availability)  # type: VIFMessage
     return jsonify({
         'data': response.data()
     })
 
 
+def compact_session_seats(gateway, session_number, availability, seat_map_format):
+    # type: (CachedVIFGateway, str, str, str) -> Response
+    """
+    Returns the seats of a session as a seat map over its layout (see
+    /api/session_layout) rather than by name. Unchanged seat maps are
+    answered with 304 Not Modified when polled with If-None-Match.
+    """
+    if seat_map_format not in SEAT_MAP_FORMATS or not str(session_number or '').isdigit() or \
+            str(availability) not in ('0', '1', '2'):
+        response = jsonify({
+            'code': 400,
+            'message': 'session_number, availability (0, 1 or 2) and format ({}) are required'.format(
+                ', '.join(SEAT_MAP_FORMATS))})
+        response.status_code = 400
+        return response
+
+    session = int(session_number)
+    availability_code = int(availability)
+    if availability_code == 0:
+        seat_map = SeatMap.full(gateway.session_layout(session))
+    else:
+        seat_map = gateway.session_seat_map(session)
+        if availability_code == 2:
+            seat_map = ~seat_map
+    data = {
+        'session_number': session,
+        'availability': availability_code,
+        'layout': seat_map.layout.etag,
+        'size': seat_map.layout.size
+    }
+    if seat_map_format == 'rle':
+        data['runs'] = seat_map.runs()
+    else:
+        data['bitmap'] = seat_map.to_base64()
+
+    response = Response(json.dumps({'data': data}), mimetype=SEAT_MAP_MIMETYPE)
+    response.set_etag('{}-{}'.format(seat_map.etag(), seat_map_format))
+    response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+
+@app.route('/api/session_layout', methods=['GET'])
+@validate_gateway_parameters
+def session_layout(venue_parameters):
+    """Returns the seat names of a session in layout position order, for decoding compact seat maps."""
+    gateway = CachedVIFGateway(**venue_parameters)
+
+    # GET parameters
+    session_number = request.args.get('session_number')
+
+    if not str(session_number or '').isdigit():
+        response = jsonify({
+            'code': 400,
+            'message': 'session_number is required'})
+        response.status_code = 400
+        return response
+
+    layout = gateway.session_layout(session_number)
+    response = jsonify({
+        'data': {'etag': layout.etag, 'rows': layout.rows, 'seats': list(layout.seat_names)}
+    })
+    response.set_etag(layout.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = int(CachedVIFGateway.seat_layouts.ttl)
+    return response.make_conditional(request)
+
+
+@app.route('/api/best_seats', methods=['GET', 'POST'])
+@validate_gateway_parameters
+def best_seats(venue_parameters):
+    """
+    GET finds the best `count` adjacent available seats of a session. POST
+    takes init_transaction data instead, finds a seat for each of its
+    tickets and starts the transaction with them.
+    """
+    gateway = CachedVIFGateway(**venue_parameters)
+
+    if request.method == 'POST':
+        data = dict(request.json.get('data') or {})
+        session_number = data.get('session_number')
+        tickets = data.get('tickets') or []
+        count = len(tickets)
+    else:
+        session_number = request.args.get('session_number')
+        count = request.args.get('count', '')
+
+    if not str(session_number or '').isdigit() or not str(count).isdigit() or not int(count):
+        response = jsonify({
+            'code': 400,
+            'message': 'session_number and a number of seats (count, or tickets when booking) are required'})
+        response.status_code = 400
+        return response
+
+    seats = gateway.best_seats(session_number, int(count))
+    if not seats:
+        response = jsonify({
+            'code': 409,
+            'message': 'No {} adjacent seats are available'.format(count)})
+        response.status_code = 409
+        return response
+    if request.method == 'GET':
+        return jsonify({
+            'data': {'session_number': int(session_number), 'seats': seats}
+        })
+
+    data['tickets'] = [dict(ticket, seat_name=seat) for ticket, seat in zip(tickets, seats)]
+    response = gateway.init_transaction(data=data)  # type: VIFMessage
+    return jsonify({
+        'data': {'seats': seats, 'transaction': response.friendly_data()}
+    })
+
+
 @app.route('/api/init_transaction', methods=['POST'])
 @validate_gateway_parameters
 def init_transaction(venue_parameters):
-    gateway = VIFGateway(**venue_parameters)
+    gateway = CachedVIFGateway(**venue_parameters)
 
     # POST parameters
     data = request.json.get('data')
@@ -119,7 +332,7 @@ def init_transaction(venue_parameters):
 @app.route('/api/free_seats', methods=['POST'])
 @validate_gateway_parameters
 def free_seats(venue_parameters):
-    gateway = VIFGateway(**venue_parameters)
+    gateway = CachedVIFGateway(**venue_parameters)
 
     # POST parameters
     data = request.json.get('data')
@@ -133,7 +346,7 @@ def free_seats(venue_parameters):
 @app.route('/api/commit_transaction', methods=['POST'])
 @validate_gateway_parameters
 def commit_transaction(venue_parameters):
-    gateway = VIFGateway(**venue_parameters)
+    gateway = CachedVIFGateway(**venue_parameters)
 
     # POST parameters
     data = request.json.get('data')
@@ -144,6 +357,45 @@ def commit_transaction(venue_parameters):
     })
 
 
+@app.route('/api/batch/get_data', methods=['POST'])
+def batch_get_data_endpoint():
+    # POST parameters
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        response = jsonify({
+            'code': 400,
+            'message': 'Request body must be a JSON object'})
+        response.status_code = 400
+        return response
+    sites = body.get('sites')
+    detail_required = body.get('detail_required', 2)
+    timeout = body.get('timeout', DEFAULT_SITE_TIMEOUT)
+
+    if not isinstance(sites, list) or not 0 < len(sites) <= BATCH_MAX_SITES:
+        response = jsonify({
+            'code': 400,
+            'message': 'sites must be a list of 1 to {} venue parameter sets'.format(BATCH_MAX_SITES)})
+        response.status_code = 400
+        return response
+    try:
+        site_timeout = float(timeout)
+    except (TypeError, ValueError):
+        site_timeout = 0.0
+    if not site_timeout > 0:
+        response = jsonify({
+            'code': 400,
+            'message': 'timeout must be a positive number of seconds'})
+        response.status_code = 400
+        return response
+
+    results = batch_get_data(sites, detail_required=detail_required,
+                             max_workers=BATCH_MAX_WORKERS, timeout=min(site_timeout, DEFAULT_SITE_TIMEOUT),
+                             deadline=BATCH_DEADLINE)
+    return jsonify({
+        'data': results
+    })
+
+
 # GOOGLE CLOUD ENDPOINTS AUTHENTICATION INFORMATION
 def _base64_decode(encoded_str):
     # Add paddings manually if necessary.
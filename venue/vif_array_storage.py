@@ -0,0 +1,132 @@
+from array import array
+from typing import Any, Callable, Dict, Iterator, List
+
+from .vif_schema import RecordSchema
+
+# Typed columns for numeric fields, anything else is kept in a plain list
+COLUMN_TYPECODES = {
+    float: 'd',
+    int: 'l'
+}  # type: Dict[Callable, str]
+
+
+class RowStorage(list):
+    """
+    Default array item storage: a list holding one {field_number: value}
+    dictionary per item.
+    """
+    __slots__ = ()
+
+    def __init__(self, schema):
+        # type: (RecordSchema) -> None
+        super(RowStorage, self).__init__()
+
+    def column(self, field_number):
+        # type: (int) -> List[Any]
+        return [item.get(field_number) for item in self]
+
+    def column_sum(self, field_number, converter=float):
+        # type: (int, Callable) -> float
+        total = float(0)
+        for item in self:
+            if field_number in item:
+                total += float(converter(item[field_number]))
+        return total
+
+
+class ColumnarStorage(object):
+    """
+    Struct-of-arrays item storage. Each field number maps to a column holding
+    one value per item: array('d') for float fields, array('l') for integer
+    fields and a list for everything else. Numeric columns track which items
+    actually have a value in a parallel bytearray; list columns use None.
+    """
+    __slots__ = ('_schema', '_length', '_columns', '_present')
+
+    def __init__(self, schema):
+        # type: (RecordSchema) -> None
+        self._schema = schema
+        self._length = 0
+        self._columns = {}  # type: Dict[int, Any]
+        self._present = {}  # type: Dict[int, bytearray]
+
+    def __len__(self):
+        # type: () -> int
+        return self._length
+
+    def __iter__(self):
+        # type: () -> Iterator[Dict[int, Any]]
+        columns = list(self._columns.items())
+        present = self._present
+        for i in range(self._length):
+            item = {}
+            for field_number, column in columns:
+                if field_number in present:
+                    if present[field_number][i]:
+                        item[field_number] = column[i]
+                elif column[i] is not None:
+                    item[field_number] = column[i]
+            yield item
+
+    def _add_column(self, field_number):
+        # type: (int) -> Any
+        typecode = COLUMN_TYPECODES.get(self._schema.converters.get(field_number))
+        if typecode is None:
+            column = [None] * self._length  # type: Any
+        else:
+            column = array(typecode, [0] * self._length)
+            self._present[field_number] = bytearray(self._length)
+        self._columns[field_number] = column
+        return column
+
+    def _demote_column(self, field_number):
+        # type: (int) -> List[Any]
+        # Value couldn't be stored in a typed column, fall back to a list
+        present = self._present.pop(field_number)
+        column = [value if present[i] else None for i, value in enumerate(self._columns[field_number])]
+        self._columns[field_number] = column
+        return column
+
+    def append(self, item):
+        # type: (Dict[int, Any]) -> None
+        for field_number, value in item.items():
+            column = self._columns.get(field_number)
+            if column is None:
+                column = self._add_column(field_number)
+            if field_number in self._present:
+                try:
+                    column.append(self._schema.converters[field_number](value))
+                    self._present[field_number].append(1)
+                    continue
+                except (TypeError, ValueError, OverflowError):
+                    column = self._demote_column(field_number)
+            column.append(value)
+        self._length += 1
+        # Pad columns this item has no value for
+        for field_number, column in self._columns.items():
+            if len(column) < self._length:
+                if field_number in self._present:
+                    column.append(0)
+                    self._present[field_number].append(0)
+                else:
+                    column.append(None)
+
+    def column(self, field_number):
+        # type: (int) -> List[Any]
+        column = self._columns.get(field_number)
+        if column is None:
+            return [None] * self._length
+        if field_number in self._present:
+            present = self._present[field_number]
+            return [value if present[i] else None for i, value in enumerate(column)]
+        return list(column)
+
+    def column_sum(self, field_number, converter=float):
+        # type: (int, Callable) -> float
+        column = self._columns.get(field_number)
+        if column is None:
+            return float(0)
+        if field_number in self._present:
+            # Missing values are stored as zero so the column can be summed as is
+            return float(sum(column))
+        return sum(float(converter(value)) for value in column if value is not None)
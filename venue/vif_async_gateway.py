@@ -0,0 +1,107 @@
+"""
+asyncio client for the Venue gateway. Requires Python 3.5.2+ and is not
+imported by the App Engine app, which runs on Python 2.7.
+"""
+import asyncio
+import logging
+from typing import Dict
+
+from .vif_gateway import VIFConnectionClosedError, VIFGateway, VIFGatewayError
+from .vif_message import VIFMessage
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncVIFGateway(object):
+    """
+    Non-blocking counterpart of VIFGateway built on asyncio streams. Each
+    request opens its own connection, so a single event loop can have many
+    requests to different hosts in flight at once. Optionally a semaphore can
+    be passed in to cap the number of concurrent requests.
+
+    Requests are built and responses labelled by a wrapped VIFGateway, so
+    both clients send identical messages. Streaming responses (iter_records)
+    aren't offered, as async generators need Python 3.6.
+    """
+    DEFAULT_PORT = VIFGateway.DEFAULT_PORT
+    SOCKET_TIMEOUT = VIFGateway.SOCKET_TIMEOUT
+    # Largest response readuntil() will buffer before giving up
+    STREAM_LIMIT = 64 * 1024 * 1024
+    VIFGatewayError = VIFGatewayError
+
+    def __init__(self, host=None, auth_info=None, site_name=None,
+                 comment=None, gateway_type=0, semaphore=None):
+        # type: (str, str, str, str, int, asyncio.Semaphore) -> None
+        self.gateway = VIFGateway(host=host, auth_info=auth_info, site_name=site_name,
+                                  comment=comment, gateway_type=gateway_type)
+        self.host = host
+        self.semaphore = semaphore
+
+    async def _exchange(self, request):
+        # type: (bytearray) -> bytes
+        reader, writer = await asyncio.open_connection(self.host, self.DEFAULT_PORT, limit=self.STREAM_LIMIT)
+        try:
+            writer.write(request)
+            await writer.drain()
+            # Response is terminated by an ETX (ascii 3)
+            return await reader.readuntil(b'\x03')
+        except asyncio.IncompleteReadError as e:
+            raise VIFConnectionClosedError('Connection closed before the response was terminated', len(e.partial))
+        except asyncio.LimitOverrunError:
+            raise VIFGatewayError('Response exceeds {0} bytes'.format(self.STREAM_LIMIT))
+        finally:
+            writer.close()
+
+    async def send_message(self, message):
+        # type: (VIFMessage) -> VIFMessage
+        request = self.gateway._encode_request(message)
+        if self.semaphore is None:
+            response = await asyncio.wait_for(self._exchange(request), self.SOCKET_TIMEOUT)
+        else:
+            async with self.semaphore:
+                response = await asyncio.wait_for(self._exchange(request), self.SOCKET_TIMEOUT)
+        response_text = response.decode('utf-8')
+        logger.debug("RESPONSE: %s", response_text)
+        return VIFMessage(content=response_text, lazy=True)
+
+    async def handshake(self):
+        # type: () -> VIFMessage
+        response = await self.send_message(self.gateway._request_message(1))
+        return self.gateway._set_response_record_code(response, 'p01')
+
+    async def get_data(self, detail_required=2):
+        # type: (int) -> VIFMessage
+        """See VIFGateway.get_data."""
+        body_data = {'detail_required': detail_required}
+        return await self.send_message(self.gateway._request_message(2, 'q02', body_data))
+
+    async def verify_booking(self, alternate_booking_key):
+        # type: (str) -> VIFMessage
+        """See VIFGateway.verify_booking."""
+        body_data = {'alternate_booking_key': alternate_booking_key}
+        response = await self.send_message(self.gateway._request_message(42, 'q42', body_data))
+        return self.gateway._set_response_record_code(response, 'p42')
+
+    async def get_session_seats(self, session_number, availability=0):
+        # type: (int, int) -> VIFMessage
+        """See VIFGateway.get_session_seats."""
+        body_data = {
+            'session_number': session_number,
+            'availability': availability
+        }
+        return await self.send_message(self.gateway._request_message(20, 'q20', body_data))
+
+    async def init_transaction(self, data):
+        # type: (Dict) -> VIFMessage
+        """See VIFGateway.init_transaction."""
+        return await self.send_message(self.gateway._request_message(30, 'q30', data))
+
+    async def free_seats(self, data):
+        # type: (Dict) -> VIFMessage
+        """See VIFGateway.free_seats."""
+        return await self.send_message(self.gateway._request_message(17, 'q17', data))
+
+    async def commit_transaction(self, data):
+        # type: (Dict) -> VIFMessage
+        """See VIFGateway.commit_transaction."""
+        return await self.send_message(self.gateway._request_message(31, 'q31', data))
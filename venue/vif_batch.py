@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from typing import Any, Callable, Dict, List, Optional
+
+from .vif_cache import CachedVIFGateway
+from .vif_gateway import VIFGateway
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_SITE_TIMEOUT = 20.0
+# How often pending sites are checked against their timeout
+POLL_INTERVAL = 0.05
+
+VENUE_PARAMETERS = ('host', 'site_name', 'auth_info')
+
+
+def _site_result(venue_parameters):
+    # type: (Any) -> Dict[str, Any]
+    if not isinstance(venue_parameters, dict):
+        return {
+            'site_name': None,
+            'host': None,
+            'error': {'code': 400, 'message': 'Venue parameters must be an object'}
+        }
+    return {
+        'site_name': venue_parameters.get('site_name'),
+        'host': venue_parameters.get('host')
+    }
+
+
+def fan_out(sites, request, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_SITE_TIMEOUT, gateway_class=VIFGateway,
+            deadline=None):
+    # type: (List[Any], Callable[[VIFGateway], Any], int, float, type, Optional[float]) -> List[Dict[str, Any]]
+    """
+    Calls `request(gateway)` for each set of venue parameters (host, site_name
+    and auth_info) with at most `max_workers` sites queried at once.
+
+    Returns one result per site, in the order given, holding either the
+    request's return value under 'data' or an 'error' with a code and
+    message. A site that fails, isn't given as a dict of venue parameters, or
+    hasn't answered `timeout` seconds after its request started, doesn't
+    affect the results of the other sites.
+
+    A timed out request keeps its worker busy until its socket gives up, so
+    the whole batch is also bounded: by however long the sites would take in
+    full waves of `max_workers`, or by `deadline` seconds if that's sooner.
+    Sites still pending by then are reported as timed out and the ones not
+    yet started are never sent.
+    """
+    results = [_site_result(venue_parameters) for venue_parameters in sites]
+    valid = [i for i, result in enumerate(results) if 'error' not in result]
+    if not valid:
+        return results
+    workers = min(max_workers, len(valid))
+    waves_deadline = timeout * -(-len(valid) // workers)
+    deadline = waves_deadline if deadline is None else min(deadline, waves_deadline)
+    started = {}  # type: Dict[int, float]
+    started_lock = threading.Lock()
+    abandoned = threading.Event()
+
+    def run(index):
+        if abandoned.is_set():
+            return None
+        with started_lock:
+            started[index] = time.time()
+        venue_parameters = dict((k, v) for k, v in sites[index].items() if k in VENUE_PARAMETERS)
+        return request(gateway_class(**venue_parameters))
+
+    pool = ThreadPool(workers)
+    batch_end = time.time() + deadline
+    try:
+        pending = dict((i, pool.apply_async(run, (i,))) for i in valid)
+        while pending:
+            now = time.time()
+            for index, async_result in list(pending.items()):
+                if async_result.ready():
+                    del pending[index]
+                    try:
+                        results[index]['data'] = async_result.get()
+                    except Exception as e:
+                        logger.warning('Request to %s failed: %s', results[index]['host'], e)
+                        results[index]['error'] = {'code': 502, 'message': 'Exception: {}'.format(e)}
+                    continue
+                with started_lock:
+                    start = started.get(index)
+                if start is not None and now - start > timeout:
+                    # The worker is left to finish (or hit its socket timeout) in the background
+                    del pending[index]
+                    results[index]['error'] = {'code': 504, 'message': 'Timed out after {} seconds'.format(timeout)}
+            if pending and now > batch_end:
+                for index in pending:
+                    results[index]['error'] = {'code': 504,
+                                               'message': 'Batch timed out after {} seconds'.format(deadline)}
+                break
+            if pending:
+                next(iter(pending.values())).wait(POLL_INTERVAL)
+    finally:
+        # Queued sites that haven't started yet are skipped by the workers
+        abandoned.set()
+        pool.close()
+    return results
+
+
+def batch_get_data(sites, detail_required=2, **kwargs):
+    # type: (List[Any], int, **Any) -> List[Dict[str, Any]]
+    """
+    Runs get_data against each site, answering from the get_data cache where
+    possible. See fan_out for the arguments and result format.
+    """
+    def get_data(gateway):
+        return gateway.get_data(detail_required).friendly_data()
+    kwargs.setdefault('gateway_class', CachedVIFGateway)
+    return fan_out(sites, get_data, **kwargs)
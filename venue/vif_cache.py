@@ -0,0 +1,331 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .vif_gateway import VIFGateway, VIFGatewayError, raise_for_response_code
+from .vif_message import VIFMessage
+from .vif_query import ShowtimesView, VIFRecordIndex
+from .vif_schema import RECORD_SCHEMAS
+from .vif_seat_map import SeatLayout, SeatMap, find_best_seats
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry(object):
+    __slots__ = ('value', 'expires')
+
+    def __init__(self, value, expires):
+        # type: (Any, float) -> None
+        self.value = value
+        self.expires = expires
+
+
+class _Flight(object):
+    """An upstream load in progress, shared by every caller asking for the same key."""
+    __slots__ = ('event', 'value', 'error', 'discard')
+
+    def __init__(self):
+        # type: () -> None
+        self.event = threading.Event()
+        self.value = None  # type: Any
+        self.error = None  # type: Optional[Exception]
+        # Set when the key is invalidated mid-load, the result may predate the change
+        self.discard = False
+
+
+class TTLCache(object):
+    """
+    Thread-safe cache whose entries are fresh for `ttl` seconds, holding at
+    most `max_size` entries and evicting the least recently used first.
+
+    An entry that has expired less than `stale_ttl` seconds ago is still
+    returned while a background thread reloads it (stale-while-revalidate).
+    Concurrent misses for the same key share a single load (single-flight).
+    """
+
+    def __init__(self, ttl, max_size=128, stale_ttl=0, clock=time.time):
+        # type: (float, int, float, Callable[[], float]) -> None
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._flights = {}  # type: Dict[Hashable, _Flight]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._entries)
+
+    def _store(self, key, value):
+        # type: (Hashable, Any) -> None
+        # Called with the lock held
+        self._entries.pop(key, None)
+        self._entries[key] = _CacheEntry(value, self.clock() + self.ttl)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load(self, key, load, flight):
+        # type: (Hashable, Callable[[], Any], _Flight) -> None
+        try:
+            flight.value = load()
+        except Exception as e:
+            flight.error = e
+        with self._lock:
+            if flight.error is None and not flight.discard:
+                self._store(key, flight.value)
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.event.set()
+
+    def _refresh_in_background(self, key, load, flight):
+        # type: (Hashable, Callable[[], Any], _Flight) -> None
+        def refresh():
+            self._load(key, load, flight)
+            if flight.error is not None:
+                logger.warning('Background refresh of %r failed: %s', key, flight.error)
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+    def get(self, key, load):
+        # type: (Hashable, Callable[[], Any]) -> Any
+        """Returns the cached value for `key`, calling `load()` to fetch it when needed."""
+        now = self.clock()
+        leader = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Mark as most recently used
+                del self._entries[key]
+                self._entries[key] = entry
+                if now < entry.expires:
+                    return entry.value
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            if entry is not None and now < entry.expires + self.stale_ttl:
+                if leader:
+                    self._refresh_in_background(key, load, flight)
+                return entry.value
+        if leader:
+            self._load(key, load, flight)
+        else:
+            flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def peek(self, key):
+        # type: (Hashable) -> Any
+        """Returns the cached value for `key` even if it has expired, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry.value
+
+    def set(self, key, value):
+        # type: (Hashable, Any) -> None
+        with self._lock:
+            self._store(key, value)
+
+    def invalidate(self, key):
+        # type: (Hashable) -> None
+        self.invalidate_where(lambda k: k == key)
+
+    def invalidate_where(self, predicate):
+        # type: (Callable[[Any], bool]) -> None
+        """Drops matching entries; loads already in progress for them won't be cached."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+            for key in [key for key in self._flights if predicate(key)]:
+                self._flights.pop(key).discard = True
+
+    def clear(self):
+        # type: () -> None
+        with self._lock:
+            self._entries.clear()
+
+
+class MessageViewCache(object):
+    """
+    Holds values derived from cached messages (e.g. an index), keyed like the
+    message cache. A value is rebuilt only once the message it was built from
+    has been replaced, i.e. once per refresh.
+    """
+
+    def __init__(self, build, max_size=64):
+        # type: (Callable[[VIFMessage], Any], int) -> None
+        self.build = build
+        self.max_size = max_size
+        self._entries = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def get(self, key, message, build=None):
+        # type: (Hashable, VIFMessage, Callable[[VIFMessage], Any]) -> Any
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                if entry[0] is message:
+                    return entry[1]
+        value = (build or self.build)(message)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (message, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+
+def _request_field(data, record_code, field_name):
+    # type: (Dict, str, str) -> Any
+    # Request data may use either field names or field numbers
+    if field_name in data:
+        return data[field_name]
+    return data.get(RECORD_SCHEMAS[record_code].field_number(field_name))
+
+
+class CachedVIFGateway(VIFGateway):
+    """
+    VIFGateway that answers get_data from a process-wide cache keyed by
+    (host, site_name, a hash of auth_info, detail_required), so gateways with
+    different credentials never share a response. Programme data rarely
+    changes, so a stale copy is served while it's being refreshed.
+
+    Seat maps from get_session_seats are cached for a few seconds per
+    session and set of credentials, and are dropped as soon as a booking operation for the same
+    session gets an answer from the host.
+    """
+    get_data_cache = TTLCache(ttl=float(os.environ.get('VIF_GET_DATA_TTL', 300)),
+                              max_size=int(os.environ.get('VIF_GET_DATA_CACHE_SIZE', 64)),
+                              stale_ttl=float(os.environ.get('VIF_GET_DATA_STALE_TTL', 900)))
+    session_seats_cache = TTLCache(ttl=float(os.environ.get('VIF_SESSION_SEATS_TTL', 5)),
+                                   max_size=int(os.environ.get('VIF_SESSION_SEATS_CACHE_SIZE', 1024)))
+    # Session each workstation's open transaction is for, as q31 commits don't carry one
+    transaction_sessions = TTLCache(ttl=3600, max_size=4096)
+    record_indexes = MessageViewCache(VIFRecordIndex)
+    showtimes_views = MessageViewCache(ShowtimesView)
+    # Auditorium layouts hardly ever change, availability is rebuilt per seat map refresh
+    seat_layouts = TTLCache(ttl=float(os.environ.get('VIF_SEAT_LAYOUT_TTL', 3600)), max_size=1024)
+    seat_maps = MessageViewCache(None, max_size=1024)
+
+    def _auth_hash(self):
+        # type: () -> str
+        # Credentials are hashed so they don't end up in logged cache keys
+        return hashlib.sha1((self.auth_info or '').encode('utf-8')).hexdigest()
+
+    def site_key(self):
+        # type: () -> Tuple[str, str, str]
+        """Identifies the site and the credentials used for it, e.g. to key per-site state."""
+        return self.host, self.site_name, self._auth_hash()
+
+    def _get_data_key(self, detail_required):
+        # type: (int) -> Tuple[str, str, str, int]
+        return self.host, self.site_name, self._auth_hash(), detail_required
+
+    def get_data(self, detail_required=2):
+        # type: (int) -> VIFMessage
+        """
+        See VIFGateway.get_data. The returned message is shared and must not be
+        modified. Error replies raise VIFResponseError and aren't cached.
+        """
+        def load():
+            return raise_for_response_code(super(CachedVIFGateway, self).get_data(detail_required)).load()
+        return self.get_data_cache.get(self._get_data_key(detail_required), load)
+
+    def get_data_index(self, detail_required=2):
+        # type: (int) -> VIFRecordIndex
+        """Returns the query index of the cached get_data response, built once per refresh."""
+        return self.record_indexes.get(self._get_data_key(detail_required), self.get_data(detail_required))
+
+    def showtimes(self, detail_required=2):
+        # type: (int) -> ShowtimesView
+        """Returns the showtimes view of the cached get_data response, built once per refresh."""
+        return self.showtimes_views.get(self._get_data_key(detail_required), self.get_data(detail_required))
+
+    def _invalidate_session_seats(self, session_number):
+        # type: (Any) -> None
+        site = (self.host, self.site_name)
+        session = None if session_number is None else int(session_number)
+
+        def matches(key):
+            # type: (Tuple[str, str, str, int, int]) -> bool
+            # Keys are (host, site_name, auth hash, session_number, availability)
+            host, site_name, _, key_session, _ = key
+            # Seat maps cached for every set of credentials are dropped, and
+            # with the session unknown, every seat map for the site
+            return (host, site_name) == site and session in (None, key_session)
+
+        self.session_seats_cache.invalidate_where(matches)
+
+    def get_session_seats(self, session_number, availability=0):
+        # type: (int, int) -> VIFMessage
+        """See VIFGateway.get_session_seats. The returned message is shared and must not be modified."""
+        def load():
+            return super(CachedVIFGateway, self).get_session_seats(session_number, availability).load()
+        key = (self.host, self.site_name, self._auth_hash(), int(session_number), int(availability))
+        return self.session_seats_cache.get(key, load)
+
+    def session_layout(self, session_number):
+        # type: (int) -> SeatLayout
+        """
+        Returns the seat layout of a session, built from its full seat list.
+        Error replies and replies without seats raise rather than being cached.
+        """
+        def load():
+            response = super(CachedVIFGateway, self).get_session_seats(session_number, 0)
+            layout = SeatLayout.from_message(raise_for_response_code(response))
+            if not layout.size:
+                raise VIFGatewayError('Session {0} has no seats'.format(session_number))
+            return layout
+        return self.seat_layouts.get(self.site_key() + (int(session_number),), load)
+
+    def session_seat_map(self, session_number):
+        # type: (int) -> SeatMap
+        """
+        Returns the available seats of a session as a SeatMap, rebuilt only
+        when the cached availability is refreshed. The map is shared, so use
+        set operations rather than modifying it.
+        """
+        layout = self.session_layout(session_number)
+        message = self.get_session_seats(session_number, availability=1)
+        return self.seat_maps.get(self.site_key() + (int(session_number),), message,
+                                  lambda message: SeatMap.from_message(layout, message))
+
+    def best_seats(self, session_number, count):
+        # type: (int, int) -> List[str]
+        """Returns the names of the best `count` adjacent available seats of a session, or []."""
+        return find_best_seats(self.session_seat_map(session_number), count)
+
+    # Seat maps are invalidated whenever the host answers a booking operation:
+    # a rejected booking usually means the cached seat map was out of date too
+
+    def init_transaction(self, data):
+        # type: (Dict) -> VIFMessage
+        session_number = _request_field(data, 'q30', 'session_number')
+        workstation_id = _request_field(data, 'q30', 'workstation_id')
+        response = super(CachedVIFGateway, self).init_transaction(data)
+        self._invalidate_session_seats(session_number)
+        if session_number is not None:
+            self.transaction_sessions.set((self.host, self.site_name, workstation_id), session_number)
+        return response
+
+    def free_seats(self, data):
+        # type: (Dict) -> VIFMessage
+        session_number = _request_field(data, 'q17', 'session_number')
+        response = super(CachedVIFGateway, self).free_seats(data)
+        self._invalidate_session_seats(session_number)
+        return response
+
+    def commit_transaction(self, data):
+        # type: (Dict) -> VIFMessage
+        workstation_id = _request_field(data, 'q31', 'workstation_id')
+        response = super(CachedVIFGateway, self).commit_transaction(data)
+        self._invalidate_session_seats(self.transaction_sessions.peek((self.host, self.site_name, workstation_id)))
+        return response
@@ -0,0 +1,366 @@
+import errno
+import logging
+import select
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .vif_tokenizer import HEADER_TERM_KEY, tokenize_fields
+
+logger = logging.getLogger(__name__)
+
+
+class VIFConnectionPoolTimeout(Exception):
+    pass
+
+
+class VIFPipelineClosed(Exception):
+    pass
+
+
+class VIFPacketIdInUse(Exception):
+    pass
+
+
+class VIFConnection(object):
+    """A TCP connection to a Venue host that can be reused for several requests."""
+
+    def __init__(self, host, port, timeout=15):
+        # type: (str, int, float) -> None
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.requests = 0
+        self.last_used = time.time()
+        self.closed = False
+
+    def mark_used(self):
+        # type: () -> None
+        """Records that a request/response exchange completed on this connection."""
+        self.requests += 1
+        self.last_used = time.time()
+
+    def peer_closed(self):
+        # type: () -> bool
+        """
+        Checks an idle connection without blocking. An idle connection should
+        never be readable, so a readable socket means the host has closed or
+        reset it (or sent something unsolicited); either way it's unusable.
+        """
+        if self.closed:
+            return True
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (socket.error, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self):
+        # type: () -> None
+        if not self.closed:
+            self.closed = True
+            try:
+                self.sock.close()
+            except socket.error:
+                pass
+
+
+class VIFConnectionPool(object):
+    """
+    Keeps idle connections to a single (host, port) for reuse.
+
+    At most `max_size` connections are handed out at once; further callers
+    wait up to `timeout` seconds for one to be released. Idle connections are
+    health checked before reuse and closed once idle for `idle_timeout`
+    seconds. Hosts that close the connection after each reply are detected
+    and switched to one-shot mode, where every request gets a new connection.
+    """
+    # Pooled connections found closed after a single request before the host
+    # is treated as closing after every reply
+    ONE_SHOT_THRESHOLD = 2
+
+    def __init__(self, host, port, max_size=4, idle_timeout=60.0, timeout=15, one_shot=False):
+        # type: (str, int, int, float, float, bool) -> None
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.one_shot = one_shot
+        self._idle = deque()  # type: deque
+        self._in_use = 0
+        self._closed_after_reply = 0
+        # Size of the last response to each request code, used to size the
+        # next receive buffer for that code
+        self.response_size_hints = {}  # type: Dict[Any, int]
+        self._condition = threading.Condition()
+
+    def _evict_idle(self):
+        # type: () -> None
+        # Oldest idle connections are at the left of the deque
+        now = time.time()
+        while self._idle and now - self._idle[0].last_used > self.idle_timeout:
+            self._idle.popleft().close()
+
+    def _discard_stale(self, conn):
+        # type: (VIFConnection) -> None
+        if conn.requests == 1:
+            self._closed_after_reply += 1
+            if self._closed_after_reply >= self.ONE_SHOT_THRESHOLD and not self.one_shot:
+                logger.info('%s:%s closes connections after each reply, using one-shot mode',
+                            self.host, self.port)
+                self.one_shot = True
+        conn.close()
+
+    def acquire(self):
+        # type: () -> VIFConnection
+        deadline = time.time() + self.timeout
+        with self._condition:
+            while self._in_use >= self.max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise VIFConnectionPoolTimeout(
+                        'No connection to {0}:{1} available'.format(self.host, self.port))
+                self._condition.wait(remaining)
+            self._in_use += 1
+            self._evict_idle()
+            # Reuse the most recently released connection that's still open
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.peer_closed():
+                    return conn
+                self._discard_stale(conn)
+        try:
+            return VIFConnection(self.host, self.port, self.timeout)
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, conn, reusable=True):
+        # type: (VIFConnection, bool) -> None
+        """
+        Returns a connection to the pool. Connections that aren't reusable
+        (e.g. an exchange failed part way through) are closed.
+        """
+        with self._condition:
+            self._in_use -= 1
+            if reusable and not self.one_shot and conn.peer_closed():
+                self._discard_stale(conn)
+            elif reusable and not self.one_shot:
+                self._idle.append(conn)
+            else:
+                conn.close()
+            self._evict_idle()
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self):
+        # type: () -> Iterator[VIFConnection]
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, reusable=False)
+            raise
+        self.release(conn, reusable=conn.requests > 0 and not conn.closed)
+
+    def idle_count(self):
+        # type: () -> int
+        with self._condition:
+            return len(self._idle)
+
+    def close(self):
+        # type: () -> None
+        with self._condition:
+            while self._idle:
+                self._idle.pop().close()
+
+
+class _PendingResponse(object):
+    __slots__ = ('event', 'response', 'error')
+
+    def __init__(self):
+        # type: () -> None
+        self.event = threading.Event()
+        self.response = None  # type: Optional[bytearray]
+        self.error = None  # type: Optional[Exception]
+
+
+def _response_packet_id(response):
+    # type: (bytearray) -> Optional[str]
+    header_end = response.find(HEADER_TERM_KEY.encode('ascii'))
+    if header_end == -1:
+        return None
+    # Packet ids are ascii, so dropping anything else keeps the header a native str
+    return tokenize_fields(str(response[:header_end].decode('ascii', 'ignore'))).get(2)  # 2=packet_id
+
+
+class VIFPipeline(object):
+    """
+    Writes requests to a single connection without waiting for earlier
+    replies. A reader thread splits the incoming stream on the ETX terminator
+    and hands each response to the caller waiting on the packet_id its `vrp`
+    header echoes back. Only usable with hosts that accept several requests
+    per connection and echo packet ids.
+    """
+    RECV_SIZE = 65536
+
+    def __init__(self, host, port, timeout=15):
+        # type: (str, int, float) -> None
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.closed = False
+        self._waiters = {}  # type: Dict[str, _PendingResponse]
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # The reader blocks until a response arrives, timeouts are per request
+        self.sock.settimeout(None)
+        self._reader = threading.Thread(target=self._read_responses)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def in_flight(self):
+        # type: () -> int
+        with self._lock:
+            return len(self._waiters)
+
+    def request(self, request, packet_id):
+        # type: (bytearray, str) -> bytearray
+        """Sends a request and blocks until the response with the same packet_id arrives."""
+        waiter = _PendingResponse()
+        with self._lock:
+            if self.closed:
+                raise VIFPipelineClosed('Pipeline to {0}:{1} is closed'.format(self.host, self.port))
+            if packet_id in self._waiters:
+                raise VIFPacketIdInUse(packet_id)
+            self._waiters[packet_id] = waiter
+        try:
+            with self._send_lock:
+                self.sock.sendall(request)
+        except socket.error as e:
+            self.close(e)
+            raise
+        if not waiter.event.wait(self.timeout):
+            with self._lock:
+                self._waiters.pop(packet_id, None)
+            raise socket.timeout(errno.ETIMEDOUT, 'No response to packet {0} from {1}:{2}'.format(
+                packet_id, self.host, self.port))
+        if waiter.error is not None:
+            raise waiter.error
+        return waiter.response
+
+    def _dispatch(self, response):
+        # type: (bytearray) -> None
+        packet_id = _response_packet_id(response)
+        with self._lock:
+            waiter = self._waiters.pop(packet_id, None)
+        if waiter is None:
+            logger.warning('Discarding response with unexpected packet id %r from %s:%s',
+                           packet_id, self.host, self.port)
+            return
+        waiter.response = response
+        waiter.event.set()
+
+    def _read_responses(self):
+        # type: () -> None
+        buf = bytearray()
+        error = None  # type: Optional[Exception]
+        try:
+            while True:
+                chunk = self.sock.recv(self.RECV_SIZE)  # type: Any
+                if not chunk:
+                    break
+                # Only the newly received bytes need scanning for a terminator
+                scan_start = len(buf)
+                buf += chunk
+                terminator = buf.find(b'\x03', scan_start)
+                while terminator != -1:
+                    response = buf[:terminator + 1]
+                    del buf[:terminator + 1]
+                    self._dispatch(response)
+                    terminator = buf.find(b'\x03')
+        except socket.error as e:
+            error = e
+        self.close(error)
+
+    def close(self, error=None):
+        # type: (Optional[Exception]) -> None
+        """Closes the connection, failing every request still waiting for a response."""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            waiters = list(self._waiters.values())
+            self._waiters.clear()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+        message = 'Connection to {0}:{1} closed'.format(self.host, self.port)
+        if error is not None:
+            message += ': {0}'.format(error)
+        for waiter in waiters:
+            waiter.error = VIFPipelineClosed(message)
+            waiter.event.set()
+
+
+_pools = {}  # type: Dict[Tuple[str, int], VIFConnectionPool]
+_pipelines = {}  # type: Dict[Tuple[str, int], VIFPipeline]
+_pipeline_connect_locks = {}  # type: Dict[Tuple[str, int], threading.Lock]
+_pools_lock = threading.Lock()
+
+
+def get_pool(host, port, **kwargs):
+    # type: (str, int, **Any) -> VIFConnectionPool
+    """
+    Returns the process-wide pool for a host, creating it with the given
+    options on first use. Pools are shared by every VIFGateway (and so every
+    Flask request) talking to the same host.
+    """
+    with _pools_lock:
+        pool = _pools.get((host, port))
+        if pool is None:
+            pool = _pools[(host, port)] = VIFConnectionPool(host, port, **kwargs)
+        return pool
+
+
+def get_pipeline(host, port, **kwargs):
+    # type: (str, int, **Any) -> VIFPipeline
+    """
+    Returns the process-wide pipeline for a host, opening a new one if there
+    is none yet or the previous connection was closed.
+    """
+    key = (host, port)
+    with _pools_lock:
+        pipeline = _pipelines.get(key)
+        if pipeline is not None and not pipeline.closed:
+            return pipeline
+        connect_lock = _pipeline_connect_locks.setdefault(key, threading.Lock())
+    # Connect while holding only this host's lock, so concurrent callers share one connection
+    with connect_lock:
+        with _pools_lock:
+            pipeline = _pipelines.get(key)
+        if pipeline is None or pipeline.closed:
+            pipeline = VIFPipeline(host, port, **kwargs)
+            with _pools_lock:
+                _pipelines[key] = pipeline
+        return pipeline
+
+
+def close_pools():
+    # type: () -> None
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+        for pipeline in _pipelines.values():
+            pipeline.close()
+        _pipelines.clear()
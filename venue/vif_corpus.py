@@ -0,0 +1,263 @@
+"""
+Synthetic VIF messages for benchmarks and load tests. Records are filled in
+from VIF_FIELD_MAP (and the ticket and payment array field maps), with values
+shaped by each field's type and name, and codes that refer to one another
+(e.g. ssn.movie_code and mov.movie_code) kept consistent. The same seed
+always produces the same messages.
+
+    python -m venue.vif_corpus get_data --seed 1 --sessions 1000 > get_data.vif
+    python -m venue.vif_corpus get_data --size 20MB > get_data.vif
+    python -m venue.vif_corpus p30 --tickets 50
+"""
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from .vif_field_map import PAYMENT_ARRAY_FIELD_MAP, TICKET_ARRAY_FIELD_MAP, VIF_FIELD_MAP
+from .vif_tokenizer import ETX
+
+# Array items are numbered from 1 into FIELD_SEED + item * 100 + field (see
+# VIFTicketArray and VIFPaymentArray); beyond these counts the keys would
+# run into other fields of the record
+MAX_PAYMENTS = 9
+MAX_SEATS = 99
+
+WORDS = ('alpha', 'bounty', 'cinema', 'delta', 'echo', 'festival', 'gold', 'harbour', 'island', 'jungle',
+         'kingdom', 'lights', 'moana', 'night', 'ocean', 'paradise', 'quest', 'river', 'star', 'tiger')
+ROW_LABELS = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+
+
+class CorpusGenerator(object):
+    """Generates VIF message text from a seed."""
+
+    def __init__(self, seed=0, site_name='BARKER', start=datetime(2017, 1, 10)):
+        # type: (Any, str, datetime) -> None
+        self.random = random.Random(seed)
+        self.site_name = site_name
+        self.start = start
+
+    # Field values
+
+    def _words(self, count):
+        # type: (int) -> str
+        return ' '.join(self.random.choice(WORDS) for _ in range(count)).title()
+
+    def _date(self, days=90):
+        # type: (int) -> datetime
+        return self.start + timedelta(days=self.random.randint(0, days), minutes=15 * self.random.randint(0, 95))
+
+    def value(self, field_name, field_type):
+        # type: (str, type) -> str
+        """Returns a plausible raw value for a field."""
+        if field_type is bool:
+            return str(self.random.randint(0, 1))
+        if field_type is int:
+            return str(self.random.randint(0, 200))
+        if field_type is float:
+            return '%.2f' % (self.random.randint(0, 4000) / 100.0)
+        if field_name.endswith('datetime') or field_name.endswith('_time'):
+            return self._date().strftime('%Y%m%d%H%M%S')
+        if field_name.endswith('date'):
+            return self._date().strftime('%Y%m%d')
+        if field_name.endswith('code'):
+            return self.random.choice(WORDS)[:4].upper() + str(self.random.randint(0, 99))
+        if field_name == 'url':
+            return 'https://example.com/' + self.random.choice(WORDS)
+        if 'name' in field_name or field_name in ('synopsis', 'comment', 'notes', 'talent'):
+            return self._words(self.random.randint(1, 4))
+        return self._words(1)
+
+    def record(self, record_code, values=None, field_map=None):
+        # type: (str, Dict[int, Any], Dict[int, tuple]) -> str
+        """
+        Returns the text of a record with every field of its field map filled
+        in, taking the values given by field number from `values`.
+        """
+        field_map = VIF_FIELD_MAP[record_code] if field_map is None else field_map
+        fields = dict((number, self.value(name, field_type)) for number, (name, field_type) in field_map.items())
+        fields.update(values or {})
+        return '{%s}' % record_code + ''.join('{%d}%s' % (number, fields[number]) for number in sorted(fields))
+
+    def _array_values(self, field_map, seed, items):
+        # type: (Dict[int, tuple], int, List[Dict[int, Any]]) -> Dict[int, Any]
+        values = {seed + 1: len(items)}  # type: Dict[int, Any]
+        for index, item in enumerate(items, start=1):
+            fields = dict((number, self.value(name, field_type)) for number, (name, field_type) in field_map.items())
+            fields.update(item)
+            for number, value in fields.items():
+                values[seed + index * 100 + number] = value
+        return values
+
+    # Messages
+
+    def header(self, response_code, error_number=0):
+        # type: (int, int) -> str
+        return '{vrp}{1}%s{2}%04X{3}%d{4}%d!' % (
+            self.site_name, self.random.randint(0, 0xFFFF), response_code, error_number)
+
+    def get_data(self, movies=40, venues=8, tickets=12, price_groups=4, sessions=400, size=None):
+        # type: (int, int, int, int, int, Optional[int]) -> str
+        """
+        Returns a get_data response. With `size` set, sessions are added until
+        the message is at least `size` characters long instead, and the other
+        record counts are scaled down for small sizes (to one of each).
+        """
+        if size is not None:
+            movies, venues, tickets, price_groups = [
+                max(1, min(count, size // bytes_per_record))
+                for count, bytes_per_record in ((movies, 25000), (venues, 100000), (tickets, 50000),
+                                                (price_groups, 200000))]
+        lines = [self.header(2),
+                 self.record('hdr', {1: 'E:\\Ven\\bin\\VIFGateway.exe', 2: self.start.strftime('%Y%m%d%H%M%S'), 4: 2}),
+                 self.record('ins', {4: self.site_name})]
+        movie_codes = ['MOV%03d' % i for i in range(movies)]
+        venue_codes = ['CIN%02d' % i for i in range(venues)]
+        ticket_codes = ['TKT%02d' % i for i in range(tickets)]
+        price_group_codes = ['PG%02d' % i for i in range(price_groups)]
+
+        lines.extend(self.record('rat', {1: i, 3: code}) for i, code in enumerate(('G', 'PG', 'M', 'MA15')))
+        lines.extend(self.record('mov', {5: code, 7: self.random.randint(80, 180)}) for code in movie_codes)
+        lines.extend(self.record('ven', {1: i, 3: code}) for i, code in enumerate(venue_codes))
+        lines.extend(self.record('tkt', {3: code}) for code in ticket_codes)
+        for i, price_group_code in enumerate(price_group_codes):
+            lines.append(self.record('prg', {1: i, 4: price_group_code}))
+            lines.extend(self.record('prl', {1: price_group_code, 2: ticket_code, 3: '', 5: 1})
+                         for ticket_code in ticket_codes)
+
+        length = sum(len(line) + 1 for line in lines)
+        session_number = 100000
+        while (session_number - 100000 < sessions) if size is None else (length < size):
+            line = self.record('ssn', {
+                1: session_number,
+                3: 0,
+                4: self.random.choice(venue_codes),
+                5: self.random.choice(movie_codes),
+                6: self.random.choice(price_group_codes),
+                8: self._date(28).strftime('%Y%m%d%H%M%S')})
+            lines.append(line)
+            length += len(line) + 1
+            session_number += 1
+        return lines[0] + '\n'.join(lines[1:]) + ETX
+
+    def seat_names(self, rows=20, seats_per_row=30):
+        # type: (int, int) -> List[str]
+        labels = [ROW_LABELS[i % len(ROW_LABELS)] * (i // len(ROW_LABELS) + 1) for i in range(rows)]
+        return ['%s %d' % (row, number) for row in labels for number in range(1, seats_per_row + 1)]
+
+    def session_seats(self, rows=20, seats_per_row=30, available=1.0):
+        # type: (int, int, float) -> str
+        """Returns a get_session_seats (pl4) response listing a random `available` fraction of the seats."""
+        seat_names = [name for name in self.seat_names(rows, seats_per_row) if self.random.random() < available]
+        fields = ''.join('{%d}%s' % (i, name) for i, name in enumerate(seat_names, start=1))
+        return self.header(20) + '{pl4}' + fields + ETX
+
+    def init_transaction(self, tickets=2, session_number=100000):
+        # type: (int, int) -> str
+        """Returns an init_transaction request (q30) for `tickets` tickets."""
+        seat_names = self.seat_names(tickets // 30 + 1)
+        items = [{4: seat_names[i]} for i in range(tickets)]
+        values = {3: session_number}  # type: Dict[int, Any]
+        values.update(self._array_values(TICKET_ARRAY_FIELD_MAP['q30'], 100000, items))
+        header = '{vrq}{1}%s{2}%04X{3}30{4}Corpus{8}000000000000{9}0!' % (
+            self.site_name, self.random.randint(0, 0xFFFF))
+        return header + self.record('q30', values) + ETX
+
+    def init_transaction_response(self, tickets=2):
+        # type: (int) -> str
+        """
+        Returns an init_transaction response (p30) for `tickets` tickets; the
+        reserved seat list holds the first MAX_SEATS of their seats.
+        """
+        seat_names = self.seat_names(tickets // 30 + 1)
+        items = [{5: seat_names[i], 7: i + 1} for i in range(tickets)]
+        values = dict((1000 + i, name) for i, name in enumerate(seat_names[:min(tickets, MAX_SEATS)], start=1))
+        values.update(self._array_values(TICKET_ARRAY_FIELD_MAP['p30'], 100000, items))
+        return self.header(30) + self.record('p30', values) + ETX
+
+    def commit_transaction(self, payments=1):
+        # type: (int) -> str
+        """Returns a commit_transaction request (q31) with up to MAX_PAYMENTS payments."""
+        if not 0 < payments <= MAX_PAYMENTS:
+            raise ValueError('A commit carries 1 to {} payments'.format(MAX_PAYMENTS))
+        values = self._array_values(PAYMENT_ARRAY_FIELD_MAP['q31'], 1000, [{}] * payments)
+        header = '{vrq}{1}%s{2}%04X{3}31{4}Corpus{8}000000000000{9}0!' % (
+            self.site_name, self.random.randint(0, 0xFFFF))
+        return header + self.record('q31', values) + ETX
+
+    def ticket_data(self, tickets=2):
+        # type: (int) -> List[Dict[str, Any]]
+        """Returns named ticket data for an init_transaction request, one seat per ticket."""
+        seat_names = self.seat_names(tickets // 30 + 1)
+        return [{'ticket_code': 'TKT%02d' % self.random.randint(0, 11),
+                 'ticket_price': self.random.randint(800, 2500) / 100.0,
+                 'ticket_service_fee': 1.5,
+                 'seat_name': seat_names[i]} for i in range(tickets)]
+
+    def payment_data(self, payments=1):
+        # type: (int) -> List[Dict[str, Any]]
+        """Returns named payment data for a commit_transaction request."""
+        return [{'payment_category': 14,
+                 'payment_provider': self.random.choice(('Stripe', 'PayPal')),
+                 'amount_paid': self.random.randint(800, 10000) / 100.0,
+                 'transaction_id': 'ch_%08d' % self.random.randint(0, 10 ** 8)} for _ in range(payments)]
+
+
+def parse_size(size):
+    # type: (str) -> int
+    """Parses a size such as '512', '100KB' or '20MB' into bytes."""
+    size = size.strip().upper()
+    for unit, multiplier in (('KB', 1024), ('MB', 1024 ** 2), ('B', 1)):
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * multiplier)
+    return int(size)
+
+
+def main(argv=None):
+    # type: (List[str]) -> int
+    parser = argparse.ArgumentParser(description='Generate synthetic VIF messages')
+    parser.add_argument('message', choices=('get_data', 'session_seats', 'q30', 'p30', 'q31'))
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: %(default)s)')
+    parser.add_argument('--site-name', default='BARKER')
+    parser.add_argument('--size', help='get_data: minimum message size, e.g. 1MB')
+    parser.add_argument('--movies', type=int, default=40)
+    parser.add_argument('--venues', type=int, default=8)
+    parser.add_argument('--sessions', type=int, default=400)
+    parser.add_argument('--rows', type=int, default=20, help='session_seats: rows of seats')
+    parser.add_argument('--seats-per-row', type=int, default=30)
+    parser.add_argument('--available', type=float, default=1.0, help='session_seats: fraction available')
+    parser.add_argument('--tickets', type=int, default=2, help='q30, p30: number of tickets')
+    parser.add_argument('--payments', type=int, default=1, help='q31: number of payments')
+    args = parser.parse_args(argv)
+
+    size = None
+    if args.size:
+        try:
+            size = parse_size(args.size)
+        except ValueError:
+            parser.error('--size must be a number of bytes, KB or MB, e.g. 1MB')
+    if args.tickets < 1:
+        parser.error('--tickets must be at least 1')
+    if not 0 < args.payments <= MAX_PAYMENTS:
+        parser.error('--payments must be from 1 to {}'.format(MAX_PAYMENTS))
+    if not 0.0 <= args.available <= 1.0:
+        parser.error('--available must be a fraction from 0 to 1')
+
+    generator = CorpusGenerator(args.seed, site_name=args.site_name)
+    if args.message == 'get_data':
+        content = generator.get_data(movies=args.movies, venues=args.venues, sessions=args.sessions, size=size)
+    elif args.message == 'session_seats':
+        content = generator.session_seats(args.rows, args.seats_per_row, args.available)
+    elif args.message == 'q30':
+        content = generator.init_transaction(args.tickets)
+    elif args.message == 'p30':
+        content = generator.init_transaction_response(args.tickets)
+    else:
+        content = generator.commit_transaction(args.payments)
+    sys.stdout.write(content)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
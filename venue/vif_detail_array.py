@@ -1,24 +1,40 @@
 from collections import defaultdict
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Set, Tuple
 
-from .vif_field_map import TICKET_ARRAY_FIELD_MAP, PAYMENT_ARRAY_FIELD_MAP
-from .common import swap_schema_field_key
+from .vif_array_storage import ColumnarStorage, RowStorage
+from .vif_schema import EMPTY_SCHEMA, PAYMENT_ARRAY_SCHEMAS, TICKET_ARRAY_SCHEMAS, RecordSchema
 
 
 class VIFBaseArray(object):
-    FIELD_MAP = None  # type: Dict[str, Dict[int, Tuple]]
+    __slots__ = ('_data', '_keys', '_totals', 'record_code')
+    RECORD_CODES = ()  # type: Tuple[str, ...]
+    SCHEMAS = None  # type: Dict[str, RecordSchema]
     FIELD_SEED = None  # type: int
     FIELD_SEED_MULTIPLIER = None  # type: int
+    TOTAL_FIELDS = ()  # type: Tuple[str, ...]
 
-    def __init__(self, record_code, data=None, named_data=None):
-        # type: (str, Dict, List) -> None
-        self._data = []  # type: List[Dict[int, Any]]
+    def __init__(self, record_code, data=None, named_data=None, columnar=False):
+        # type: (str, Dict, List, bool) -> None
+        """
+        Items are stored as one dictionary per item, or with `columnar` set,
+        as one typed column per field (see ColumnarStorage).
+        """
         self.record_code = record_code
+        storage = ColumnarStorage if columnar else RowStorage
+        self._data = storage(self.schema)  # type: Any
+        self._keys = set()  # type: Set[int]
+        # Running totals of TOTAL_FIELDS, updated as items are added
+        self._totals = dict((field, float(0)) for field in self.TOTAL_FIELDS)  # type: Dict[str, float]
         if data is not None:
             self.load_data_into_array(data)
         elif named_data is not None:
             self.load_named_data_into_array(named_data)
 
+    @property
+    def schema(self):
+        # type: () -> RecordSchema
+        return self.SCHEMAS.get(self.record_code, EMPTY_SCHEMA)
+
     def _extract_array_specific_fields(self, d):
         # type: (Dict) -> Dict
         raise NotImplementedError
@@ -53,20 +69,14 @@ class VIFBaseArray(object):
 
     def _convert_named_keys_to_integer(self, data, record_code):
         # type: (Dict, str) -> Dict
-        field_map = self.FIELD_MAP[record_code]
-        reverse_field_map = swap_schema_field_key(field_map)
-        parsed_data = {}
-        for key, value in data.items():
-            field_number, field_type = reverse_field_map[key]
-            parsed_data[field_number] = field_type(value)
-        return parsed_data
+        return self.SCHEMAS[record_code].convert_named_keys(data)
 
     def load_data_into_array(self, d):
         # type: (Dict) -> None
         array_data = self._extract_array_specific_fields(d)
         structured_array = self._create_structured_array(array_data)
         for _, v in structured_array.items():
-            self._data.append(v)
+            self._append_item(v)
 
     def load_named_data_into_array(self, d):
         # type: (List) -> None
@@ -76,14 +86,32 @@ class VIFBaseArray(object):
     def add_array_item(self, **kwargs):
         # type: (**Any) -> None
         item = self._convert_named_keys_to_integer(data=kwargs, record_code=self.record_code)
+        self._append_item(item)
+
+    def _append_item(self, item):
+        # type: (Dict[int, Any]) -> None
         self._data.append(item)
+        # Keep track of the flattened keys the new item occupies
+        item_key = self.FIELD_SEED + len(self._data) * self.FIELD_SEED_MULTIPLIER
+        self._keys.update(item_key + key for key in item)
+        numbers = self.schema.numbers
+        for field in self.TOTAL_FIELDS:
+            field_number = numbers.get(field)
+            if field_number in item:
+                self._totals[field] += float(item[field_number])
+
+    def keys(self):
+        # type: () -> Set[int]
+        """Returns the flattened integer keys of all items in the array."""
+        return self._keys
 
     def sum_field(self, field):
         # type: (str) -> float
-        total = float(0)
-        for item in self.friendly_data():
-            total += float(item.get(field, 0))
-        return total
+        if field in self._totals:
+            return self._totals[field]
+        # Not a tracked total, sum the field's column directly
+        field_number = self.schema.numbers.get(field)
+        return self._data.column_sum(field_number, self.schema.converter(field_number))
 
     def count(self):
         # type: () -> int
@@ -95,43 +123,32 @@ class VIFBaseArray(object):
         Returns data dictionary with integer keys and values
         in the format specified by the Venue schema
         """
-        array = list(enumerate(self._data, start=1))
         data = {}
-        field_map = self.FIELD_MAP.get(self.record_code, {})
-        for i, item in array:
+        schema = self.schema
+        for i, item in enumerate(self._data, start=1):
             item_key = self.FIELD_SEED + i * self.FIELD_SEED_MULTIPLIER
-            for key, value in item.items():
-                _, field_type = field_map.get(key, (None, lambda x: x))
-                data[item_key + key] = field_type(value)
+            for key, value in schema.typed_data(item).items():
+                data[item_key + key] = value
         return data
 
     def friendly_data(self):
         # type: () -> List[Dict]
-        array_items = []
-        field_map = self.FIELD_MAP.get(self.record_code, {})
-        for array_item in self._data:
-            formatted_data = {}
-            for key, value in array_item.items():
-                # field_name, field_type = field_map.get(key, ('UNKNOWN_%s' % (key), str))
-                field_name, field_type = field_map.get(key, (str(key), str))
-                formatted_data[field_name] = field_type(value)
-            array_items.append(formatted_data)
-        return array_items
+        schema = self.schema
+        return [schema.friendly_data(array_item) for array_item in self._data]
 
 
 class VIFTicketArray(VIFBaseArray):
-
-    def __init__(self, **kwargs):
-        # type: (**Any) -> None
-        self.FIELD_MAP = TICKET_ARRAY_FIELD_MAP
-        self.FIELD_SEED = 100000
-        self.FIELD_SEED_MULTIPLIER = 100
-        super(VIFTicketArray, self).__init__(**kwargs)
+    __slots__ = ()
+    RECORD_CODES = ('q30', 'p30', 'p31', 'p32')
+    SCHEMAS = TICKET_ARRAY_SCHEMAS
+    FIELD_SEED = 100000
+    FIELD_SEED_MULTIPLIER = 100
+    TOTAL_FIELDS = ('ticket_price', 'ticket_service_fee')
 
     def _extract_array_specific_fields(self, d):
         # type: (Dict) -> Dict
         return_dict = {}  # type: Dict
-        if self.record_code in ('q30', 'p30', 'p31', 'p32'):
+        if self.record_code in self.RECORD_CODES:
             return_dict = dict((k, v) for k, v in d.items() if int(k) > 100100)
         return return_dict
 
@@ -153,18 +170,17 @@ class VIFTicketArray(VIFBaseArray):
 
 
 class VIFPaymentArray(VIFBaseArray):
-
-    def __init__(self, **kwargs):
-        # type: (**Any) -> None
-        self.FIELD_MAP = PAYMENT_ARRAY_FIELD_MAP
-        self.FIELD_SEED = 1000
-        self.FIELD_SEED_MULTIPLIER = 100
-        super(VIFPaymentArray, self).__init__(**kwargs)
+    __slots__ = ()
+    RECORD_CODES = ('q31',)
+    SCHEMAS = PAYMENT_ARRAY_SCHEMAS
+    FIELD_SEED = 1000
+    FIELD_SEED_MULTIPLIER = 100
+    TOTAL_FIELDS = ('amount_paid',)
 
     def _extract_array_specific_fields(self, d):
         # type: (Dict) -> Dict
         return_dict = {}  # type: Dict
-        if self.record_code in ('q31',):
+        if self.record_code in self.RECORD_CODES:
             return_dict = dict((k, v) for k, v in d.items() if int(k) > 1100 and int(k) < 2000)
         return return_dict
 
@@ -188,21 +204,19 @@ class VIFPaymentArray(VIFBaseArray):
 
 
 class VIFSeatArray(VIFBaseArray):
-
-    def __init__(self, **kwargs):
-        # type: (**Any) -> None
-        self.FIELD_MAP = PAYMENT_ARRAY_FIELD_MAP
-        self.FIELD_SEED = 1000
-        self.FIELD_SEED_MULTIPLIER = 1
-        super(VIFSeatArray, self).__init__(**kwargs)
+    __slots__ = ()
+    RECORD_CODES = ('p30', 'p31')
+    SCHEMAS = PAYMENT_ARRAY_SCHEMAS
+    FIELD_SEED = 1000
+    FIELD_SEED_MULTIPLIER = 1
 
     def _extract_array_specific_fields(self, d):
         # type: (Dict) -> Dict
         return_dict = {}  # type: Dict
-        if self.record_code in ('p30', 'p31'):
+        if self.record_code in self.RECORD_CODES:
             return_dict = dict((k, v) for k, v in d.items() if int(k) > 1000 and int(k) < 1100)
         return return_dict
 
     def friendly_data(self):
         # type: () -> List
-        return list(s[0] for s in self._data)
+        return self._data.column(0)
@@ -1,9 +1,10 @@
 import logging
 import socket
-from io import BytesIO
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any
 
 from .common import generate_pattern
+from .vif_connection import (VIFConnectionPool, VIFPacketIdInUse, VIFPipeline, VIFPipelineClosed, get_pipeline,
+                             get_pool)
 from .vif_message import VIFMessage
 
 from .vif_record import VIFRecord
@@ -15,18 +16,64 @@ class VIFGatewayError(Exception):
     pass
 
 
+class VIFConnectionClosedError(VIFGatewayError):
+    """Raised when the host closes the connection before the response is terminated."""
+
+    def __init__(self, message, received=0):
+        # type: (str, int) -> None
+        super(VIFConnectionClosedError, self).__init__(message)
+        self.received = received
+
+
+class VIFResponseError(VIFGatewayError):
+    """Raised when the host answers a request with a non-zero response_code."""
+
+    def __init__(self, message, response_code=0, error_number=0):
+        # type: (str, int, int) -> None
+        super(VIFResponseError, self).__init__(message)
+        self.response_code = response_code
+        self.error_number = error_number
+
+
+def raise_for_response_code(response):
+    # type: (VIFMessage) -> VIFMessage
+    """Returns a response unchanged, raising VIFResponseError if its vrp header reports an error."""
+    response_code = response.header.get('response_code')
+    if response_code:
+        error_number = response.header.get('error_number') or 0
+        raise VIFResponseError('Host returned response code {0} (error {1}): {2}'.format(
+            response_code, error_number, response.header.get('response_text') or ''), response_code, error_number)
+    return response
+
+
 class VIFGateway(object):
     DEFAULT_PORT = 4016
+    SOCKET_TIMEOUT = 15
+    # Connections are pooled per (host, port) and shared by all gateways
+    POOL_MAX_SIZE = 4
+    POOL_IDLE_TIMEOUT = 60.0
+    # Bounds for the initial receive buffer, which is sized from the last response to the same request code
+    RECV_BUFFER_MIN = 8192
+    RECV_BUFFER_MAX_HINT = 8 * 1024 * 1024
+    # Read-only requests (handshake, get_data, get_session_seats, verify_booking)
+    # that are safe to resend when a pooled connection turns out to be dead
+    IDEMPOTENT_REQUEST_CODES = frozenset([1, 2, 20, 42])
     VIFGatewayError = VIFGatewayError
 
     def __init__(self, host=None, auth_info=None, site_name=None,
-                 comment=None, gateway_type=0):
-        # type: (str, str, str, str, int) -> None
+                 comment=None, gateway_type=0, pipelined=False):
+        # type: (str, str, str, str, int, bool) -> None
+        """
+        With `pipelined` set, requests share a single connection per host and
+        are sent without waiting for earlier replies; responses are matched
+        to requests by packet_id. Only use it with hosts that support this.
+        """
         self.host = host
         self.auth_info = auth_info
         self.site_name = site_name
         self.gateway_type = gateway_type
         self.comment = comment or 'Ticket Bounty VIF Gateway'
+        self.pipelined = pipelined
 
     def header_data(self):
         # type: () -> Dict
@@ -38,44 +85,156 @@ class VIFGateway(object):
             'gateway_type': self.gateway_type  # 0=Ticketing, 1=Concessions, 2=Voucher
         }
 
-    def _get_sock_response(self, sock, size=8192):
-        # type: (Any, int) -> BytesIO
-        # Write response to stream
-        resp = BytesIO()
+    def connection_pool(self):
+        # type: () -> VIFConnectionPool
+        return get_pool(self.host, self.DEFAULT_PORT, max_size=self.POOL_MAX_SIZE,
+                        idle_timeout=self.POOL_IDLE_TIMEOUT, timeout=self.SOCKET_TIMEOUT)
+
+    def pipeline(self):
+        # type: () -> VIFPipeline
+        return get_pipeline(self.host, self.DEFAULT_PORT, timeout=self.SOCKET_TIMEOUT)
+
+    def _read_sock_response(self, sock, size_hint=0):
+        # type: (Any, int) -> bytearray
+        """
+        Reads a full response into a single buffer using recv_into. The buffer
+        starts at `size_hint` bytes (the size of the last response to the same request code) and
+        doubles whenever it fills up, so large replies need few syscalls. Only
+        newly received bytes are scanned for the ETX terminator.
+        """
+        buf = bytearray(min(max(size_hint, self.RECV_BUFFER_MIN), self.RECV_BUFFER_MAX_HINT))
+        view = memoryview(buf)
+        length = 0
+        while True:
+            if length == len(buf):
+                del view
+                buf.extend(bytearray(len(buf)))
+                view = memoryview(buf)
+            received = sock.recv_into(view[length:])
+            if not received:
+                raise VIFConnectionClosedError('Connection closed before the response was terminated', length)
+            # Response is terminated by an ETX (ascii 3)
+            terminator = buf.find(b'\x03', length, length + received)
+            length += received
+            if terminator != -1:
+                break
+        del view
+        del buf[length:]
+        return buf
+
+    def _iter_sock_response(self, sock, size=8192):
+        # type: (Any, int) -> Iterator[bytes]
+        # Yield response chunks as they arrive
+        received = 0
         while True:
             r = sock.recv(size)
-            resp.write(r)
+            if not r:
+                raise VIFConnectionClosedError('Connection closed before the response was terminated', received)
+            received += len(r)
+            yield r
             # Response is terminated by an ETX (ascii 3)
-            if chr(3) in r.decode():
+            if b'\x03' in r:
                 break
-        resp.seek(0)
-        return resp
+
+    def _encode_request(self, message):
+        # type: (VIFMessage) -> bytearray
+        # Request must be sent as bytes and terminated by an ETX (ascii 3)
+        encoded_message_content = message.encode()
+        logger.debug("REQUEST: %s", encoded_message_content)
+        return encoded_message_content
+
+    def _exchange(self, request, request_code=None):
+        # type: (bytearray, int) -> bytearray
+        """
+        Sends a request on a pooled connection and reads the full response. If
+        a reused connection turns out to have been dropped by the host, the
+        request is retried on a fresh one, but only when it can't have reached
+        the host (the send itself failed) or when `request_code` is idempotent
+        and none of the response had arrived.
+        """
+        pool = self.connection_pool()
+        idempotent = request_code in self.IDEMPOTENT_REQUEST_CODES
+        size_hint = pool.response_size_hints.get(request_code, 0)
+        while True:
+            with pool.connection() as conn:
+                reused = conn.requests > 0
+                sent = False
+                try:
+                    conn.sock.sendall(request)
+                    sent = True
+                    response = self._read_sock_response(conn.sock, size_hint)
+                except socket.timeout:
+                    raise
+                except VIFConnectionClosedError as e:
+                    if not reused or not idempotent or e.received:
+                        raise
+                except socket.error:
+                    if not reused or (sent and not idempotent):
+                        raise
+                else:
+                    conn.mark_used()
+                    pool.response_size_hints[request_code] = len(response)
+                    return response
+                logger.info('Connection to %s:%s was dropped, reconnecting', pool.host, pool.port)
+                conn.close()
+
+    def _pipelined_exchange(self, message):
+        # type: (VIFMessage) -> bytearray
+        while True:
+            try:
+                return self.pipeline().request(self._encode_request(message), message.header.get('packet_id'))
+            except VIFPacketIdInUse:
+                # Another request in flight has the same packet_id, give this one a new id
+                message.set_request_header(request_code=message.header.get('request_code'), **self.header_data())
+            except VIFPipelineClosed as e:
+                raise VIFConnectionClosedError(str(e))
 
     def send_message(self, message):
         # type: (VIFMessage) -> VIFMessage
-        message_content = message.content()
-        logger.debug("REQUEST: %s", message_content)
-        # Request must be sent as bytes and terminated by an ETX (ascii 3)
-        encoded_message_content = (message_content + chr(3)).encode()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(15)
-        sock.connect((self.host, self.DEFAULT_PORT))
-        sock.sendall(encoded_message_content)
-        response_stream = self._get_sock_response(sock, size=64)
-        sock.close()
-        response_text = response_stream.getvalue().decode()
+        if self.pipelined:
+            response = self._pipelined_exchange(message)
+        else:
+            response = self._exchange(self._encode_request(message), message.header.get('request_code'))
+        response_text = response.decode('utf-8')
         logger.debug("RESPONSE: %s", response_text)
-        return VIFMessage(content=str(response_text))
+        return VIFMessage(content=response_text, lazy=True)
 
-    def handshake(self):
-        # type: () -> VIFMessage
+    def iter_records(self, message):
+        # type: (VIFMessage) -> Iterator[VIFRecord]
+        """
+        Sends a message and yields the response records while they are still
+        being received; the header record is yielded first. Only the record
+        currently being received is held in memory. The connection is returned
+        to the pool once the response has been read in full.
+        """
+        request = self._encode_request(message)
+        with self.connection_pool().connection() as conn:
+            conn.sock.sendall(request)
+            for record in VIFMessage.iter_parse(self._iter_sock_response(conn.sock), lazy=True):
+                yield record
+            conn.mark_used()
+
+    def _request_message(self, request_code, body_record_code=None, body_data=None):
+        # type: (int, str, Dict) -> VIFMessage
         message = VIFMessage()
-        message.set_request_header(request_code=1, **self.header_data())
-        response = self.send_message(message)
+        message.set_request_header(request_code=request_code, **self.header_data())
+        if body_record_code is not None:
+            message.add_body_record(VIFRecord(record_code=body_record_code, data=body_data))
+        return message
+
+    @staticmethod
+    def _set_response_record_code(response, record_code):
+        # type: (VIFMessage, str) -> VIFMessage
+        # Single record responses are returned without a record code
         if len(response.body) == 1:
-            response.body[0].record_code = 'p01'
+            response.body[0].record_code = record_code
         return response
 
+    def handshake(self):
+        # type: () -> VIFMessage
+        response = self.send_message(self._request_message(1))
+        return self._set_response_record_code(response, 'p01')
+
     def get_data(self, detail_required=2):
         # type: (int) -> VIFMessage
         """
@@ -89,12 +248,8 @@ class VIFGateway(object):
             Other detail values are reserved for other applications such as
             export of statistical information, etc.
         """
-        message = VIFMessage()
-        message.set_request_header(request_code=2, **self.header_data())
         body_data = {'detail_required': detail_required}
-        body_record = VIFRecord(record_code='q02', data=body_data)
-        message.add_body_record(body_record)
-        return self.send_message(message)
+        return self.send_message(self._request_message(2, 'q02', body_data))
 
     def verify_booking(self, alternate_booking_key):
         # type: (str) -> VIFMessage
@@ -103,15 +258,9 @@ class VIFGateway(object):
         Description: Returns key information about a booking if the booking is
             still current, otherwise an error is returned.
         """
-        message = VIFMessage()
-        message.set_request_header(request_code=42, **self.header_data())
         body_data = {'alternate_booking_key': alternate_booking_key}
-        body_record = VIFRecord(record_code='q42', data=body_data)
-        message.add_body_record(body_record)
-        response = self.send_message(message)
-        if len(response.body) == 1:
-            response.body[0].record_code = 'p42'
-        return response
+        response = self.send_message(self._request_message(42, 'q42', body_data))
+        return self._set_response_record_code(response, 'p42')
 
     def get_session_seats(self, session_number, availability=0):
         # type: (int, int) -> VIFMessage
@@ -127,15 +276,11 @@ class VIFGateway(object):
         Response: pl4 record
 
         """
-        message = VIFMessage()
-        message.set_request_header(request_code=20, **self.header_data())
         body_data = {
             'session_number': session_number,
             'availability': availability
         }
-        body_record = VIFRecord(record_code='q20', data=body_data)
-        message.add_body_record(body_record)
-        return self.send_message(message)
+        return self.send_message(self._request_message(20, 'q20', body_data))
 
     def init_transaction(self, data):
         # type: (Dict) -> VIFMessage
@@ -148,11 +293,7 @@ class VIFGateway(object):
         Body: q30 record
         Response: p30 record
         """
-        message = VIFMessage()
-        message.set_request_header(request_code=30, **self.header_data())
-        body_record = VIFRecord(record_code='q30', data=data)
-        message.add_body_record(body_record)
-        return self.send_message(message)
+        return self.send_message(self._request_message(30, 'q30', data))
 
     def free_seats(self, data):
         # type: (Dict) -> VIFMessage
@@ -165,11 +306,7 @@ class VIFGateway(object):
         Body: q30 record
         Response: p30 record
         """
-        message = VIFMessage()
-        message.set_request_header(request_code=17, **self.header_data())
-        body_record = VIFRecord(record_code='q17', data=data)
-        message.add_body_record(body_record)
-        return self.send_message(message)
+        return self.send_message(self._request_message(17, 'q17', data))
 
     def commit_transaction(self, data):
         # type: (Dict) -> VIFMessage
@@ -183,8 +320,4 @@ class VIFGateway(object):
         Body: q31 record
         Response: p31 record
         """
-        message = VIFMessage()
-        message.set_request_header(request_code=31, **self.header_data())
-        body_record = VIFRecord(record_code='q31', data=data)
-        message.add_body_record(body_record)
-        return self.send_message(message)
+        return self.send_message(self._request_message(31, 'q31', data))
@@ -1,22 +1,30 @@
-import re
-from collections import defaultdict
-from typing import Any, Dict, List, Tuple, Union
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterator, List, Tuple, Union
 
 from .common import generate_pattern
 from .vif_record import VIFRecord
+from .vif_tokenizer import iter_decoded_chunks, iter_record_lines, iter_stream_lines, split_message
 
 VIFIntegerRecord = Dict[int, Any]
 VIFNamedRecord = Dict[str, Any]
 
+# Separators appended by VIFMessage.encode
+HEADER_TERM_BYTES = bytearray(b'!')
+RECORD_SEPARATOR_BYTES = bytearray(b'\n')
+ETX_BYTES = bytearray(b'\x03')
+
 
 class VIFMessage(object):
     term_key = chr(3)
     comment_key = ';'
-    MESSAGE_PATTERN = r'^(?P<header>\{.+?\}.*?)!(?P<body>.*?)(?:$|'+chr(3)+')'  # dotline
-    VIF_RECORD_PATTERN = r'^(?!;)(?P<vif_record>\{.+\}.*)$'  # multiline
 
-    def __init__(self, content=None):
-        # type: (str) -> None
+    def __init__(self, content=None, lazy=False):
+        # type: (str, bool) -> None
+        """
+        When `lazy` is set, body records keep only their raw text and are
+        parsed the first time their data is accessed.
+        """
+        self.lazy = lazy
         if content is not None:
             # Parse text contents into data
             self.header_content, self.body_content = self._extract_content(content)
@@ -31,24 +39,33 @@ class VIFMessage(object):
 
     def _extract_content(self, content):
         # type: (str) -> Tuple
-        pattern = re.compile(self.MESSAGE_PATTERN, re.DOTALL)
-        match = pattern.match(content)
-        if match:
-            header = match.group('header')
-            body = match.group('body')
-            return (header, body)
-        else:
-            raise Exception  # content doesn't conform to pattern
+        return split_message(content)
 
     def _parse_body_content(self, content):
         # type: (str) -> List
-        body = []
-        pattern = re.compile(self.VIF_RECORD_PATTERN, re.MULTILINE)
-        for match in pattern.finditer(content):
-            body_content = match.group(1)
-            record = VIFRecord(raw_content=body_content)
-            body.append(record)
-        return body
+        return [VIFRecord(raw_content=line, lazy=self.lazy) for line in iter_record_lines(content)]
+
+    @classmethod
+    def iter_parse(cls, stream, lazy=False):
+        # type: (Any, bool) -> Iterator[VIFRecord]
+        """
+        Parses a VIF message incrementally from a byte stream (a file-like
+        object or an iterable of byte chunks). The header record is yielded
+        first, followed by each body record as soon as it has been received.
+        """
+        for line in iter_stream_lines(iter_decoded_chunks(stream)):
+            yield VIFRecord(raw_content=line, lazy=lazy)
+
+    def load(self):
+        # type: () -> VIFMessage
+        """
+        Parses any lazily created records. A fully loaded message is only read
+        from, so it can be shared between threads (e.g. when cached).
+        """
+        self.header.load()
+        for record in self.body:
+            record.load()
+        return self
 
     def content(self):
         # type: () -> str
@@ -56,6 +73,21 @@ class VIFMessage(object):
         header_content = self.header.content()
         return header_content + '!' + '\n'.join(body_content)
 
+    def encode(self, encoding='utf-8'):
+        # type: (str) -> bytearray
+        """
+        Serializes the message straight into a single ETX terminated byte
+        buffer, ready to be written to a socket.
+        """
+        buffer = bytearray(self.header.content().encode(encoding))
+        buffer += HEADER_TERM_BYTES
+        for i, record in enumerate(self.body):
+            if i:
+                buffer += RECORD_SEPARATOR_BYTES
+            buffer += record.content().encode(encoding)
+        buffer += ETX_BYTES
+        return buffer
+
     def set_request_header(self, request_code, **kwargs):
         # type: (int, **Any) -> None
         header_data = {
@@ -76,6 +108,18 @@ class VIFMessage(object):
         # type: () -> Dict[str, Any]
         return self.header.friendly_data()
 
+    def record_groups(self):
+        # type: () -> OrderedDict
+        """
+        Groups the message's records by record code in order of first
+        appearance, with the header record last in its group.
+        """
+        groups = OrderedDict()  # type: OrderedDict
+        for record in self.body:
+            groups.setdefault(record.record_code, []).append(record)
+        groups.setdefault(self.header.record_code, []).append(self.header)
+        return groups
+
     def _flatten_list_if_single(self, d):
         # type: (Dict) -> Dict
         for key, value in d.items():
@@ -0,0 +1,136 @@
+import json
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from .vif_message import VIFMessage
+from .vif_record import VIFRecord
+
+# Venue timestamps are YYYYMMDDHHMMSS, so they sort as strings and a shorter
+# prefix (e.g. just the date) can be padded out to a range bound
+TIMESTAMP_LENGTH = 14
+
+
+def _range_start(value):
+    # type: (str) -> str
+    return value.ljust(TIMESTAMP_LENGTH, '0')
+
+
+def _range_end(value):
+    # type: (str) -> str
+    return value.ljust(TIMESTAMP_LENGTH, '9')
+
+
+class VIFRecordIndex(object):
+    """
+    Indexes the records of a get_data response for lookups without scanning:
+
+    * sessions are held in start time order, so a time range is a bisect;
+    * hash indexes map ssn.movie_code, ssn.venue_code and prl.price_group_code
+      to positions, kept in start time order so they can be ranged too.
+    """
+
+    def __init__(self, message):
+        # type: (VIFMessage) -> None
+        sessions = [record for record in message.body if record.record_code == 'ssn']
+        # Sessions without a start time sort first and are skipped by time ranges
+        sessions.sort(key=lambda record: record.get('start_time') or '')
+        self.sessions = sessions  # type: List[VIFRecord]
+        self.start_times = [record.get('start_time') or '' for record in sessions]  # type: List[str]
+        self._timed_sessions_start = bisect_right(self.start_times, '')
+        self.sessions_by_movie = defaultdict(list)  # type: Dict[str, List[int]]
+        self.sessions_by_venue = defaultdict(list)  # type: Dict[str, List[int]]
+        for position, record in enumerate(sessions):
+            self.sessions_by_movie[record.get('movie_code')].append(position)
+            self.sessions_by_venue[record.get('venue_code')].append(position)
+
+        self.prices_by_price_group = defaultdict(list)  # type: Dict[str, List[VIFRecord]]
+        for record in message.body:
+            if record.record_code == 'prl':
+                self.prices_by_price_group[record.get('price_group_code')].append(record)
+
+    def _time_range(self, start=None, end=None):
+        # type: (Optional[str], Optional[str]) -> Tuple[int, int]
+        if start is None and end is None:
+            return 0, len(self.sessions)
+        low = self._timed_sessions_start
+        if start is not None:
+            low = max(low, bisect_left(self.start_times, _range_start(start)))
+        high = len(self.sessions) if end is None else bisect_right(self.start_times, _range_end(end))
+        return low, high
+
+    def session_positions(self, movie_code=None, venue_code=None, start=None, end=None):
+        # type: (str, str, str, str) -> List[int]
+        """
+        Returns the positions in `sessions` matching every given filter, in
+        start time order. `start` and `end` are inclusive and may be given as
+        any prefix of a timestamp, e.g. '20170110' for the whole day.
+        """
+        low, high = self._time_range(start, end)
+        candidates = None  # type: Optional[List[int]]
+        for index, value in ((self.sessions_by_movie, movie_code), (self.sessions_by_venue, venue_code)):
+            if value is None:
+                continue
+            positions = index.get(value, [])
+            positions = positions[bisect_left(positions, low):bisect_left(positions, high)]
+            if candidates is None:
+                candidates = positions
+            else:
+                matches = set(positions)
+                candidates = [position for position in candidates if position in matches]
+        if candidates is None:
+            return list(range(low, high))
+        return candidates
+
+    def find_sessions(self, movie_code=None, venue_code=None, start=None, end=None):
+        # type: (str, str, str, str) -> List[VIFRecord]
+        return [self.sessions[position]
+                for position in self.session_positions(movie_code, venue_code, start, end)]
+
+    def find_prices(self, price_group_code):
+        # type: (str) -> List[VIFRecord]
+        return list(self.prices_by_price_group.get(price_group_code, []))
+
+
+class ShowtimesView(object):
+    """
+    Sessions joined with their movie (mov.movie_code), venue (ven.code) and
+    prices (prl.price_group_code), in start time order. The join goes
+    through dictionaries keyed by code, so it's linear in the number of
+    records; each movie, venue and price list is converted once and shared by
+    all of its sessions. The JSON document is serialized on first use.
+    """
+
+    def __init__(self, message):
+        # type: (VIFMessage) -> None
+        movies = {}  # type: Dict[str, Dict]
+        venues = {}  # type: Dict[str, Dict]
+        prices = defaultdict(list)  # type: Dict[str, List[Dict]]
+        sessions = []  # type: List[Dict]
+        for record in message.body:
+            if record.record_code == 'ssn':
+                sessions.append(record.friendly_data())
+            elif record.record_code == 'mov':
+                movie = record.friendly_data()
+                movies[movie.get('movie_code')] = movie
+            elif record.record_code == 'ven':
+                venue = record.friendly_data()
+                venues[venue.get('code')] = venue
+            elif record.record_code == 'prl':
+                price = record.friendly_data()
+                prices[price.get('price_group_code')].append(price)
+
+        sessions.sort(key=lambda session: session.get('start_time') or '')
+        self.showtimes = [
+            dict(session,
+                 movie=movies.get(session.get('movie_code')),
+                 venue=venues.get(session.get('venue_code')),
+                 prices=prices.get(session.get('price_group_code'), []))
+            for session in sessions]  # type: List[Dict]
+        self._json = None  # type: Optional[str]
+
+    def json(self):
+        # type: () -> str
+        if self._json is None:
+            self._json = json.dumps({'data': self.showtimes})
+        return self._json
@@ -1,35 +1,58 @@
-import re
-from collections import OrderedDict
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Set, Type, Union
 
-from .vif_field_map import VIF_FIELD_MAP
-from .vif_detail_array import VIFTicketArray, VIFPaymentArray, VIFSeatArray
-from .common import swap_schema_field_key, count_integer_keys
+from .vif_detail_array import VIFBaseArray, VIFTicketArray, VIFPaymentArray, VIFSeatArray
+from .vif_schema import EMPTY_SCHEMA, RECORD_SCHEMAS, RecordSchema
+from .common import count_integer_keys
+from .vif_tokenizer import extract_record_code, tokenize_fields, tokenize_record
 
 
 class VIFRecord(object):
+    __slots__ = ('_data', '_loaded', 'raw_content', 'record_code', '_tickets', '_payments', '_reserved_seats')
     TERM_KEY = chr(3)
     COMMENT_KEY = ';'
-    HEADER_PATTERN = r'(?:\{(?P<record_code>.{3})\})(?=\{|$)'
-    KEY_VALUE_PATTERN = r'(?:\{(?P<key>\d+)\}(?P<value>.*?))(?=\{|$|\r)'
-    FIELD_MAP = VIF_FIELD_MAP
+    SCHEMAS = RECORD_SCHEMAS
+    COLUMNAR_ARRAYS = False
 
-    def __init__(self, record_code=None, raw_content=None, data=None):
-        # type: (str, str, Dict) -> None
+    def __init__(self, record_code=None, raw_content=None, data=None, lazy=False):
+        # type: (str, str, Dict, bool) -> None
+        """
+        When `lazy` is set, a record created from raw_content only extracts its
+        record code up front; fields and arrays are parsed on first access.
+        """
         self._data = {}  # type: Dict[int, Any]
+        self._loaded = False
         self.raw_content = raw_content
         self.record_code = record_code
 
         if raw_content:
+            if lazy:
+                self.record_code = extract_record_code(raw_content)
+                return
             # Parse Venue's key/value text into an integer key dictionary
-            data = self._parse_raw_content(raw_content)
-            self.record_code = self._extract_record_code(raw_content)
+            self.record_code, data = tokenize_record(raw_content)
+
+        self._load(data)
+
+    def _ensure_loaded(self):
+        # type: () -> None
+        if not self._loaded:
+            self._load(tokenize_fields(self.raw_content))
+
+    def load(self):
+        # type: () -> None
+        """Parses a lazily created record now rather than on first access."""
+        self._ensure_loaded()
+
+    def _load(self, data):
+        # type: (Dict) -> None
+        self._loaded = True
 
         # Now that record_code has been defined (either as a constructor variable
         # or from parsing raw_content), we can instantiate the array classes
-        self._tickets = VIFTicketArray(record_code=self.record_code)
-        self._payments = VIFPaymentArray(record_code=self.record_code)
-        self._reserved_seats = VIFSeatArray(record_code=self.record_code)
+        # that apply to the record code
+        self._tickets = self._new_array(VIFTicketArray)  # type: Optional[VIFTicketArray]
+        self._payments = self._new_array(VIFPaymentArray)  # type: Optional[VIFPaymentArray]
+        self._reserved_seats = self._new_array(VIFSeatArray)  # type: Optional[VIFSeatArray]
 
         if data:
             integer_key_count = count_integer_keys(data)
@@ -38,57 +61,60 @@ class VIFRecord(object):
             if integer_key_count == 0 and self.record_code is not None:
                 # Pop ticket data so it's excluded from subsequent parsing
                 ticket_data = data.pop('tickets', [])  # type: List
-                self._tickets.load_named_data_into_array(ticket_data)
+                if ticket_data:
+                    self._tickets = self._tickets or self._new_array(VIFTicketArray, force=True)
+                    self._tickets.load_named_data_into_array(ticket_data)
                 # Pop payment data so it's excluded from subsequent parsing
                 payment_data = data.pop('payments', [])  # type: List
-                self._payments.load_named_data_into_array(payment_data)
+                if payment_data:
+                    self._payments = self._payments or self._new_array(VIFPaymentArray, force=True)
+                    self._payments.load_named_data_into_array(payment_data)
                 # Convert leftover data to use integer keys
-                self._data = self._convert_named_keys_to_integer(data, record_code)
+                self._data = self._convert_named_keys_to_integer(data, self.record_code)
 
             # Data uses named keys but no record code provided
-            elif integer_key_count == 0 and record_code is None:
+            elif integer_key_count == 0 and self.record_code is None:
                 # Raise error because we have no way of parsing the named keys
                 raise Exception
 
             # Data may be a mix of integer and named keys (though should be just integer keys)
             else:
                 self._data = data
-                self._tickets.load_data_into_array(self._data)
-                self._payments.load_data_into_array(self._data)
-                self._reserved_seats.load_data_into_array(self._data)
+                for detail_array in self._arrays():
+                    detail_array.load_data_into_array(self._data)
 
         # Overwrite data with processed array data
-        self._data.update(self._tickets.data())
-        self._data.update(self._payments.data())
-        self._data.update(self._reserved_seats.data())
+        for detail_array in self._arrays():
+            self._data.update(detail_array.data())
+
+    def _new_array(self, array_class, force=False):
+        # type: (Type[VIFBaseArray], bool) -> Any
+        # Only records codes that can carry the array get an instance
+        if force or self.record_code in array_class.RECORD_CODES:
+            return array_class(record_code=self.record_code, columnar=self.COLUMNAR_ARRAYS)
+        return None
+
+    def _arrays(self):
+        # type: () -> List[VIFBaseArray]
+        return [a for a in (self._tickets, self._payments, self._reserved_seats) if a is not None]
 
     def _extract_record_code(self, raw_content):
         # type: (str) -> str
-        record_code = ''
-        match = re.search(self.HEADER_PATTERN, raw_content)
-        if match:
-            record_code = match.group('record_code')
-        return record_code
+        return extract_record_code(raw_content)
 
     def _parse_raw_content(self, raw_content):
         # type: (str) -> Dict
-        data = {}
-        key_value_matches = re.compile(self.KEY_VALUE_PATTERN)
-        for match in key_value_matches.finditer(raw_content):
-            payload = match.groupdict()
-            data[int(payload['key'])] = payload['value']
-        return data
+        return tokenize_fields(raw_content)
+
+    @property
+    def schema(self):
+        # type: () -> RecordSchema
+        return self.SCHEMAS.get(self.record_code, EMPTY_SCHEMA)
 
     def _convert_named_keys_to_integer(self, data, record_code):
         # type (Dict[str, Any], str) -> Dict[int, Any]
-        field_map = self.FIELD_MAP[record_code]  # schema _must_ exist for record code
-        # Swap integer key for field name
-        reverse_field_map = swap_schema_field_key(field_map)
-        parsed_data = {}
-        for key, value in data.items():
-            field_number, field_type = reverse_field_map[key]
-            parsed_data[field_number] = field_type(value)
-        return parsed_data
+        schema = self.SCHEMAS[record_code]  # schema _must_ exist for record code
+        return schema.convert_named_keys(data)
 
     def content(self):
         # type: () -> str
@@ -96,46 +122,59 @@ class VIFRecord(object):
         Unwraps dictionary key and values into the following format:
         assert format({'key': 'value'}) == "{key}value"
         """
-        key_value_pairs = []  # type: List
+        self._ensure_loaded()
 
         # Update aggregate fields
         self._update_aggregate_fields()
 
-        # Order values based on key
-        d = OrderedDict(sorted(
-            self._data.items(), key=lambda t: t[0]))
-        for key, value in d.items():
-            key_value_pairs.append("{{{0}}}{1}".format(key, value))
-
         # Prefix content with record code if available
-        formatted_record_code = ''
-        if self.record_code:
-            formatted_record_code = '{{{0}}}'.format(self.record_code)
+        key_value_pairs = ['{{{0}}}'.format(self.record_code)] if self.record_code else []  # type: List[str]
 
-        return formatted_record_code + ''.join(key_value_pairs)
+        # Order values based on key, using the schema's preformatted '{key}' tokens
+        data = self._data
+        field_tokens = self.schema.field_tokens
+        for key in sorted(data):
+            key_value_pairs.append((field_tokens.get(key) or '{%s}' % (key,)) + str(data[key]))
+
+        return ''.join(key_value_pairs)
 
     def _update_aggregate_fields(self):
         # type: () -> None
-        if self._tickets.count() > 0 and self.record_code == 'q30':
-            transaction_fee = self._data.get(12, 0.0)  # 12=transaction_service_fee
+        if self._tickets is not None and self._tickets.count() > 0 and self.record_code == 'q30':
+            transaction_fee = float(self._data.get(12, 0.0))  # 12=transaction_service_fee
             self._data.update({
                 10: self._tickets.total_ticket_prices(),
                 11: self._tickets.total_ticket_fees(),
                 13: self._tickets.total() + transaction_fee,
                 100001: self._tickets.count()
             })
-        if self._payments.count() > 0 and self.record_code == 'q31':
+        if self._payments is not None and self._payments.count() > 0 and self.record_code == 'q31':
             self._data.update({
                 4: self._payments.total_amount_paid(),
                 1001: self._payments.count()
             })
 
+    def get(self, field, default=None):
+        # type: (Union[int, str], Any) -> Any
+        """
+        Returns a single field value converted to its schema type. The field
+        can be referenced by either its field number or its field name.
+        """
+        self._ensure_loaded()
+        self._update_aggregate_fields()
+        schema = self.schema
+        field_number = field if isinstance(field, int) else schema.numbers.get(field)
+        if field_number not in self._data:
+            return default
+        return schema.converter(field_number)(self._data[field_number])
+
     def array_keys(self):
-        # type: () -> List
-        ticket_keys = list(self._tickets.data().keys())
-        payment_keys = list(self._payments.data().keys())
-        seat_keys = list(self._reserved_seats.data().keys())
-        return list(set(ticket_keys + payment_keys + seat_keys))
+        # type: () -> Set[int]
+        self._ensure_loaded()
+        keys = set()  # type: Set[int]
+        for detail_array in self._arrays():
+            keys |= detail_array.keys()
+        return keys
 
     def data(self):
         # type: () -> Dict[int, Any]
@@ -143,45 +182,35 @@ class VIFRecord(object):
         Returns data dictionary with integer keys and values
         in the format specified by the Venue schema
         """
-        data = {}
+        self._ensure_loaded()
 
         # Update aggregate fields
         self._update_aggregate_fields()
 
         # Convert values to their data type according to the schema
-        field_map = self.FIELD_MAP.get(self.record_code, {})
-        for key, value in self._data.items():
-            _, field_type = field_map.get(key, (None, lambda x: x))
-            if key not in self.array_keys():
-                data[key] = field_type(value)
+        data = self.schema.typed_data(self._data, exclude=self.array_keys())
 
-        data.update(self._tickets.data())
-        data.update(self._payments.data())
-        data.update(self._reserved_seats.data())
+        for detail_array in self._arrays():
+            data.update(detail_array.data())
 
         return data
 
     def friendly_data(self):
         # type: () -> Dict[str, Any]
-        formatted_data = {}
+        self._ensure_loaded()
 
         # Update aggregate fields
         self._update_aggregate_fields()
 
         # Convert integer keys to their mapped field name
         # Convert values to their data type according to the schema
-        field_map = self.FIELD_MAP.get(self.record_code, {})
-        for key, value in self._data.items():
-            # field_name, field_type = field_map.get(key, ('UNKNOWN_%s' % (key), str))
-            field_name, field_type = field_map.get(key, (str(key), str))
-            if key not in self.array_keys():
-                formatted_data[field_name] = field_type(value)
-
-        if self._tickets.count() > 0:
+        formatted_data = self.schema.friendly_data(self._data, exclude=self.array_keys())
+
+        if self._tickets is not None and self._tickets.count() > 0:
             formatted_data.update({'tickets': self._tickets.friendly_data()})
-        if self._payments.count() > 0:
+        if self._payments is not None and self._payments.count() > 0:
             formatted_data.update({'payments': self._payments.friendly_data()})
-        if self._reserved_seats.count() > 0:
+        if self._reserved_seats is not None and self._reserved_seats.count() > 0:
             formatted_data.update({'reserved_seats': self._reserved_seats.friendly_data()})
 
         return formatted_data
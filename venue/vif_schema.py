@@ -0,0 +1,96 @@
+from typing import Any, Callable, Dict, Tuple
+
+from .vif_field_map import VIF_FIELD_MAP, TICKET_ARRAY_FIELD_MAP, PAYMENT_ARRAY_FIELD_MAP
+
+
+def _identity(value):
+    # type: (Any) -> Any
+    return value
+
+
+class RecordSchema(object):
+    """
+    Compiled form of a single record code's field map. Field numbers, names and
+    types are held in parallel tuples ordered by field number, with forward
+    (number -> position) and reverse (name -> number) indexes into them.
+    """
+
+    def __init__(self, record_code, field_map):
+        # type: (str, Dict[int, Tuple]) -> None
+        self.record_code = record_code
+        self.field_numbers = tuple(sorted(field_map))  # type: Tuple[int, ...]
+        self.field_names = tuple(field_map[number][0] for number in self.field_numbers)  # type: Tuple[str, ...]
+        self.field_types = tuple(field_map[number][1] for number in self.field_numbers)  # type: Tuple[Callable, ...]
+        self.index = dict((number, i) for i, number in enumerate(self.field_numbers))  # type: Dict[int, int]
+        self.numbers = dict(zip(self.field_names, self.field_numbers))  # type: Dict[str, int]
+        self.converters = dict(zip(self.field_numbers, self.field_types))  # type: Dict[int, Callable]
+        self.field_tokens = dict((number, '{%d}' % number) for number in self.field_numbers)  # type: Dict[int, str]
+
+    def field_number(self, field_name):
+        # type: (str) -> int
+        return self.numbers[field_name]
+
+    def field_name(self, field_number):
+        # type: (int) -> str
+        position = self.index.get(field_number)
+        if position is None:
+            return str(field_number)
+        return self.field_names[position]
+
+    def converter(self, field_number):
+        # type: (int) -> Callable
+        return self.converters.get(field_number, _identity)
+
+    def convert_named_keys(self, data):
+        # type: (Dict[str, Any]) -> Dict[int, Any]
+        """Converts named fields to integer keys, casting values to their schema type."""
+        numbers = self.numbers
+        converters = self.converters
+        parsed_data = {}
+        for key, value in data.items():
+            field_number = numbers[key]
+            parsed_data[field_number] = converters[field_number](value)
+        return parsed_data
+
+    def typed_data(self, data, exclude=()):
+        # type: (Dict[int, Any], Any) -> Dict[int, Any]
+        """Casts values to their schema type; unknown fields are returned unchanged."""
+        converters = self.converters
+        typed = {}
+        for key, value in data.items():
+            if key in exclude:
+                continue
+            converter = converters.get(key)
+            typed[key] = value if converter is None else converter(value)
+        return typed
+
+    def friendly_data(self, data, exclude=()):
+        # type: (Dict[int, Any], Any) -> Dict[str, Any]
+        """Maps integer keys to field names; unknown fields are named after their number."""
+        index = self.index
+        field_names = self.field_names
+        field_types = self.field_types
+        friendly = {}
+        for key, value in data.items():
+            if key in exclude:
+                continue
+            position = index.get(key)
+            if position is None:
+                friendly[str(key)] = str(value)
+            else:
+                friendly[field_names[position]] = field_types[position](value)
+        return friendly
+
+
+EMPTY_SCHEMA = RecordSchema(None, {})
+
+
+def compile_schemas(field_maps):
+    # type: (Dict[str, Dict[int, Tuple]]) -> Dict[str, RecordSchema]
+    return dict((record_code, RecordSchema(record_code, field_map))
+                for record_code, field_map in field_maps.items())
+
+
+RECORD_SCHEMAS = compile_schemas(VIF_FIELD_MAP)
+TICKET_ARRAY_SCHEMAS = compile_schemas(TICKET_ARRAY_FIELD_MAP)
+PAYMENT_ARRAY_SCHEMAS = compile_schemas(PAYMENT_ARRAY_FIELD_MAP)
@@ -0,0 +1,340 @@
+import base64
+import hashlib
+import re
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+
+from .vif_message import VIFMessage
+
+# Number of bits set in each byte value
+POPCOUNT = bytearray(bin(i).count('1') for i in range(256))
+
+SEAT_NAME_PATTERN = re.compile(r'^\s*(?P<row>.*?)\s*(?P<number>\d+)\s*$')
+
+Seat = Union[int, str]
+
+
+def split_seat_name(seat_name):
+    # type: (str) -> Tuple[str, int]
+    """Splits a seat name such as 'N 22' or 'AA12' into its row label and seat number."""
+    match = SEAT_NAME_PATTERN.match(seat_name)
+    if match is None:
+        return seat_name.strip(), 0
+    return match.group('row'), int(match.group('number'))
+
+
+def row_sort_key(row):
+    # type: (str) -> Tuple[int, int, str]
+    """
+    Orders row labels front to back: numeric labels by value, then letters
+    alphabetically with longer labels after shorter ones (A..Z, AA..ZZ).
+    """
+    if row.isdigit():
+        return 0, int(row), ''
+    return 1, len(row), row
+
+
+def seat_names_from_message(message):
+    # type: (VIFMessage) -> List[str]
+    """Returns the seat names of a get_session_seats (pl4) response in seat index order."""
+    seat_names = []  # type: List[str]
+    for record in message.body:
+        data = record.data()
+        seat_names.extend(str(data[key]).strip() for key in sorted(data) if isinstance(key, int))
+    return seat_names
+
+
+class SeatLayout(object):
+    """
+    The seats of an auditorium, each identified by its position in the
+    layout. Holds the seat name table, the row and number of each position
+    (as compact arrays) and, per row, the positions ordered by seat number.
+
+    Rows are ordered front to back by row_sort_key, whatever order the host
+    lists the seats in, so row 'A' (or '1') is taken to be the front row.
+    """
+
+    def __init__(self, seat_names):
+        # type: (Iterable[str]) -> None
+        self.seat_names = tuple(seat_names)  # type: Tuple[str, ...]
+        self.positions = dict((name, position) for position, name in enumerate(self.seat_names))  # type: Dict
+        seats = [split_seat_name(name) for name in self.seat_names]
+        self.rows = sorted(set(row for row, _ in seats), key=row_sort_key)  # type: List[str]
+        row_indexes = dict((row, index) for index, row in enumerate(self.rows))
+        self.seat_rows = array('H')
+        self.seat_numbers = array('H')
+        row_seats = OrderedDict((row, []) for row in self.rows)  # type: OrderedDict
+        for position, (row, number) in enumerate(seats):
+            self.seat_rows.append(row_indexes[row])
+            self.seat_numbers.append(min(number, 0xFFFF))
+            row_seats[row].append(position)
+        for positions in row_seats.values():
+            positions.sort(key=lambda position: self.seat_numbers[position])
+        self.row_seats = row_seats  # type: OrderedDict
+        self.segments = self._find_segments()
+        self.size = len(self.seat_names)
+        self.etag = hashlib.sha1('\n'.join(self.seat_names).encode('utf-8')).hexdigest()
+
+    def _find_segments(self):
+        # type: () -> List[Tuple[int, float, List[int]]]
+        """
+        Splits each row into runs of consecutively numbered seats; a jump in
+        numbering (e.g. an aisle) starts a new run. Returns (row index, row
+        centre seat number, positions) for each run.
+        """
+        segments = []
+        for row_index, positions in enumerate(self.row_seats.values()):
+            numbers = [self.seat_numbers[position] for position in positions]
+            centre = (numbers[0] + numbers[-1]) / 2.0
+            run = [positions[0]]
+            for previous, position in zip(positions, positions[1:]):
+                if self.seat_numbers[position] != self.seat_numbers[previous] + 1:
+                    segments.append((row_index, centre, run))
+                    run = []
+                run.append(position)
+            segments.append((row_index, centre, run))
+        return segments
+
+    @classmethod
+    def from_message(cls, message):
+        # type: (VIFMessage) -> SeatLayout
+        return cls(seat_names_from_message(message))
+
+    def __len__(self):
+        # type: () -> int
+        return self.size
+
+    def position(self, seat):
+        # type: (Seat) -> int
+        """Returns the position of a seat given by position or name, raising KeyError if unknown."""
+        if isinstance(seat, int):
+            if not 0 <= seat < self.size:
+                raise KeyError(seat)
+            return seat
+        return self.positions[seat]
+
+    def row(self, seat):
+        # type: (Seat) -> str
+        return self.rows[self.seat_rows[self.position(seat)]]
+
+
+class SeatMap(object):
+    """
+    A set of seats in a layout (e.g. the available seats of a session) stored
+    as a bitset with one bit per layout position. Membership tests are O(1)
+    and set operations work a byte at a time, without per-seat objects.
+    """
+    __slots__ = ('layout', 'bits')
+
+    def __init__(self, layout, bits=None):
+        # type: (SeatLayout, bytearray) -> None
+        self.layout = layout
+        self.bits = bytearray((layout.size + 7) // 8) if bits is None else bits
+
+    @classmethod
+    def from_seats(cls, layout, seats):
+        # type: (SeatLayout, Iterable[Seat]) -> SeatMap
+        """Builds a seat map of the given seats; seats missing from the layout are ignored."""
+        seat_map = cls(layout)
+        positions = layout.positions
+        for seat in seats:
+            position = seat if isinstance(seat, int) else positions.get(seat)
+            if position is not None and 0 <= position < layout.size:
+                seat_map.bits[position >> 3] |= 1 << (position & 7)
+        return seat_map
+
+    @classmethod
+    def from_message(cls, layout, message):
+        # type: (SeatLayout, VIFMessage) -> SeatMap
+        """Builds a seat map from a get_session_seats (pl4) response, matching seats by name."""
+        return cls.from_seats(layout, seat_names_from_message(message))
+
+    @classmethod
+    def full(cls, layout):
+        # type: (SeatLayout) -> SeatMap
+        return cls.from_seats(layout, range(layout.size))
+
+    def __contains__(self, seat):
+        # type: (Seat) -> bool
+        try:
+            position = self.layout.position(seat)
+        except KeyError:
+            return False
+        return bool(self.bits[position >> 3] & (1 << (position & 7)))
+
+    def add(self, seat):
+        # type: (Seat) -> None
+        position = self.layout.position(seat)
+        self.bits[position >> 3] |= 1 << (position & 7)
+
+    def discard(self, seat):
+        # type: (Seat) -> None
+        position = self.layout.position(seat)
+        self.bits[position >> 3] &= ~(1 << (position & 7)) & 0xFF
+
+    def __len__(self):
+        # type: () -> int
+        return sum(POPCOUNT[byte] for byte in self.bits)
+
+    def __iter__(self):
+        # type: () -> Iterator[int]
+        """Yields the positions of the seats in the map."""
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                base = byte_index << 3
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield base + bit
+
+    def to_base64(self):
+        # type: () -> str
+        """Encodes the bitset as base64, seat position p being bit (p % 8) of byte (p // 8)."""
+        return str(base64.b64encode(bytes(self.bits)).decode('ascii'))
+
+    @classmethod
+    def from_base64(cls, layout, data):
+        # type: (SeatLayout, str) -> SeatMap
+        bits = bytearray(base64.b64decode(data))
+        if len(bits) != (layout.size + 7) // 8:
+            raise ValueError('Bitmap size does not match the layout')
+        return cls(layout, bits)
+
+    def runs(self):
+        # type: () -> List[int]
+        """
+        Run-length encodes the map in position order as alternating run lengths
+        of seats not in the map and seats in the map, starting with seats not
+        in the map (so the first run may be 0).
+        """
+        bits = self.bits
+        runs = []  # type: List[int]
+        current = False
+        length = 0
+        for position in range(self.layout.size):
+            present = bool(bits[position >> 3] & (1 << (position & 7)))
+            if present != current:
+                runs.append(length)
+                current = present
+                length = 0
+            length += 1
+        runs.append(length)
+        return runs
+
+    @classmethod
+    def from_runs(cls, layout, runs):
+        # type: (SeatLayout, Iterable[int]) -> SeatMap
+        seat_map = cls(layout)
+        position = 0
+        for index, length in enumerate(runs):
+            if index % 2:
+                for seat in range(position, min(position + length, layout.size)):
+                    seat_map.bits[seat >> 3] |= 1 << (seat & 7)
+            position += length
+        if position != layout.size:
+            raise ValueError('Run lengths do not match the layout')
+        return seat_map
+
+    def etag(self):
+        # type: () -> str
+        """Identifies the seats in the map and the layout they belong to."""
+        return hashlib.sha1(self.layout.etag.encode('ascii') + bytes(self.bits)).hexdigest()
+
+    def seat_names(self):
+        # type: () -> List[str]
+        seat_names = self.layout.seat_names
+        return [seat_names[position] for position in self]
+
+    def row_counts(self):
+        # type: () -> OrderedDict
+        """Returns the number of seats in the map for each row of the layout."""
+        bits = self.bits
+        counts = OrderedDict()  # type: OrderedDict
+        for row, positions in self.layout.row_seats.items():
+            counts[row] = sum(1 for position in positions if bits[position >> 3] & (1 << (position & 7)))
+        return counts
+
+    def _check_layout(self, other):
+        # type: (SeatMap) -> None
+        if other.layout is not self.layout and other.layout.seat_names != self.layout.seat_names:
+            raise ValueError('Seat maps have different layouts')
+
+    def __and__(self, other):
+        # type: (SeatMap) -> SeatMap
+        self._check_layout(other)
+        return SeatMap(self.layout, bytearray(a & b for a, b in zip(self.bits, other.bits)))
+
+    def __or__(self, other):
+        # type: (SeatMap) -> SeatMap
+        self._check_layout(other)
+        return SeatMap(self.layout, bytearray(a | b for a, b in zip(self.bits, other.bits)))
+
+    def __sub__(self, other):
+        # type: (SeatMap) -> SeatMap
+        """Seats in this map but not the other, e.g. available - held."""
+        self._check_layout(other)
+        return SeatMap(self.layout, bytearray(a & ~b & 0xFF for a, b in zip(self.bits, other.bits)))
+
+    def __invert__(self):
+        # type: () -> SeatMap
+        """All other seats of the layout."""
+        return SeatMap.full(self.layout) - self
+
+    def __eq__(self, other):
+        # type: (Any) -> bool
+        return isinstance(other, SeatMap) and self.bits == other.bits and \
+            self.layout.seat_names == other.layout.seat_names
+
+    def __ne__(self, other):
+        # type: (Any) -> bool
+        return not self == other
+
+    __hash__ = None  # type: ignore
+
+
+def find_best_seats(seat_map, count, ideal_row=0.6, row_weight=2.0, orphan_penalty=0.25):
+    # type: (SeatMap, int, float, float, float) -> List[str]
+    """
+    Finds the best block of `count` adjacent seats in a seat map, or returns
+    an empty list if there is none. Blocks never span a gap in the seat
+    numbering. A block scores by how far its row is from `ideal_row` (a
+    fraction of the way from the front row, 0, to the back row, 1, in
+    SeatLayout row order) and how far its middle is from the centre of the
+    row; blocks that would leave a single seat stranded next to them score
+    slightly worse.
+    """
+    layout = seat_map.layout
+    if count < 1 or count > layout.size:
+        return []
+    bits = seat_map.bits
+    seat_numbers = layout.seat_numbers
+    row_count = max(len(layout.rows) - 1, 1)
+    best_score = None
+    best_block = None  # type: Any
+    for row_index, centre, positions in layout.segments:
+        if len(positions) < count:
+            continue
+        row_score = row_weight * abs(row_index / float(row_count) - ideal_row)
+        if best_score is not None and row_score >= best_score:
+            continue
+        available = [bool(bits[position >> 3] & (1 << (position & 7))) for position in positions]
+        half_width = max((seat_numbers[positions[-1]] - seat_numbers[positions[0]]) / 2.0, 1.0)
+        # Slide a window over the run, tracking how many of its seats are available
+        free = sum(available[:count])
+        for start in range(len(positions) - count + 1):
+            if start:
+                free += available[start + count - 1] - available[start - 1]
+            if free != count:
+                continue
+            middle = (seat_numbers[positions[start]] + seat_numbers[positions[start + count - 1]]) / 2.0
+            score = row_score + abs(middle - centre) / half_width
+            for edge, beyond in ((start - 1, start - 2), (start + count, start + count + 1)):
+                if 0 <= edge < len(positions) and available[edge] and \
+                        not (0 <= beyond < len(positions) and available[beyond]):
+                    score += orphan_penalty
+            if best_score is None or score < best_score:
+                best_score = score
+                best_block = positions[start:start + count]
+    if best_block is None:
+        return []
+    return [layout.seat_names[position] for position in best_block]
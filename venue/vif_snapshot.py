@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .vif_gateway import raise_for_response_code
+from .vif_message import VIFMessage
+from .vif_record import VIFRecord
+from .vif_tokenizer import tokenize_fields
+
+# Fields identifying a record across get_data responses. Records of codes not
+# listed here are identified by their content, so any change to them is
+# reported as a deletion and an insertion.
+NATURAL_KEYS = {
+    'ins': (),
+    'dis': ('code',),
+    'rat': ('code',),
+    'mov': ('movie_code',),
+    'tkt': ('code',),
+    'vch': ('code',),
+    'prg': ('code',),
+    'prl': ('price_group_code', 'ticket_code', 'voucher_code'),
+    'ssn': ('session_number',),
+    'vnc': ('index',),
+    'ven': ('code',),
+}  # type: Dict[str, Tuple[str, ...]]
+
+# The export header changes on every response and isn't programme data
+EXCLUDED_RECORD_CODES = ('hdr',)
+
+RecordKey = Tuple[str, Tuple]
+
+INSERTED = 'inserted'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+
+def _fingerprint(record):
+    # type: (VIFRecord) -> str
+    # Raw text is compared where available so unchanged records aren't parsed
+    return record.raw_content or record.content()
+
+
+def record_key(record):
+    # type: (VIFRecord) -> RecordKey
+    key_fields = NATURAL_KEYS.get(record.record_code)
+    if key_fields is None:
+        return record.record_code, ('#', _fingerprint(record))
+    if not record.raw_content:
+        return record.record_code, tuple(record.get(field) for field in key_fields)
+    # Key fields are read from the raw text, so lazy records are left unparsed
+    schema = record.schema
+    fields = tokenize_fields(record.raw_content)
+    values = []
+    for field in key_fields:
+        field_number = schema.field_number(field)
+        value = fields.get(field_number)
+        values.append(None if value is None else schema.converter(field_number)(value))
+    return record.record_code, tuple(values)
+
+
+def key_data(key):
+    # type: (RecordKey) -> Dict[str, Any]
+    """Returns the natural key of a record as {field_name: value}."""
+    record_code, values = key
+    key_fields = NATURAL_KEYS.get(record_code)
+    if key_fields is None:
+        return {'content': values[1]}
+    data = dict(zip(key_fields, values))
+    if len(values) > len(key_fields):
+        data['occurrence'] = values[-1]
+    return data
+
+
+def index_records(message):
+    # type: (VIFMessage) -> OrderedDict
+    """Maps each body record's key to the record, numbering any duplicate keys."""
+    records = OrderedDict()  # type: OrderedDict
+    for record in message.body:
+        if record.record_code in EXCLUDED_RECORD_CODES:
+            continue
+        key = record_key(record)
+        if key in records:
+            occurrence = 1
+            while (key[0], key[1] + (occurrence,)) in records:
+                occurrence += 1
+            key = (key[0], key[1] + (occurrence,))
+        records[key] = record
+    return records
+
+
+def diff_records(old, new):
+    # type: (Dict[RecordKey, VIFRecord], Dict[RecordKey, VIFRecord]) -> List[Tuple[str, RecordKey]]
+    """Returns the (operation, key) changes turning the `old` records into `new`."""
+    changes = []
+    for key, record in new.items():
+        old_record = old.get(key)
+        if old_record is None:
+            changes.append((INSERTED, key))
+        elif _fingerprint(old_record) != _fingerprint(record):
+            changes.append((UPDATED, key))
+    for key in old:
+        if key not in new:
+            changes.append((DELETED, key))
+    return changes
+
+
+class _SiteSnapshot(object):
+    __slots__ = ('message', 'records', 'version', 'history')
+
+    def __init__(self, message, records, version):
+        # type: (VIFMessage, OrderedDict, int) -> None
+        self.message = message
+        self.records = records
+        self.version = version
+        # (previous version, version, changes) for each update, oldest first
+        self.history = []  # type: List[Tuple[int, int, List[Tuple[str, RecordKey]]]]
+
+
+class SnapshotStore(object):
+    """
+    Keeps the last get_data response of each site and a history of how its
+    records changed between responses, so consumers can ask for only the
+    records inserted, updated or deleted since the version they last saw.
+
+    Versions are millisecond timestamps, so a version handed out before a
+    restart is never mistaken for a later one; a consumer whose version is
+    unknown or too old gets the full snapshot instead.
+    """
+
+    def __init__(self, max_history=50):
+        # type: (int) -> None
+        self.max_history = max_history
+        self._sites = {}  # type: Dict[Hashable, _SiteSnapshot]
+        self._lock = threading.Lock()
+
+    def _next_version(self, previous):
+        # type: (Optional[int]) -> int
+        version = int(time.time() * 1000)
+        if previous is not None and version <= previous:
+            version = previous + 1
+        return version
+
+    def update(self, site, message):
+        # type: (Hashable, VIFMessage) -> int
+        """
+        Stores a new response for a site and returns the site's current version.
+        Error replies raise VIFResponseError and leave the snapshot as it was,
+        rather than reporting every record as deleted.
+        """
+        raise_for_response_code(message)
+        with self._lock:
+            snapshot = self._sites.get(site)
+            if snapshot is not None and snapshot.message is message:
+                return snapshot.version
+        records = index_records(message)
+        with self._lock:
+            snapshot = self._sites.get(site)
+            if snapshot is None:
+                self._sites[site] = _SiteSnapshot(message, records, self._next_version(None))
+                return self._sites[site].version
+            changes = diff_records(snapshot.records, records)
+            snapshot.message = message
+            snapshot.records = records
+            if changes:
+                previous_version = snapshot.version
+                snapshot.version = self._next_version(previous_version)
+                snapshot.history.append((previous_version, snapshot.version, changes))
+                del snapshot.history[:-self.max_history]
+            return snapshot.version
+
+    def changes(self, site, since=None):
+        # type: (Hashable, Optional[int]) -> Dict[str, Any]
+        """
+        Returns the records of a site that changed after version `since` as
+        {'version', 'full', 'inserted', 'updated', 'deleted'}. Inserted and
+        updated records are grouped by record code, deleted records are given
+        by their natural key. With `full` set, every record is listed as
+        inserted and the consumer should replace its copy.
+        """
+        with self._lock:
+            snapshot = self._sites.get(site)
+            if snapshot is None:
+                raise KeyError(site)
+            records, version, history = snapshot.records, snapshot.version, list(snapshot.history)
+
+        # History can answer any version from the one before its oldest change onwards
+        full = since is None or since > version or (since != version and not (history and since >= history[0][0]))
+        result = {'version': version, 'full': full}  # type: Dict[str, Any]
+        inserted = OrderedDict()  # type: OrderedDict
+        updated = OrderedDict()  # type: OrderedDict
+        deleted = OrderedDict()  # type: OrderedDict
+        if full:
+            for (record_code, _), record in records.items():
+                inserted.setdefault(record_code, []).append(record.friendly_data())
+        else:
+            for key, operation in self._net_changes(history, since).items():
+                record_code = key[0]
+                if operation == DELETED:
+                    deleted.setdefault(record_code, []).append(key_data(key))
+                else:
+                    target = inserted if operation == INSERTED else updated
+                    target.setdefault(record_code, []).append(records[key].friendly_data())
+        result.update({INSERTED: inserted, UPDATED: updated, DELETED: deleted})
+        return result
+
+    @staticmethod
+    def _net_changes(history, since):
+        # type: (List[Tuple[int, int, List[Tuple[str, RecordKey]]]], int) -> OrderedDict
+        """Collapses every change after `since` into one operation per record."""
+        existed_before = {}  # type: Dict[RecordKey, bool]
+        exists_now = OrderedDict()  # type: OrderedDict
+        for _, version, changes in history:
+            if version <= since:
+                continue
+            for operation, key in changes:
+                existed_before.setdefault(key, operation != INSERTED)
+                exists_now[key] = operation != DELETED
+        net = OrderedDict()  # type: OrderedDict
+        for key, exists in exists_now.items():
+            if existed_before[key] and exists:
+                net[key] = UPDATED
+            elif exists:
+                net[key] = INSERTED
+            elif existed_before[key]:
+                net[key] = DELETED
+        return net
@@ -0,0 +1,164 @@
+import codecs
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+ETX = chr(3)
+COMMENT_KEY = ';'
+HEADER_TERM_KEY = '!'
+
+VIFTokens = Tuple[str, Dict[int, str]]
+
+
+class VIFTokenizerError(Exception):
+    pass
+
+
+def _find_header_end(content):
+    # type: (str) -> int
+    if content and not content.startswith('{'):
+        raise VIFTokenizerError('VIF message must start with a record code')
+    # The header must contain at least one complete '{...}' token
+    header_token_end = content.find('}', 2)
+    if header_token_end == -1:
+        return -1
+    return content.find(HEADER_TERM_KEY, header_token_end + 1)
+
+
+def _is_record_line(line):
+    # type: (str) -> bool
+    return line.startswith('{') and line.find('}', 2) != -1
+
+
+def split_message(content):
+    # type: (str) -> Tuple[str, str]
+    """
+    Splits a VIF message into its header and body text. The header runs from
+    the opening brace up to the first '!', the body runs from there up to the
+    ETX terminator (or the end of the content if no terminator is present).
+    """
+    header_end = _find_header_end(content)
+    if header_end == -1:
+        raise VIFTokenizerError('VIF message header is not terminated')
+    body_start = header_end + 1
+    body_end = content.find(ETX, body_start)
+    if body_end == -1:
+        body_end = len(content)
+        if content.endswith('\n'):
+            body_end -= 1
+    return content[:header_end], content[body_start:body_end]
+
+
+def iter_record_lines(body):
+    # type: (str) -> Iterator[str]
+    """
+    Yields each VIF record line of a message body, skipping comments (lines
+    starting with ';') and any other line that doesn't look like a record.
+    """
+    body_length = len(body)
+    line_start = 0
+    while line_start <= body_length:
+        line_end = body.find('\n', line_start)
+        if line_end == -1:
+            line_end = body_length
+        if body.startswith('{', line_start) and body.find('}', line_start + 2, line_end) != -1:
+            yield body[line_start:line_end]
+        line_start = line_end + 1
+
+
+def iter_stream_lines(chunks):
+    # type: (Iterable[str]) -> Iterator[str]
+    """
+    Incrementally splits a VIF message arriving as text chunks, yielding the
+    header text followed by each record line as soon as it is complete. Only
+    the current, incomplete line is buffered. Stops at the ETX terminator.
+    """
+    pending = ''
+    header_received = False
+    for chunk in chunks:
+        terminator = chunk.find(ETX)
+        if terminator != -1:
+            chunk = chunk[:terminator]
+        pending += chunk
+        if not header_received:
+            header_end = _find_header_end(pending)
+            if header_end != -1:
+                header_received = True
+                yield pending[:header_end]
+                pending = pending[header_end + 1:]
+        if header_received and '\n' in pending:
+            lines = pending.split('\n')
+            pending = lines.pop()
+            for line in lines:
+                if _is_record_line(line):
+                    yield line
+        if terminator != -1:
+            break
+    if not header_received:
+        raise VIFTokenizerError('VIF message header is not terminated')
+    if _is_record_line(pending):
+        yield pending
+
+
+def iter_decoded_chunks(stream, encoding='utf-8', size=8192):
+    # type: (Any, str, int) -> Iterator[str]
+    """
+    Decodes a byte stream (a file-like object or an iterable of byte chunks)
+    into text chunks, handling multi-byte characters split across chunks.
+    """
+    if hasattr(stream, 'read'):
+        stream = iter(lambda: stream.read(size), b'')
+    decoder = codecs.getincrementaldecoder(encoding)()  # type: Any
+    for chunk in stream:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def extract_record_code(raw_content):
+    # type: (str) -> str
+    """
+    Returns the three character record code a record starts with, e.g. 'ssn'
+    for '{ssn}{1}123...', or an empty string if the record has no code.
+    """
+    if raw_content[4:5] == '}' and raw_content[5:6] in ('{', '') and raw_content.startswith('{'):
+        record_code = raw_content[1:4]
+        if not record_code.isdigit() and '\n' not in record_code:
+            return record_code
+    return ''
+
+
+def tokenize_fields(raw_content):
+    # type: (str) -> Dict[int, str]
+    """
+    Scans '{key}value' pairs into an integer key dictionary. A value runs up to
+    the next '{' or carriage return, whichever comes first. Tokens that aren't
+    integer keys (e.g. the record code) are skipped along with their text.
+    """
+    fields = {}  # type: Dict[int, str]
+    for token in raw_content.split('{')[1:]:
+        key, closed, value = token.partition('}')
+        if closed and key.isdigit():
+            line_end = value.find('\r')
+            if line_end != -1:
+                value = value[:line_end]
+            fields[int(key)] = value
+    return fields
+
+
+def tokenize_record(raw_content):
+    # type: (str) -> VIFTokens
+    return extract_record_code(raw_content), tokenize_fields(raw_content)
+
+
+def tokenize_message(content):
+    # type: (str) -> Iterator[VIFTokens]
+    """
+    Scans a complete VIF message and yields a (record_code, fields) tuple for
+    the header followed by one for each record in the body.
+    """
+    header, body = split_message(content)
+    yield tokenize_record(header)
+    for line in iter_record_lines(body):
+        yield tokenize_record(line)